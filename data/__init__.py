@@ -1,9 +1,11 @@
 from data.pet import (
     PetDocument as PetDocument,
     PetToken as PetToken,
+    PetTokenColumns as PetTokenColumns,
     PetMention as PetMention,
     PetEntity as PetEntity,
     PetRelation as PetRelation,
+    token_texts as token_texts,
 )
 from data.pet import NewPetFormatImporter as PetImporter
 from data.pet import (
@@ -30,3 +32,4 @@ from data.quishpi import (
     QuishpiDocument,
     QuishpiImporter,
 )
+from data.snapshot import SnapshotImporter
@@ -1,5 +1,6 @@
 import abc
 import dataclasses
+import sys
 import typing
 
 
@@ -22,16 +23,74 @@ class BaseImporter(abc.ABC, typing.Generic[TDocument]):
     def do_import(self) -> typing.List[TDocument]:
         raise NotImplementedError()
 
+    def iter_documents(
+        self, ids: typing.Optional[typing.Collection[str]] = None
+    ) -> typing.Iterator[TDocument]:
+        """
+        Yields documents one by one, importers that can read documents
+        without reading all others should override this.
+
+        :param ids: only yield documents with these ids, all if None
+        """
+        for document in self.do_import():
+            if ids is None or document.id in ids:
+                yield document
+
+    def source_paths(self) -> typing.List[str]:
+        """
+        Files or directories the documents are imported from.
+        """
+        raise NotImplementedError()
+
+
+class FrozenSlots:
+    """
+    Base of frozen dataclasses with __slots__, which can not be unpickled or
+    copied by setting their attributes. Only fields are pickled, attributes
+    derived from them are computed again by __init__.
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        fields = dataclasses.fields(self)
+        return type(self), tuple(getattr(self, f.name) for f in fields)
+
 
 @dataclasses.dataclass(frozen=True, eq=True)
-class HasType(abc.ABC):
+class HasType(FrozenSlots, abc.ABC):
+    __slots__ = ("type", "_type_key")
+
     type: str
 
+    def __post_init__(self):
+        # only few distinct types exist, which are compared case-insensitive
+        object.__setattr__(self, "type", sys.intern(self.type))
+        object.__setattr__(self, "_type_key", sys.intern(self.type.lower()))
+
+    @property
+    def type_key(self) -> str:
+        """
+        Lower case type, for case-insensitive comparisons.
+        """
+        return self._type_key
+
 
 class HasCustomMatch:
+    __slots__ = ()
+
     def match(self, other: object) -> bool:
         raise NotImplementedError()
 
+    def match_keys(self) -> typing.Optional[typing.Iterable[typing.Hashable]]:
+        """
+        Keys, such that two elements can only match, if they share at least
+        one key, used to find match candidates without checking all of them.
+
+        :return: keys, or None if every element is a candidate
+        """
+        return None
+
 
 TMention = typing.TypeVar("TMention", bound=HasType)
 
@@ -50,5 +109,7 @@ class HasRelations(abc.ABC, typing.Generic[TRelation]):
 
 
 class SupportsPrettyDump(abc.ABC, typing.Generic[TDocument]):
+    __slots__ = ()
+
     def pretty_dump(self, document: TDocument) -> str:
         raise NotImplementedError()
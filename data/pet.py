@@ -1,6 +1,7 @@
-import collections
+import array
 import dataclasses
 import json
+import sys
 import typing
 
 from datasets import load_dataset
@@ -14,55 +15,76 @@ class PetDocument(
 ):
     category: str
     name: str
-    tokens: typing.List["PetToken"]
+    # a list of tokens, or PetTokenColumns
+    tokens: typing.Sequence["PetToken"]
     entities: typing.List["PetEntity"]
+    _token_index: typing.Optional["PetTokenIndex"] = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @property
-    def sentences(self) -> typing.List[typing.List["PetToken"]]:
-        ret = []
-        last_id = None
-        for token in self.tokens:
-            if token.sentence_index != last_id:
-                last_id = token.sentence_index
-                ret.append([])
-            ret[-1].append(token)
-        return ret
+    def token_index(self) -> "PetTokenIndex":
+        if self._token_index is None or not self._token_index.is_valid(self.tokens):
+            self._token_index = PetTokenIndex.build(self.tokens)
+        return self._token_index
+
+    @property
+    def sentences(self) -> typing.List[typing.Sequence["PetToken"]]:
+        tokens = self.tokens
+        return [tokens[start:end] for start, end in self.token_index.sentence_bounds]
+
+    def sentence(self, sentence_id: int) -> typing.Sequence["PetToken"]:
+        start, end = self.token_index.sentence_bounds[sentence_id]
+        return self.tokens[start:end]
 
     def copy(self, clear: typing.List[str]) -> "PetDocument":
-        return PetDocument(
+        """
+        Copies the annotation layers, which are cleared or may be changed.
+        Tokens never change after import, so copies share them, and the
+        index built for them.
+        """
+        copied = PetDocument(
             name=self.name,
             text=self.text,
             id=self.id,
             category=self.category,
-            tokens=[t.copy() for t in self.tokens],
+            tokens=self.tokens,
             mentions=[] if "mentions" in clear else [m.copy() for m in self.mentions],
             relations=(
                 [] if "relations" in clear else [r.copy() for r in self.relations]
             ),
             entities=[] if "entities" in clear else [e.copy() for e in self.entities],
         )
+        copied._token_index = self.token_index
+        return copied
 
     def __add__(self, other: "PetDocument"):
         assert self.id == other.id
         assert self.tokens == other.tokens
 
-        new_mentions = self.mentions
+        new_mentions = list(self.mentions)
+        # index of the first occurrence of every mention
+        mention_positions: typing.Dict[PetMention, int] = {}
+        for i, mention in enumerate(new_mentions):
+            mention_positions.setdefault(mention, i)
         new_mention_ids = {}
         for i, mention in enumerate(other.mentions):
-            if mention not in new_mentions:
-                new_mention_ids[i] = len(new_mentions)
+            if mention not in mention_positions:
+                mention_positions[mention] = len(new_mentions)
                 new_mentions.append(mention)
-            else:
-                new_mention_ids[i] = new_mentions.index(mention)
+            new_mention_ids[i] = mention_positions[mention]
 
-        new_entities = self.entities
+        new_entities = list(self.entities)
+        known_entities = set(new_entities)
         for entity in other.entities:
             mention_indices = [new_mention_ids[i] for i in entity.mention_indices]
             new_entity = PetEntity(mention_indices=tuple(mention_indices))
-            if new_entity not in new_entities:
+            if new_entity not in known_entities:
+                known_entities.add(new_entity)
                 new_entities.append(new_entity)
 
-        new_relations = self.relations
+        new_relations = list(self.relations)
+        known_relations = set(new_relations)
         for relation in other.relations:
             if relation.head_mention_index not in new_mention_ids:
                 continue
@@ -73,7 +95,8 @@ class PetDocument(
                 head_mention_index=new_mention_ids[relation.head_mention_index],
                 tail_mention_index=new_mention_ids[relation.tail_mention_index],
             )
-            if new_relation not in new_relations:
+            if new_relation not in known_relations:
+                known_relations.add(new_relation)
                 new_relations.append(new_relation)
 
         return PetDocument(
@@ -90,11 +113,23 @@ class PetDocument(
 
 @dataclasses.dataclass(frozen=True)
 class PetMention(base.HasType, base.SupportsPrettyDump[PetDocument]):
+    __slots__ = ("token_document_indices", "_sorted_indices", "_hash")
+
     token_document_indices: typing.Tuple[int, ...]
 
+    def __post_init__(self):
+        super().__post_init__()
+        sorted_indices = _sorted_tuple(self.token_document_indices)
+        object.__setattr__(self, "_sorted_indices", sorted_indices)
+        object.__setattr__(self, "_hash", hash((self._type_key, sorted_indices)))
+
     def copy(self) -> "PetMention":
+        normalized_type = self.type.strip().lower()
+        if normalized_type == self.type and type(self.token_document_indices) == tuple:
+            # mentions are immutable, only ones with other types need a copy
+            return self
         return PetMention(
-            type=self.type.strip().lower(),
+            type=normalized_type,
             token_document_indices=tuple(i for i in self.token_document_indices),
         )
 
@@ -107,31 +142,42 @@ class PetMention(base.HasType, base.SupportsPrettyDump[PetDocument]):
     def __eq__(self, o: object) -> bool:
         if not isinstance(o, PetMention):
             return False
-        if self.type.lower() != o.type.lower():
+        if self._hash != o._hash or self._type_key != o._type_key:
             return False
-        return sorted(self.token_document_indices) == sorted(o.token_document_indices)
+        return self._sorted_indices == o._sorted_indices
 
     def __hash__(self) -> int:
-        element_counts = collections.Counter(self.token_document_indices)
-        cur = hash(frozenset(element_counts.items()))
-        cur += hash(self.type.lower())
-        return cur
+        return self._hash
 
     def match(self, o: object):
         if not isinstance(o, PetMention):
             return False
-        if self.type.lower() != o.type.lower():
+        if self._type_key != o._type_key:
             return False
         if any([i in o.token_document_indices for i in self.token_document_indices]):
             return True
         return False
 
+    def match_keys(self) -> typing.List[typing.Tuple[str, int]]:
+        # mentions are no HasCustomMatch, these keys are only used when
+        # partial matches are asked for, see eval.mentions_f1_stats
+        return [(self._type_key, i) for i in self.token_document_indices]
+
 
 @dataclasses.dataclass(frozen=True)
-class PetEntity(base.SupportsPrettyDump[PetDocument]):
+class PetEntity(base.FrozenSlots, base.SupportsPrettyDump[PetDocument]):
+    __slots__ = ("mention_indices", "_sorted_indices", "_hash")
+
     mention_indices: typing.Tuple[int, ...]
 
+    def __post_init__(self):
+        sorted_indices = _sorted_tuple(self.mention_indices)
+        object.__setattr__(self, "_sorted_indices", sorted_indices)
+        object.__setattr__(self, "_hash", hash(sorted_indices))
+
     def copy(self) -> "PetEntity":
+        if type(self.mention_indices) == tuple:
+            return self
         return PetEntity(mention_indices=tuple(i for i in self.mention_indices))
 
     def get_tag(self, document: "PetDocument") -> str:
@@ -150,21 +196,35 @@ class PetEntity(base.SupportsPrettyDump[PetDocument]):
     def __eq__(self, o: object) -> bool:
         if not isinstance(o, PetEntity):
             return False
-        if len(self.mention_indices) != len(o.mention_indices):
+        if self._hash != o._hash:
             return False
-        return sorted(self.mention_indices) == sorted(o.mention_indices)
+        return self._sorted_indices == o._sorted_indices
 
     def __hash__(self):
-        element_counts = collections.Counter(self.mention_indices)
-        return hash(frozenset(element_counts.items()))
+        return self._hash
 
 
 @dataclasses.dataclass(frozen=True, eq=True)
 class PetRelation(base.HasType, base.SupportsPrettyDump[PetDocument]):
+    __slots__ = ("head_mention_index", "tail_mention_index", "_hash")
+
     head_mention_index: int
     tail_mention_index: int
 
+    def __post_init__(self):
+        super().__post_init__()
+        object.__setattr__(
+            self,
+            "_hash",
+            hash((self.type, self.head_mention_index, self.tail_mention_index)),
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
     def copy(self) -> "PetRelation":
+        if self.type.lower().strip() == self.type:
+            return self
         return PetRelation(
             head_mention_index=self.head_mention_index,
             tail_mention_index=self.tail_mention_index,
@@ -177,29 +237,225 @@ class PetRelation(base.HasType, base.SupportsPrettyDump[PetDocument]):
         return f"{head} -{self.type}-> {tail}"
 
 
+def _sorted_tuple(indices: typing.Tuple[int, ...]) -> typing.Tuple[int, ...]:
+    """
+    Indices in ascending order, reusing the given tuple, if they already are.
+    """
+    sorted_indices = tuple(sorted(indices))
+    if sorted_indices == indices:
+        return indices
+    return sorted_indices
+
+
 @dataclasses.dataclass
-class PetToken:
+class PetTokenIndex:
+    """
+    Offsets of sentences and tokens in a document's list of tokens. It is
+    only valid for the list it was built from, and rebuilt by the document,
+    if its tokens are replaced, or tokens are added or removed.
+    """
+
+    tokens: typing.Sequence["PetToken"]
+    num_tokens: int
+    # start and end (exclusive) token of each sentence
+    sentence_bounds: typing.List[typing.Tuple[int, int]]
+    # position of the sentence of each token in PetDocument.sentences
+    token_sentences: typing.List[int]
+    # character offset of each token in the text of all tokens joined by spaces
+    char_offsets: typing.List[int]
+
+    @staticmethod
+    def build(tokens: typing.Sequence["PetToken"]) -> "PetTokenIndex":
+        texts = token_texts(tokens)
+        if isinstance(tokens, PetTokenColumns):
+            sentence_indices = tokens.sentence_indices
+        else:
+            sentence_indices = [t.sentence_index for t in tokens]
+
+        sentence_bounds = []
+        token_sentences = []
+        char_offsets = []
+        last_id = None
+        char_offset = 0
+        for i, (text, sentence_index) in enumerate(zip(texts, sentence_indices)):
+            if i == 0 or sentence_index != last_id:
+                last_id = sentence_index
+                if len(sentence_bounds) > 0:
+                    sentence_bounds[-1] = (sentence_bounds[-1][0], i)
+                sentence_bounds.append((i, None))
+            token_sentences.append(len(sentence_bounds) - 1)
+            char_offsets.append(char_offset)
+            char_offset += len(text) + 1
+        if len(sentence_bounds) > 0:
+            sentence_bounds[-1] = (sentence_bounds[-1][0], len(tokens))
+        return PetTokenIndex(
+            tokens=tokens,
+            num_tokens=len(tokens),
+            sentence_bounds=sentence_bounds,
+            token_sentences=token_sentences,
+            char_offsets=char_offsets,
+        )
+
+    def is_valid(self, tokens: typing.Sequence["PetToken"]) -> bool:
+        return self.tokens is tokens and self.num_tokens == len(tokens)
+
+
+@dataclasses.dataclass(frozen=True)
+class PetToken(base.FrozenSlots):
+    __slots__ = ("text", "index_in_document", "pos_tag", "sentence_index")
+
     text: str
     index_in_document: int
     pos_tag: str
     sentence_index: int
 
     def char_indices(self, document: PetDocument) -> typing.Tuple[int, int]:
-        start = 0
+        char_offsets = document.token_index.char_offsets
+        i = self.index_in_document
+        if 0 <= i < len(document.tokens) and document.tokens[i] == self:
+            return char_offsets[i], char_offsets[i] + len(self.text)
+        # token is not at its own index, e.g. in a document of a single sentence
         for i, other in enumerate(document.tokens):
             if other == self:
-                return start, start + len(self.text)
-            start += len(other.text) + 1
+                return char_offsets[i], char_offsets[i] + len(self.text)
         raise AssertionError("Token text not found in document")
 
     def copy(self) -> "PetToken":
+        # tokens are immutable
+        return self
+
+
+class PetTokenColumns(typing.Sequence[PetToken]):
+    """
+    Tokens of a document stored as columns, i.e. an array per attribute,
+    instead of an object per token, which takes a fraction of the memory.
+    Tokens are created when accessed, so it can be used in place of a list
+    of tokens. Slices are views of the same columns.
+    """
+
+    def __init__(
+        self,
+        texts: typing.List[str],
+        indices: array.array,
+        pos_codes: array.array,
+        pos_tags: typing.List[str],
+        sentence_indices: array.array,
+        start: int = 0,
+        stop: typing.Optional[int] = None,
+    ):
+        """
+        :param pos_codes: index of each token's pos tag in pos_tags
+        :param start: first token of the view
+        :param stop: end (exclusive) of the view, all tokens if None
+        """
+        self._texts = texts
+        self._indices = indices
+        self._pos_codes = pos_codes
+        self._pos_tags = pos_tags
+        self._sentence_indices = sentence_indices
+        self._start = start
+        self._stop = len(texts) if stop is None else stop
+
+    @staticmethod
+    def from_tokens(tokens: typing.Iterable[PetToken]) -> "PetTokenColumns":
+        texts = []
+        indices = array.array("i")
+        pos_codes = array.array("H")
+        sentence_indices = array.array("i")
+        pos_codes_by_tag: typing.Dict[str, int] = {}
+        for token in tokens:
+            texts.append(sys.intern(token.text))
+            indices.append(token.index_in_document)
+            pos_codes.append(
+                pos_codes_by_tag.setdefault(token.pos_tag, len(pos_codes_by_tag))
+            )
+            sentence_indices.append(token.sentence_index)
+        return PetTokenColumns(
+            texts=texts,
+            indices=indices,
+            pos_codes=pos_codes,
+            pos_tags=list(pos_codes_by_tag.keys()),
+            sentence_indices=sentence_indices,
+        )
+
+    @property
+    def texts(self) -> typing.List[str]:
+        return self._texts[self._start : self._stop]
+
+    @property
+    def sentence_indices(self) -> array.array:
+        return self._sentence_indices[self._start : self._stop]
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(
+        self, i: typing.Union[int, slice]
+    ) -> typing.Union[PetToken, typing.Sequence[PetToken]]:
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return PetTokenColumns(
+                texts=self._texts,
+                indices=self._indices,
+                pos_codes=self._pos_codes,
+                pos_tags=self._pos_tags,
+                sentence_indices=self._sentence_indices,
+                start=self._start + start,
+                stop=self._start + max(start, stop),
+            )
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("token index out of range")
+        return self._token(self._start + i)
+
+    def __iter__(self) -> typing.Iterator[PetToken]:
+        return map(self._token, range(self._start, self._stop))
+
+    def _token(self, i: int) -> PetToken:
         return PetToken(
-            text=self.text,
-            index_in_document=self.index_in_document,
-            pos_tag=self.pos_tag,
-            sentence_index=self.sentence_index,
+            text=self._texts[i],
+            index_in_document=self._indices[i],
+            pos_tag=self._pos_tags[self._pos_codes[i]],
+            sentence_index=self._sentence_indices[i],
         )
 
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, PetTokenColumns) and self._same_view(other):
+            return True
+        if not isinstance(other, typing.Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def _same_view(self, other: "PetTokenColumns") -> bool:
+        return (
+            self._texts is other._texts
+            and self._start == other._start
+            and self._stop == other._stop
+        )
+
+    __hash__ = None
+
+    def __add__(self, other: typing.Iterable[PetToken]) -> typing.List[PetToken]:
+        return list(self) + list(other)
+
+    def __radd__(self, other: typing.Iterable[PetToken]) -> typing.List[PetToken]:
+        return list(other) + list(self)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def token_texts(tokens: typing.Sequence[PetToken]) -> typing.List[str]:
+    """
+    Texts of the given tokens, without creating tokens for PetTokenColumns.
+    """
+    if isinstance(tokens, PetTokenColumns):
+        return tokens.texts
+    return [t.text for t in tokens]
+
 
 class PetJsonExporter:
     def __init__(self, path: str):
@@ -257,6 +513,9 @@ class OldPetFormatImporter(base.BaseImporter[PetDocument]):
     def __init__(self, file_path: str):
         self._path = file_path
 
+    def source_paths(self) -> typing.List[str]:
+        return [self._path]
+
     def do_import(self) -> typing.List[PetDocument]:
         modelhub_dataset = load_dataset(
             "patriziobellan/PET", name="relations-extraction"
@@ -319,8 +578,9 @@ class OldPetFormatImporter(base.BaseImporter[PetDocument]):
         for i, json_token in enumerate(json_tokens):
             tokens.append(
                 PetToken(
-                    text=json_token["text"],
-                    pos_tag=json_token["stanza_pos"],
+                    # texts and pos tags of tokens repeat a lot
+                    text=sys.intern(json_token["text"]),
+                    pos_tag=sys.intern(json_token["stanza_pos"]),
                     index_in_document=i,
                     sentence_index=json_token["sentence_id"],
                 )
@@ -435,8 +695,9 @@ class NewPetFormatImporter(base.BaseImporter[PetDocument]):
             for i, json_token in enumerate(json_tokens):
                 tokens.append(
                     PetToken(
-                        text=json_token["text"],
-                        pos_tag=json_token["posTag"],
+                        # texts and pos tags of tokens repeat a lot
+                        text=sys.intern(json_token["text"]),
+                        pos_tag=sys.intern(json_token["posTag"]),
                         index_in_document=i,
                         sentence_index=json_token["sentenceIndex"],
                     )
@@ -501,19 +762,39 @@ class NewPetFormatImporter(base.BaseImporter[PetDocument]):
                 type=relation_dict["type"].lower().strip(),
             )
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, columnar: bool = False):
+        """
+        :param columnar: if set, tokens of documents are stored as
+        PetTokenColumns, to hold large corpora in memory
+        """
         self._file_path = file_path
+        self._columnar = columnar
+
+    def source_paths(self) -> typing.List[str]:
+        return [self._file_path]
 
     def do_import(self) -> typing.List[PetDocument]:
-        documents: typing.List[PetDocument] = []
+        return list(self.iter_documents())
+
+    def iter_documents(
+        self, ids: typing.Optional[typing.Collection[str]] = None
+    ) -> typing.Iterator[PetDocument]:
+        remaining = None if ids is None else set(ids)
         with open(self._file_path, "r", encoding="utf8") as f:
             for json_line in f:
+                if remaining is not None and len(remaining) == 0:
+                    return
                 json_data = json.loads(json_line)
-                documents.append(self.read_document_from_json(json_data))
-        return documents
+                if remaining is not None:
+                    if json_data["id"] not in remaining:
+                        continue
+                    remaining.remove(json_data["id"])
+                yield self.read_document_from_json(json_data, self._columnar)
 
     @staticmethod
-    def read_document_from_json(json_data: typing.Dict) -> PetDocument:
+    def read_document_from_json(
+        json_data: typing.Dict, columnar: bool = False
+    ) -> PetDocument:
         mentions = NewPetFormatImporter.DictImporter.read_mentions_from_dict(
             json_data["mentions"]
         )
@@ -526,6 +807,8 @@ class NewPetFormatImporter(base.BaseImporter[PetDocument]):
         tokens = NewPetFormatImporter.DictImporter.read_tokens_from_dict(
             json_data["tokens"]
         )
+        if columnar:
+            tokens = PetTokenColumns.from_tokens(tokens)
         document = PetDocument(
             name=json_data["name"],
             text=json_data["text"],
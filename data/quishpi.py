@@ -10,13 +10,23 @@ from data import base
 class QuishpiMention(
     base.SupportsPrettyDump["QuishpiDocument"], base.HasType  # , base.HasCustomMatch
 ):
+    __slots__ = ("text", "_hash")
+
     text: str
 
+    def __post_init__(self):
+        super().__post_init__()
+        object.__setattr__(self, "_hash", hash((self.type, self.text)))
+
+    def __hash__(self) -> int:
+        return self._hash
+
     def pretty_dump(self, document: "QuishpiDocument") -> str:
         return f"{self.text} ({self.type})"
 
     def copy(self):
-        return QuishpiMention(type=self.type, text=self.text)
+        # mentions are immutable
+        return self
 
     def match(self, other: object) -> bool:
         if not isinstance(other, QuishpiMention):
@@ -46,7 +56,8 @@ class QuishpiDocument(base.DocumentBase):
     def __add__(self, other: "QuishpiDocument"):
         assert self.id == other.id
 
-        new_mentions = [m for m in other.mentions if m not in self.mentions]
+        known_mentions = set(self.mentions)
+        new_mentions = [m for m in other.mentions if m not in known_mentions]
         return QuishpiDocument(
             id=self.id, text=self.text, mentions=self.mentions + new_mentions
         )
@@ -64,7 +75,15 @@ class QuishpiImporter(base.BaseImporter[QuishpiDocument]):
         self._dir_path = base_dir_path
         self._excluded_tags = [t.lower() for t in exclude_tags]
 
+    def source_paths(self) -> typing.List[str]:
+        return [self._dir_path]
+
     def do_import(self) -> typing.List[QuishpiDocument]:
+        return list(self.iter_documents())
+
+    def iter_documents(
+        self, ids: typing.Optional[typing.Collection[str]] = None
+    ) -> typing.Iterator[QuishpiDocument]:
         annotation_path = os.path.join(self._dir_path, "judgeannotations")
         texts_path = os.path.join(self._dir_path, "texts")
 
@@ -80,8 +99,11 @@ class QuishpiImporter(base.BaseImporter[QuishpiDocument]):
             [os.path.splitext(a)[0] == os.path.splitext(t)[0] for a, t in file_pairs]
         )
 
-        documents: typing.List[QuishpiDocument] = []
         for annotation_file_name, text_file_name in file_pairs:
+            document_id = os.path.splitext(annotation_file_name)[0]
+            if ids is not None and document_id not in ids:
+                continue
+
             annotation_file_path = os.path.join(annotation_path, annotation_file_name)
             with open(annotation_file_path, "r", encoding="utf8") as annotations_file:
                 raw_annotations = annotations_file.read()
@@ -114,14 +136,11 @@ class QuishpiImporter(base.BaseImporter[QuishpiDocument]):
                 )
                 mentions[mention_id] = new_mention
 
-            documents.append(
-                QuishpiDocument(
-                    text=raw_text,
-                    id=os.path.splitext(annotation_file_name)[0],
-                    mentions=list(mentions.values()),
-                )
+            yield QuishpiDocument(
+                text=raw_text,
+                id=document_id,
+                mentions=list(mentions.values()),
             )
-        return documents
 
     @staticmethod
     def relation_from_line(
@@ -0,0 +1,177 @@
+import collections
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import typing
+
+from data import base
+from data.base import TDocument
+
+# snapshots shared by all importers of a process, only the most recently
+# used ones are kept. Snapshots are pickled per document, so single documents
+# can be copied, without unpickling all others.
+MAX_SNAPSHOTS = 4
+_snapshots: "collections.OrderedDict[str, typing.List[typing.Tuple[str, bytes]]]" = (
+    collections.OrderedDict()
+)
+_shared_documents: "collections.OrderedDict[str, typing.List]" = (
+    collections.OrderedDict()
+)
+
+
+def source_state(paths: typing.List[str]) -> typing.List[typing.Tuple[str, int, int]]:
+    """
+    Path, modification time, and size of every file in the given paths,
+    directories are searched recursively.
+    """
+    state = []
+    for path in paths:
+        file_paths = [path]
+        if os.path.isdir(path):
+            file_paths = sorted(
+                os.path.join(directory, f)
+                for directory, _, files in os.walk(path)
+                for f in files
+            )
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            state.append((os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size))
+    return state
+
+
+def snapshot_key(importer: base.BaseImporter) -> str:
+    """
+    Identifies the documents an importer would import, by its class, its
+    arguments, and the state of its source files. The state of this package
+    is part of the key, as pickled documents depend on its classes.
+    """
+    code_paths = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py")))
+    raw = json.dumps(
+        {
+            "importer": f"{type(importer).__module__}.{type(importer).__qualname__}",
+            "args": vars(importer),
+            "sources": source_state(importer.source_paths()),
+            "code": source_state(code_paths),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf8")).hexdigest()
+
+
+class SnapshotImporter(base.BaseImporter[TDocument]):
+    """
+    Wraps another importer, so that its sources are only parsed once per
+    process, or once at all, if a cache directory is given. Snapshots are
+    invalidated, when the importer's arguments or source files change, and
+    evicted, when more than MAX_SNAPSHOTS are used.
+    """
+
+    def __init__(
+        self,
+        importer: base.BaseImporter[TDocument],
+        directory: typing.Optional[str] = None,
+        shared: bool = False,
+    ):
+        """
+        :param directory: where snapshots are stored as pickle files, only
+        kept in memory if None
+        :param shared: if set, every import returns the same documents, which
+        must not be modified, otherwise every import returns fresh copies
+        """
+        self._importer = importer
+        self._directory = directory
+        self._shared = shared
+
+    def source_paths(self) -> typing.List[str]:
+        return self._importer.source_paths()
+
+    def do_import(self) -> typing.List[TDocument]:
+        key = self._key()
+        if key is None:
+            return self._importer.do_import()
+        if self._shared:
+            return self._shared_snapshot(key)
+        return [pickle.loads(raw) for _, raw in self._snapshot(key)]
+
+    def iter_documents(
+        self, ids: typing.Optional[typing.Collection[str]] = None
+    ) -> typing.Iterator[TDocument]:
+        key = self._key()
+        if key is None:
+            yield from self._importer.iter_documents(ids)
+            return
+        if self._shared:
+            yield from super().iter_documents(ids)
+            return
+        for document_id, raw in self._snapshot(key):
+            if ids is None or document_id in ids:
+                yield pickle.loads(raw)
+
+    def _key(self) -> typing.Optional[str]:
+        try:
+            return snapshot_key(self._importer)
+        except NotImplementedError:
+            # sources of the importer are unknown, so can not be snapshot
+            return None
+
+    def _shared_snapshot(self, key: str) -> typing.List[TDocument]:
+        documents = _recall(_shared_documents, key)
+        if documents is None:
+            documents = [pickle.loads(raw) for _, raw in self._snapshot(key)]
+            _remember(_shared_documents, key, documents)
+        return documents
+
+    def _snapshot(self, key: str) -> typing.List[typing.Tuple[str, bytes]]:
+        snapshot = _recall(_snapshots, key)
+        if snapshot is None:
+            snapshot = [
+                (d.id, pickle.dumps(d, protocol=pickle.HIGHEST_PROTOCOL))
+                for d in self._load_or_build(key)
+            ]
+            _remember(_snapshots, key, snapshot)
+        return snapshot
+
+    def _load_or_build(self, key: str) -> typing.List[TDocument]:
+        path = None
+        if self._directory is not None:
+            path = os.path.join(self._directory, f"{key}.pickle")
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    return pickle.load(f)
+
+        documents = self._importer.do_import()
+        if path is not None:
+            os.makedirs(self._directory, exist_ok=True)
+            # write atomically, so that concurrent processes never read a
+            # partially written snapshot
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(documents, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        return documents
+
+
+def _recall(
+    cache: "collections.OrderedDict[str, typing.Any]", key: str
+) -> typing.Optional[typing.Any]:
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key]
+
+
+def _remember(
+    cache: "collections.OrderedDict[str, typing.Any]", key: str, value: typing.Any
+):
+    cache[key] = value
+    while len(cache) > MAX_SNAPSHOTS:
+        cache.popitem(last=False)
+
+
+def clear():
+    _snapshots.clear()
+    _shared_documents.clear()
@@ -1,5 +1,6 @@
 import csv
 import dataclasses
+import functools
 import os.path
 import typing
 
@@ -26,41 +27,60 @@ CONSTRAINT_3_COL = excel_col_to_index("O")
 
 
 @dataclasses.dataclass(eq=True, frozen=True)
-class VanDerAaMention(base.SupportsPrettyDump["VanDerAaDocument"], base.HasCustomMatch):
+class VanDerAaMention(
+    base.FrozenSlots, base.SupportsPrettyDump["VanDerAaDocument"], base.HasCustomMatch
+):
+    __slots__ = ("text", "_hash")
+
     text: str
 
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash((self.text,)))
+
+    def __hash__(self) -> int:
+        return self._hash
+
     def pretty_dump(self, document: TDocument) -> str:
         return self.text
 
     def copy(self):
-        return VanDerAaMention(text=self.text)
+        # mentions are immutable
+        return self
 
     def match(self, other: object) -> bool:
         if not isinstance(other, VanDerAaMention):
             return False
 
-        pred = other.text.lower()
-        true = self.text.lower()
+        return _texts_match(true=self.text.lower(), pred=other.text.lower())
 
-        true_verb = true.split(" ")[0]
-        if true_verb.lower() in pred:
-            return True
-        pred_tokens = nltk.word_tokenize(pred)
-        pred_pos_tags: typing.Iterable[typing.Tuple[str, str]] = nltk.pos_tag(
-            pred_tokens
-        )
-        pred_verb: typing.Optional[str] = None
-        for token, pos in pred_pos_tags:
-            if pos.startswith("VB"):
-                pred_verb = token
-                break
 
-        if pred_verb is None:
-            pred_verb = pred_tokens[0]
+@functools.lru_cache(maxsize=65536)
+def _texts_match(*, true: str, pred: str) -> bool:
+    true_verb = true.split(" ")[0]
+    if true_verb in pred:
+        return True
+    return _first_verb(pred) in true
+
+
+@functools.lru_cache(maxsize=None)
+def _pos_tagger() -> nltk.tag.PerceptronTagger:
+    # same tagger as nltk.pos_tag uses, which loads it from disk on every call
+    return nltk.tag.PerceptronTagger()
+
 
-        if pred_verb.lower() in true:
-            return True
-        return False
+@functools.lru_cache(maxsize=16384)
+def _first_verb(text: str) -> str:
+    """
+    First token of the text, that is tagged as verb, or its first token, if
+    there is none. Tagging is by far the most expensive part of matching
+    mentions, so this is cached per distinct text.
+    """
+    tokens = nltk.word_tokenize(text)
+    pos_tags: typing.Iterable[typing.Tuple[str, str]] = _pos_tagger().tag(tokens)
+    for token, pos in pos_tags:
+        if pos.startswith("VB"):
+            return token.lower()
+    return tokens[0].lower()
 
 
 @dataclasses.dataclass
@@ -75,8 +95,10 @@ class VanDerAaDocument(base.DocumentBase):
         assert len(self.sentences) == len(other.sentences)
         assert self.sentences == other.sentences
 
-        new_constraints = [c for c in other.constraints if c not in self.constraints]
-        new_mentions = [m for m in other.mentions if m not in self.mentions]
+        known_constraints = set(self.constraints)
+        new_constraints = [c for c in other.constraints if c not in known_constraints]
+        known_mentions = set(self.mentions)
+        new_mentions = [m for m in other.mentions if m not in known_mentions]
 
         return VanDerAaDocument(
             id=self.id,
@@ -108,11 +130,21 @@ class VanDerAaDocument(base.DocumentBase):
 class VanDerAaConstraint(
     base.SupportsPrettyDump["VanDerAaDocument"], base.HasCustomMatch, base.HasType
 ):
+    __slots__ = ("head", "tail", "negative", "sentence_id", "_hash")
+
     head: VanDerAaMention
     tail: typing.Optional[VanDerAaMention]
     negative: bool
     sentence_id: int
 
+    def __post_init__(self):
+        super().__post_init__()
+        fields = (self.type, self.head, self.tail, self.negative, self.sentence_id)
+        object.__setattr__(self, "_hash", hash(fields))
+
+    def __hash__(self) -> int:
+        return self._hash
+
     def pretty_dump(self, document: VanDerAaDocument) -> str:
         pretty = (
             f'{"TRUE" if self.negative else "FALSE"}\t{self.type}\t{self.head.text}'
@@ -122,13 +154,8 @@ class VanDerAaConstraint(
         return f"s: {self.sentence_id}\t{pretty}"
 
     def copy(self):
-        return VanDerAaConstraint(
-            type=self.type,
-            negative=self.negative,
-            head=self.head,
-            tail=self.tail,
-            sentence_id=self.sentence_id,
-        )
+        # constraints are immutable
+        return self
 
     @property
     def num_slots(self):
@@ -141,7 +168,7 @@ class VanDerAaConstraint(
 
     def correct_slots(self, true: "VanDerAaConstraint") -> int:
         res = 0
-        if self.type.lower() == true.type.lower():
+        if self._type_key == true._type_key:
             res += 1
         if true.head.match(self.head):
             res += 1
@@ -150,7 +177,7 @@ class VanDerAaConstraint(
                 res += 1
         if self.negative and true.negative:
             res += 1
-            if self.type.lower() != true.type.lower():
+            if self._type_key != true._type_key:
                 res += 1
         return res
 
@@ -162,14 +189,17 @@ class VanDerAaConstraint(
         if self.tail is None and other.tail is not None:
             return False
         if self.tail is None and other.tail is None:
-            return self.type.lower() == other.type.lower()
+            return self._type_key == other._type_key
         if not self.tail.match(other.tail):
             return False
         if self.negative and not other.negative:
             return False
         if self.sentence_id != other.sentence_id:
             return False
-        return self.type.lower() == other.type.lower()
+        return self._type_key == other._type_key
+
+    def match_keys(self) -> typing.List[str]:
+        return [self._type_key]
 
 
 class VanDerAaImporter(base.BaseImporter[VanDerAaDocument]):
@@ -177,15 +207,27 @@ class VanDerAaImporter(base.BaseImporter[VanDerAaDocument]):
         self._file_path = path_to_collection
         self._sentence_wise = False
 
-    def do_import(self) -> typing.List[VanDerAaDocument]:
-        documents: typing.Dict[str, VanDerAaDocument] = {}
+    def source_paths(self) -> typing.List[str]:
+        return [self._file_path]
 
+    def do_import(self) -> typing.List[VanDerAaDocument]:
+        return list(self.iter_documents())
+
+    def iter_documents(
+        self, ids: typing.Optional[typing.Collection[str]] = None
+    ) -> typing.Iterator[VanDerAaDocument]:
+        """
+        Yields the documents of each file, once it is read completely, as
+        rows of a document are not necessarily consecutive.
+        """
         file_paths = [self._file_path]
         if os.path.isdir(self._file_path):
             file_paths = os.listdir(self._file_path)
             file_paths = [os.path.join(self._file_path, f) for f in file_paths]
 
         for file_path in file_paths:
+            # ids contain the file name, so documents never span files
+            documents: typing.Dict[str, VanDerAaDocument] = {}
             with open(file_path, "r", encoding="windows-1252") as f:
                 reader = csv.reader(f, delimiter=";")
                 # strip header
@@ -203,6 +245,8 @@ class VanDerAaImporter(base.BaseImporter[VanDerAaDocument]):
                     # doc_id = f"{file_name}"
                     if self._sentence_wise:
                         doc_id = f"{doc_id}-{row_id}"
+                    if ids is not None and doc_id not in ids:
+                        continue
 
                     if doc_id not in documents:
                         documents[doc_id] = VanDerAaDocument(
@@ -229,7 +273,7 @@ class VanDerAaImporter(base.BaseImporter[VanDerAaDocument]):
 
                     document.text += f"\n{text}"
 
-        return list(documents.values())
+            yield from documents.values()
 
     @staticmethod
     def parse_constraints(
@@ -0,0 +1,244 @@
+import collections
+import contextlib
+import dataclasses
+import glob
+import io
+import os
+import time
+import tracemalloc
+import typing
+
+import data
+import eval
+from eval import metrics
+from experiments import parse
+
+PredictionPairs = typing.List[
+    typing.Tuple[typing.List[data.PetDocument], typing.List[data.PetDocument]]
+]
+
+
+# elements as they were before they were slotted and interned, and cached
+# their hashes, as baseline for the current ones
+
+
+@dataclasses.dataclass(frozen=True)
+class BaselineMention:
+    type: str
+    token_document_indices: typing.Tuple[int, ...]
+
+    def __eq__(self, o: object) -> bool:
+        if not isinstance(o, BaselineMention):
+            return False
+        if self.type.lower() != o.type.lower():
+            return False
+        return sorted(self.token_document_indices) == sorted(o.token_document_indices)
+
+    def __hash__(self) -> int:
+        element_counts = collections.Counter(self.token_document_indices)
+        cur = hash(frozenset(element_counts.items()))
+        cur += hash(self.type.lower())
+        return cur
+
+
+@dataclasses.dataclass(frozen=True)
+class BaselineEntity:
+    mention_indices: typing.Tuple[int, ...]
+
+    def __eq__(self, o: object) -> bool:
+        if not isinstance(o, BaselineEntity):
+            return False
+        if len(self.mention_indices) != len(o.mention_indices):
+            return False
+        return sorted(self.mention_indices) == sorted(o.mention_indices)
+
+    def __hash__(self):
+        element_counts = collections.Counter(self.mention_indices)
+        return hash(frozenset(element_counts.items()))
+
+
+@dataclasses.dataclass(frozen=True, eq=True)
+class BaselineRelation:
+    type: str
+    head_mention_index: int
+    tail_mention_index: int
+
+
+@dataclasses.dataclass
+class BaselineToken:
+    text: str
+    index_in_document: int
+    pos_tag: str
+    sentence_index: int
+
+
+def _uninterned(text: str) -> str:
+    # a string of its own, as the json parser creates for every occurrence
+    return text.encode("utf8").decode("utf8")
+
+
+def to_baseline(document: data.PetDocument) -> data.PetDocument:
+    return data.PetDocument(
+        id=document.id,
+        text=document.text,
+        name=document.name,
+        category=document.category,
+        tokens=[
+            BaselineToken(
+                text=_uninterned(t.text),
+                index_in_document=t.index_in_document,
+                pos_tag=_uninterned(t.pos_tag),
+                sentence_index=t.sentence_index,
+            )
+            for t in document.tokens
+        ],
+        mentions=[
+            BaselineMention(
+                type=_uninterned(m.type),
+                token_document_indices=m.token_document_indices,
+            )
+            for m in document.mentions
+        ],
+        entities=[BaselineEntity(e.mention_indices) for e in document.entities],
+        relations=[
+            BaselineRelation(
+                type=_uninterned(r.type),
+                head_mention_index=r.head_mention_index,
+                tail_mention_index=r.tail_mention_index,
+            )
+            for r in document.relations
+        ],
+    )
+
+
+def measure(name: str, build: typing.Callable[[], typing.Any]) -> typing.Any:
+    # time and memory are measured in separate runs, as tracing allocations
+    # slows down everything else
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = build()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<20}: {elapsed * 1000:.0f}ms, "
+        f"{retained / 2**20:.1f}MiB retained, {peak / 2**20:.1f}MiB peak"
+    )
+    return result
+
+
+def answer_files() -> typing.List[str]:
+    # answers on the other datasets can not be parsed without their data
+    return sorted(
+        path
+        for path in glob.glob(
+            os.path.join("res/answers", "**", "*.json"), recursive=True
+        )
+        if "quishpi" not in path and "van-der-aa" not in path
+    )
+
+
+def predict_all(
+    paths: typing.List[str], importer: data.BaseImporter[data.PetDocument]
+) -> PredictionPairs:
+    pairs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in paths:
+            for experiment_result in parse.parse_file(path):
+                _, _, preds, truths = parse._predict_documents(
+                    experiment_result, importer
+                )
+                pairs.append((preds, truths))
+    return pairs
+
+
+def evaluate_all(pairs: PredictionPairs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        _evaluate_all(pairs)
+
+
+def _evaluate_all(pairs: PredictionPairs):
+    for preds, truths in pairs:
+        eval.mentions_f1_stats(
+            predicted_documents=preds,
+            ground_truth_documents=truths,
+            print_only_tags=None,
+        )
+        eval.relation_f1_stats(
+            predicted_documents=preds,
+            ground_truth_documents=truths,
+            print_only_tags=None,
+        )
+        eval.entity_f1_stats(
+            predicted_documents=preds,
+            ground_truth_documents=truths,
+            calculate_only_tags=["actor", "activity data"],
+            print_only_tags=None,
+        )
+
+
+def match_all(pairs: PredictionPairs) -> int:
+    # exact matching of elements, as done by evaluation
+    num_ok = 0
+    for preds, truths in pairs:
+        for pred, truth in zip(preds, truths):
+            for attribute in ["mentions", "entities", "relations"]:
+                ok, _, _ = metrics._match_by_index(
+                    getattr(pred, attribute), getattr(truth, attribute)
+                )
+                num_ok += len(ok)
+    return num_ok
+
+
+def hash_all(pairs: PredictionPairs) -> int:
+    # deduplicates all elements, as done when merging documents
+    unique = set()
+    for preds, truths in pairs:
+        for d in preds + truths:
+            unique.update(d.mentions)
+            unique.update(d.entities)
+            unique.update(d.relations)
+    return len(unique)
+
+
+pet_importer = data.PetImporter("res/data/pet/all.new.jsonl")
+pet_documents = measure("import PET", pet_importer.do_import)
+num_tokens = sum(len(d.tokens) for d in pet_documents)
+num_mentions = sum(len(d.mentions) for d in pet_documents)
+print(f"  {len(pet_documents)} documents, {num_tokens} tokens, {num_mentions} mentions")
+# includes converting the imported documents
+baseline_documents = measure(
+    "  baseline", lambda: [to_baseline(d) for d in pet_importer.do_import()]
+)
+assert sum(len(d.mentions) for d in baseline_documents) == num_mentions
+
+columnar_importer = data.PetImporter("res/data/pet/all.new.jsonl", columnar=True)
+measure("import PET columnar", columnar_importer.do_import)
+measure("import PET x 100", lambda: [pet_importer.do_import() for _ in range(100)])
+measure("  columnar", lambda: [columnar_importer.do_import() for _ in range(100)])
+
+paths = answer_files()
+snapshot = data.SnapshotImporter(pet_importer, shared=True)
+snapshot.do_import()
+pairs = measure("parse answers", lambda: predict_all(paths, snapshot))
+num_predictions = sum(len(preds) for preds, _ in pairs)
+print(f"  {len(paths)} answer files, {num_predictions} predicted documents")
+
+baseline_pairs = [
+    ([to_baseline(d) for d in preds], [to_baseline(d) for d in truths])
+    for preds, truths in pairs
+]
+num_unique = measure("hash elements", lambda: hash_all(pairs))
+assert measure("  baseline", lambda: hash_all(baseline_pairs)) == num_unique
+num_ok = measure("match elements", lambda: match_all(pairs))
+assert measure("  baseline", lambda: match_all(baseline_pairs)) == num_ok
+measure("evaluate answers", lambda: evaluate_all(pairs))
+
+columnar_snapshot = data.SnapshotImporter(columnar_importer, shared=True)
+columnar_snapshot.do_import()
+columnar_pairs = measure(
+    "parse columnar", lambda: predict_all(paths, columnar_snapshot)
+)
+measure("evaluate columnar", lambda: evaluate_all(columnar_pairs))
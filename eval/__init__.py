@@ -5,18 +5,30 @@ from eval.metrics import (
     mentions_f1_stats,
     entity_f1_stats,
     constraint_f1_stats,
+    relation_f1_table,
+    mentions_f1_table,
+    entity_f1_table,
+    constraint_f1_table,
     Scores,
     Stats,
 )
+from eval.table import StatsTable
 
 
-def stats_to_scores(stats: typing.Dict[str, Stats]) -> typing.Dict[str, Scores]:
+def stats_to_scores(
+    stats: typing.Union[typing.Dict[str, Stats], StatsTable],
+) -> typing.Dict[str, Scores]:
+    if isinstance(stats, StatsTable):
+        return stats.scores_by_tag()
     return {tag: Scores.from_stats(stats) for tag, stats in stats.items()}
 
 
 def average_scores(
-    stats: typing.Dict[str, Stats], strategy: typing.Literal["micro", "macro"]
+    stats: typing.Union[typing.Dict[str, Stats], StatsTable],
+    strategy: typing.Literal["micro", "macro"],
 ) -> Scores:
+    if isinstance(stats, StatsTable):
+        return stats.average_scores(strategy)
     if strategy == "micro":
         combined_stats = sum(stats.values(), metrics.Stats(0, 0, 0))
         return metrics.Scores.from_stats(combined_stats)
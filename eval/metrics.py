@@ -1,7 +1,9 @@
+import collections
 import dataclasses
 import typing
 
 import data
+from eval import table
 
 
 @dataclasses.dataclass
@@ -71,19 +73,38 @@ def constraint_f1_stats(
     ground_truth_documents: typing.List[data.VanDerAaDocument],
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
+    optimal: bool = False,
 ) -> typing.Dict[str, Stats]:
-    # return _f1_stats(
+    return constraint_f1_table(
+        predicted_documents=predicted_documents,
+        ground_truth_documents=ground_truth_documents,
+        print_only_tags=print_only_tags,
+        verbose=verbose,
+        optimal=optimal,
+    ).stats_by_tag()
+
+
+def constraint_f1_table(
+    *,
+    predicted_documents: typing.List[data.VanDerAaDocument],
+    ground_truth_documents: typing.List[data.VanDerAaDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool = False,
+    optimal: bool = False,
+) -> table.StatsTable:
+    # return _f1_table(
     #     predicted_documents=predicted_documents,
     #     ground_truth_documents=ground_truth_documents,
     #     attribute="constraints",
     #     print_only_tags=print_only_tags,
     #     verbose=verbose,
     # )
-    return slot_filling(
+    return slot_filling_table(
         predicted_documents=predicted_documents,
         ground_truth_documents=ground_truth_documents,
         print_only_tags=print_only_tags,
         verbose=verbose,
+        optimal=optimal,
     )
 
 
@@ -93,9 +114,27 @@ def slot_filling(
     ground_truth_documents: typing.List[data.VanDerAaDocument],
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
+    optimal: bool = False,
 ):
-    ret: typing.Dict[str, Stats] = {}
+    return slot_filling_table(
+        predicted_documents=predicted_documents,
+        ground_truth_documents=ground_truth_documents,
+        print_only_tags=print_only_tags,
+        verbose=verbose,
+        optimal=optimal,
+    ).stats_by_tag()
+
+
+def slot_filling_table(
+    *,
+    predicted_documents: typing.List[data.VanDerAaDocument],
+    ground_truth_documents: typing.List[data.VanDerAaDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool = False,
+    optimal: bool = False,
+) -> table.StatsTable:
     assert len(predicted_documents) == len(ground_truth_documents)
+    counts_by_document = []
     for p, t in zip(predicted_documents, ground_truth_documents):
         if verbose:
             print(f"--- name: {p.name}, id: {p.id} ------------")
@@ -105,15 +144,17 @@ def slot_filling(
             pred=p.constraints,
             print_only_tags=print_only_tags,
             verbose=verbose,
+            optimal=optimal,
         )
         if verbose:
             print()
             print()
-        for tag, stats in case_stats.items():
-            if tag not in ret:
-                ret[tag] = Stats(0, 0, 0)
-            ret[tag] += stats
-    return ret
+        counts_by_document.append(
+            {tag: (s.num_pred, s.num_gold, s.num_ok) for tag, s in case_stats.items()}
+        )
+    return table.StatsTable.from_counts(
+        [t.id for t in ground_truth_documents], counts_by_document
+    )
 
 
 def relation_f1_stats(
@@ -123,7 +164,22 @@ def relation_f1_stats(
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
 ) -> typing.Dict[str, Stats]:
-    return _f1_stats(
+    return relation_f1_table(
+        predicted_documents=predicted_documents,
+        ground_truth_documents=ground_truth_documents,
+        print_only_tags=print_only_tags,
+        verbose=verbose,
+    ).stats_by_tag()
+
+
+def relation_f1_table(
+    *,
+    predicted_documents: typing.List[data.PetDocument],
+    ground_truth_documents: typing.List[data.PetDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool = False,
+) -> table.StatsTable:
+    return _f1_table(
         predicted_documents=predicted_documents,
         ground_truth_documents=ground_truth_documents,
         attribute="relations",
@@ -138,13 +194,37 @@ def mentions_f1_stats(
     ground_truth_documents: typing.List[data.PetDocument],
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
+    partial_match: bool = False,
 ) -> typing.Dict[str, Stats]:
-    return _f1_stats(
+    """
+    :param partial_match: if set, mentions are matched by their match method,
+    e.g. by overlapping tokens for PetMention, instead of by equality. Off by
+    default, as mentions are no HasCustomMatch and are evaluated exactly.
+    """
+    return mentions_f1_table(
+        predicted_documents=predicted_documents,
+        ground_truth_documents=ground_truth_documents,
+        print_only_tags=print_only_tags,
+        verbose=verbose,
+        partial_match=partial_match,
+    ).stats_by_tag()
+
+
+def mentions_f1_table(
+    *,
+    predicted_documents: typing.List[data.PetDocument],
+    ground_truth_documents: typing.List[data.PetDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool = False,
+    partial_match: bool = False,
+) -> table.StatsTable:
+    return _f1_table(
         predicted_documents=predicted_documents,
         ground_truth_documents=ground_truth_documents,
         attribute="mentions",
         print_only_tags=print_only_tags,
         verbose=verbose,
+        partial_match=partial_match,
     )
 
 
@@ -157,6 +237,25 @@ def entity_f1_stats(
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
 ) -> typing.Dict[str, Stats]:
+    return entity_f1_table(
+        predicted_documents=predicted_documents,
+        ground_truth_documents=ground_truth_documents,
+        calculate_only_tags=calculate_only_tags,
+        min_num_mentions=min_num_mentions,
+        print_only_tags=print_only_tags,
+        verbose=verbose,
+    ).stats_by_tag()
+
+
+def entity_f1_table(
+    *,
+    predicted_documents: typing.List[data.PetDocument],
+    ground_truth_documents: typing.List[data.PetDocument],
+    calculate_only_tags: typing.List[str],
+    min_num_mentions: int = 1,
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool = False,
+) -> table.StatsTable:
     calculate_only_tags = [t.lower() for t in calculate_only_tags]
     for d in predicted_documents:
         d.entities = [
@@ -175,7 +274,7 @@ def entity_f1_stats(
             and e.get_tag(d) in calculate_only_tags
         ]
 
-    return _f1_stats(
+    return _f1_table(
         predicted_documents=predicted_documents,
         ground_truth_documents=ground_truth_documents,
         attribute="entities",
@@ -184,25 +283,21 @@ def entity_f1_stats(
     )
 
 
-def _add_to_stats_by_tag(
-    stats_by_tag: typing.Dict[str, typing.Tuple[float, float, float]],
+def _count_by_tag(
+    counts_by_tag: typing.Dict[str, typing.List[int]],
     get_tag: typing.Callable[[typing.Any], str],
     object_list: typing.Iterable,
-    stat: str,
+    column: int,
 ):
-    assert stat in ["gold", "pred", "ok"]
+    """
+    :param column: which count to increase, one of table.PRED, GOLD, or OK
+    """
     for e in object_list:
         tag = get_tag(e)
-        if tag not in stats_by_tag:
-            stats_by_tag[tag] = (0, 0, 0)
-        prev_stats = stats_by_tag[tag]
-        if stat == "gold":
-            stats_by_tag[tag] = (prev_stats[0] + 1, prev_stats[1], prev_stats[2])
-        elif stat == "pred":
-            stats_by_tag[tag] = (prev_stats[0], prev_stats[1] + 1, prev_stats[2])
-        else:
-            stats_by_tag[tag] = (prev_stats[0], prev_stats[1], prev_stats[2] + 1)
-    return stats_by_tag
+        if tag not in counts_by_tag:
+            counts_by_tag[tag] = [0, 0, 0]
+        counts_by_tag[tag][column] += 1
+    return counts_by_tag
 
 
 def constraint_slot_filling_stats(
@@ -212,31 +307,21 @@ def constraint_slot_filling_stats(
     pred: typing.List[data.VanDerAaConstraint],
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool,
+    optimal: bool = False,
 ) -> typing.Dict[str, Stats]:
-    best_matches: typing.Dict[data.VanDerAaConstraint, data.VanDerAaConstraint] = {}
+    """
+    :param optimal: if set, predictions are assigned to true constraints such
+    that the total number of correct slots is maximal, instead of greedily
+    """
+    best_matches = _assign_constraints_by_sentence(pred, true, optimal)
+    matched_true = set(t for t, _ in best_matches.values())
 
-    for score in range(4, -1, -1):
-        for p in pred:
-            for t in true:
-                if p.sentence_id != t.sentence_id:
-                    continue
-
-                num_correct_slots = p.correct_slots(t)
-                if num_correct_slots != score:
-                    continue
-                if p in best_matches.keys():
-                    continue
-                if t in best_matches.values():
-                    continue
-                best_matches[p] = t
-                break
-
-    non_ok = [p for p in pred if p not in best_matches.keys()]
-    missing = [t for t in true if t not in best_matches.values()]
+    non_ok = [p for p in pred if p not in best_matches]
+    missing = [t for t in true if t not in matched_true]
 
     by_correct_slots = {}
-    for p, t in best_matches.items():
-        num_correct_slots = f"{p.correct_slots(t)} correct slots"
+    for p, (t, num_correct_slots) in best_matches.items():
+        num_correct_slots = f"{num_correct_slots} correct slots"
         if num_correct_slots not in by_correct_slots:
             by_correct_slots[num_correct_slots] = []
         by_correct_slots[num_correct_slots].append(p)
@@ -268,11 +353,9 @@ def constraint_slot_filling_stats(
             stats_by_tag[p.type] = Stats(0, 0, 0)
         stats_by_tag[p.type].num_pred += p.num_slots
 
-    for p in best_matches:
-        t = best_matches[p]
+    for p, (t, num_correct_slots) in best_matches.items():
         if t.type not in stats_by_tag:
             stats_by_tag[t.type] = Stats(0, 0, 0)
-        num_correct_slots = p.correct_slots(t)
         assert num_correct_slots <= t.num_slots
         stats_by_tag[t.type].num_ok += num_correct_slots
         stats_by_tag[t.type].num_pred += p.num_slots
@@ -294,6 +377,168 @@ def constraint_slot_filling_stats(
     return stats_by_tag
 
 
+ConstraintMatches = typing.Dict[
+    data.VanDerAaConstraint, typing.Tuple[data.VanDerAaConstraint, int]
+]
+
+
+def _assign_constraints_by_search(
+    pred: typing.List[data.VanDerAaConstraint],
+    true: typing.List[data.VanDerAaConstraint],
+) -> ConstraintMatches:
+    """
+    Assigns predictions to true constraints of the same sentence, matching
+    pairs with more correct slots first.
+
+    :return: true constraint and number of correct slots by prediction
+    """
+    best_matches: typing.Dict[data.VanDerAaConstraint, data.VanDerAaConstraint] = {}
+
+    for score in range(4, -1, -1):
+        for p in pred:
+            for t in true:
+                if p.sentence_id != t.sentence_id:
+                    continue
+
+                num_correct_slots = p.correct_slots(t)
+                if num_correct_slots != score:
+                    continue
+                if p in best_matches.keys():
+                    continue
+                if t in best_matches.values():
+                    continue
+                best_matches[p] = t
+                break
+
+    return {p: (t, p.correct_slots(t)) for p, t in best_matches.items()}
+
+
+def _assign_constraints_by_sentence(
+    pred: typing.List[data.VanDerAaConstraint],
+    true: typing.List[data.VanDerAaConstraint],
+    optimal: bool = False,
+) -> ConstraintMatches:
+    """
+    Same as _assign_constraints_by_search, but computes the correct slots of
+    every pair of constraints in a sentence only once. Equal constraints are
+    assigned only once, as they are the same key in the result.
+
+    :param optimal: if set, maximize the total number of correct slots in
+    each sentence, instead of assigning greedily
+    :return: true constraint and number of correct slots by prediction
+    """
+    pred_by_sentence: typing.Dict[int, typing.List[data.VanDerAaConstraint]] = (
+        collections.defaultdict(list)
+    )
+    for p in dict.fromkeys(pred):
+        pred_by_sentence[p.sentence_id].append(p)
+    true_by_sentence: typing.Dict[int, typing.List[data.VanDerAaConstraint]] = (
+        collections.defaultdict(list)
+    )
+    for t in dict.fromkeys(true):
+        true_by_sentence[t.sentence_id].append(t)
+
+    best_matches: ConstraintMatches = {}
+    for sentence_id, sentence_pred in pred_by_sentence.items():
+        sentence_true = true_by_sentence.get(sentence_id)
+        if not sentence_true:
+            continue
+        scores = [[p.correct_slots(t) for t in sentence_true] for p in sentence_pred]
+        if optimal:
+            assignment = _optimal_assignment(scores)
+        else:
+            assignment = _greedy_assignment(scores)
+        for i, j in assignment:
+            best_matches[sentence_pred[i]] = (sentence_true[j], scores[i][j])
+    return best_matches
+
+
+def _greedy_assignment(
+    scores: typing.List[typing.List[int]],
+) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Assigns rows to columns, pairs with higher scores first, and the first
+    row and column among pairs with equal scores.
+    """
+    assigned_rows = [False] * len(scores)
+    assigned_cols = [False] * len(scores[0])
+    assignment = []
+    for score in range(4, -1, -1):
+        for i, row in enumerate(scores):
+            if assigned_rows[i]:
+                continue
+            for j, s in enumerate(row):
+                if s == score and not assigned_cols[j]:
+                    assigned_rows[i] = True
+                    assigned_cols[j] = True
+                    assignment.append((i, j))
+                    break
+    return assignment
+
+
+def _optimal_assignment(
+    scores: typing.List[typing.List[int]],
+) -> typing.List[typing.Tuple[int, int]]:
+    """
+    Assigns rows to columns, such that the sum of scores is maximal, using
+    the hungarian algorithm in O(rows^2 * cols).
+    """
+    num_rows = len(scores)
+    num_cols = len(scores[0])
+    if num_rows > num_cols:
+        transposed = [list(col) for col in zip(*scores)]
+        return sorted((i, j) for j, i in _optimal_assignment(transposed))
+
+    # potentials of rows and columns, all 1-based, column 0 is a virtual
+    # column the augmenting paths start from
+    row_potentials = [0] * (num_rows + 1)
+    col_potentials = [0] * (num_cols + 1)
+    row_of_col = [0] * (num_cols + 1)
+    previous_col = [0] * (num_cols + 1)
+    for row in range(1, num_rows + 1):
+        row_of_col[0] = row
+        cur_col = 0
+        min_slack = [float("inf")] * (num_cols + 1)
+        visited = [False] * (num_cols + 1)
+        while row_of_col[cur_col] != 0:
+            visited[cur_col] = True
+            cur_row = row_of_col[cur_col]
+            delta = float("inf")
+            next_col = 0
+            for col in range(1, num_cols + 1):
+                if visited[col]:
+                    continue
+                # maximize scores by minimizing their negation
+                slack = (
+                    -scores[cur_row - 1][col - 1]
+                    - row_potentials[cur_row]
+                    - col_potentials[col]
+                )
+                if slack < min_slack[col]:
+                    min_slack[col] = slack
+                    previous_col[col] = cur_col
+                if min_slack[col] < delta:
+                    delta = min_slack[col]
+                    next_col = col
+            for col in range(num_cols + 1):
+                if visited[col]:
+                    row_potentials[row_of_col[col]] += delta
+                    col_potentials[col] -= delta
+                else:
+                    min_slack[col] -= delta
+            cur_col = next_col
+        while cur_col != 0:
+            prev = previous_col[cur_col]
+            row_of_col[cur_col] = row_of_col[prev]
+            cur_col = prev
+
+    return sorted(
+        (row_of_col[col] - 1, col - 1)
+        for col in range(1, num_cols + 1)
+        if row_of_col[col] != 0
+    )
+
+
 def _tag(
     document: data.DocumentBase,
     e: typing.Union[
@@ -314,18 +559,149 @@ def _tag(
     raise AssertionError(f"Unknown type {type(e)}")
 
 
-def _f1_stats(
+def _match_by_index(
+    pred: typing.List, true: typing.List
+) -> typing.Tuple[typing.List, typing.List, typing.List]:
+    """
+    Matches predicted and true elements by equality, treating the true
+    elements as multiset, i.e. every true element can only be matched once.
+    Gives the same results as _match_by_search, in linear time.
+
+    :return: matched predictions, unmatched predictions, unmatched true elements
+    """
+    true_indices_by_key: typing.Dict[typing.Hashable, typing.Deque[int]] = (
+        collections.defaultdict(collections.deque)
+    )
+    for i, t in enumerate(true):
+        true_indices_by_key[t].append(i)
+
+    matched = [False] * len(true)
+    ok = []
+    non_ok = []
+    for cur in pred:
+        candidates = true_indices_by_key.get(cur)
+        if candidates:
+            matched[candidates.popleft()] = True
+            ok.append(cur)
+            continue
+        non_ok.append(cur)
+    missing = [t for t, m in zip(true, matched) if not m]
+    return ok, non_ok, missing
+
+
+def _match_by_key_index(
+    pred: typing.List, true: typing.List, partial_match: bool = False
+) -> typing.Tuple[typing.List, typing.List, typing.List]:
+    """
+    Same as _match_by_search, but custom matches are only checked against
+    true elements that share one of their match keys, if they have any.
+    Elements are matched by their match method if they are a HasCustomMatch,
+    or if partial_match is set, e.g. PetMentions by overlapping tokens.
+
+    :return: matched predictions, unmatched predictions, unmatched true elements
+    """
+    true_indices_by_key: typing.Dict[typing.Hashable, typing.List[int]] = (
+        collections.defaultdict(list)
+    )
+    # true elements without keys are candidates for every match
+    unindexed_true_indices: typing.List[int] = []
+    for i, t in enumerate(true):
+        keys = t.match_keys() if hasattr(t, "match_keys") else None
+        if keys is None:
+            unindexed_true_indices.append(i)
+            continue
+        for key in keys:
+            true_indices_by_key[key].append(i)
+
+    true_indices_by_equality: typing.Dict[typing.Hashable, typing.Deque[int]] = (
+        collections.defaultdict(collections.deque)
+    )
+
+    matched = [False] * len(true)
+    ok = []
+    non_ok = []
+    for cur in pred:
+        match_index: typing.Optional[int] = None
+        if partial_match or isinstance(cur, data.HasCustomMatch):
+            keys = cur.match_keys() if hasattr(cur, "match_keys") else None
+            if keys is None:
+                candidates = range(len(true))
+            else:
+                candidates = set(unindexed_true_indices)
+                for key in keys:
+                    candidates.update(true_indices_by_key.get(key, []))
+                candidates = sorted(candidates)
+            for i in candidates:
+                if not matched[i] and cur.match(true[i]):
+                    match_index = i
+                    break
+        else:
+            if len(true_indices_by_equality) == 0:
+                for i, t in enumerate(true):
+                    true_indices_by_equality[t].append(i)
+            equal = true_indices_by_equality.get(cur)
+            while equal and matched[equal[0]]:
+                equal.popleft()
+            if equal:
+                match_index = equal.popleft()
+
+        if match_index is not None:
+            matched[match_index] = True
+            ok.append(cur)
+            continue
+        non_ok.append(cur)
+    missing = [t for t, m in zip(true, matched) if not m]
+    return ok, non_ok, missing
+
+
+def _match_by_search(
+    pred: typing.List, true: typing.List, partial_match: bool = False
+) -> typing.Tuple[typing.List, typing.List, typing.List]:
+    """
+    Matches every predicted element with the first remaining true element,
+    that is equal to it, or that it matches, if it has a custom match.
+
+    :return: matched predictions, unmatched predictions, unmatched true elements
+    """
+    true_candidates = list(true)
+    ok = []
+    non_ok = []
+    for cur in pred:
+        match: typing.Optional[data.DocumentBase] = None
+        if partial_match or isinstance(cur, data.HasCustomMatch):
+            for candidate in true_candidates:
+                if cur.match(candidate):
+                    match = candidate
+                    break
+        else:
+            try:
+                match_index = true_candidates.index(cur)
+                match = true_candidates[match_index]
+            except ValueError:
+                pass
+
+        if match is not None:
+            true_candidates.remove(match)
+            ok.append(cur)
+            continue
+        non_ok.append(cur)
+    missing = true_candidates
+    return ok, non_ok, missing
+
+
+def _f1_table(
     *,
     predicted_documents: typing.List[data.DocumentBase],
     ground_truth_documents: typing.List[data.DocumentBase],
     attribute: str,
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool = False,
-) -> typing.Dict[str, Stats]:
+    partial_match: bool = False,
+) -> table.StatsTable:
     assert attribute in ["mentions", "relations", "entities", "constraints"]
     assert len(predicted_documents) == len(ground_truth_documents)
 
-    stats_by_tag: typing.Dict[str, typing.Tuple[float, float, float]] = {}
+    counts_by_document: typing.List[typing.Dict[str, typing.List[int]]] = []
 
     for p, t in zip(predicted_documents, ground_truth_documents):
         true_attribute = getattr(t, attribute)
@@ -333,49 +709,16 @@ def _f1_stats(
 
         true = list(true_attribute)
         pred = list(pred_attribute)
-        true_candidates = list(true_attribute)
-        ok = []
-        non_ok = []
-        for cur in pred:
-            match: typing.Optional[data.DocumentBase] = None
-            if isinstance(cur, data.HasCustomMatch):
-                for candidate in true_candidates:
-                    if cur.match(candidate):
-                        match = candidate
-                        break
-            else:
-                try:
-                    match_index = true_candidates.index(cur)
-                    match = true_candidates[match_index]
-                except ValueError:
-                    pass
-
-            if match is not None:
-                true_candidates.remove(match)
-                ok.append(cur)
-                continue
-            non_ok.append(cur)
-        missing = true_candidates
-
-        _add_to_stats_by_tag(
-            stats_by_tag,
-            lambda e: _tag(t, e),
-            true,
-            "gold",
-        )
-        _add_to_stats_by_tag(
-            stats_by_tag,
-            lambda e: _tag(t, e),
-            pred,
-            "pred",
-        )
+        if partial_match or any(isinstance(e, data.HasCustomMatch) for e in pred):
+            ok, non_ok, missing = _match_by_key_index(pred, true, partial_match)
+        else:
+            ok, non_ok, missing = _match_by_index(pred, true)
 
-        _add_to_stats_by_tag(
-            stats_by_tag,
-            lambda e: _tag(t, e),
-            ok,
-            "ok",
-        )
+        counts_by_tag: typing.Dict[str, typing.List[int]] = {}
+        _count_by_tag(counts_by_tag, lambda e: _tag(t, e), true, table.GOLD)
+        _count_by_tag(counts_by_tag, lambda e: _tag(t, e), pred, table.PRED)
+        _count_by_tag(counts_by_tag, lambda e: _tag(t, e), ok, table.OK)
+        counts_by_document.append(counts_by_tag)
 
         if verbose and (len(non_ok) > 0 or len(missing) > 0):
             print_sets(
@@ -391,10 +734,9 @@ def _f1_stats(
                 print_only_tags,
             )
 
-    return {
-        tag: Stats(num_pred=p, num_gold=g, num_ok=o)
-        for tag, (g, p, o) in stats_by_tag.items()
-    }
+    return table.StatsTable.from_counts(
+        [t.id for t in ground_truth_documents], counts_by_document
+    )
 
 
 def print_sets(
@@ -0,0 +1,159 @@
+import dataclasses
+import typing
+
+import numpy as np
+
+from eval import table
+
+Strategy = typing.Literal["micro", "macro"]
+Metric = typing.Literal["p", "r", "f1"]
+
+_metric_indices = {"p": 0, "r": 1, "f1": 2}
+
+
+@dataclasses.dataclass
+class ConfidenceInterval:
+    score: float
+    low: float
+    high: float
+
+
+@dataclasses.dataclass
+class Comparison:
+    # score of the first table minus the score of the second one
+    difference: float
+    p_value: float
+
+
+def bootstrap_confidence_interval(
+    stats: table.StatsTable,
+    *,
+    strategy: Strategy = "micro",
+    metric: Metric = "f1",
+    num_resamples: int = 10_000,
+    confidence: float = 0.95,
+    seed: typing.Optional[int] = None,
+) -> ConfidenceInterval:
+    """
+    Percentile bootstrap interval of the averaged score, resampling
+    documents with replacement.
+    """
+    rng = np.random.default_rng(seed)
+    weights = _resample_weights(rng, len(stats.documents), num_resamples)
+    scores = _score(_weighted_counts(weights, stats.counts), strategy, metric)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(scores, [alpha, 1 - alpha])
+    return ConfidenceInterval(
+        score=float(_score(stats.counts.sum(axis=0), strategy, metric)),
+        low=float(low),
+        high=float(high),
+    )
+
+
+def paired_bootstrap_test(
+    a: table.StatsTable,
+    b: table.StatsTable,
+    *,
+    strategy: Strategy = "micro",
+    metric: Metric = "f1",
+    num_resamples: int = 10_000,
+    seed: typing.Optional[int] = None,
+) -> Comparison:
+    """
+    Two sided test, whether the scores of two runs on the same documents
+    differ, resampling the same documents for both runs.
+    """
+    counts_a, counts_b = _align(a, b)
+    difference = _difference(
+        counts_a.sum(axis=0), counts_b.sum(axis=0), strategy, metric
+    )
+
+    rng = np.random.default_rng(seed)
+    weights = _resample_weights(rng, counts_a.shape[0], num_resamples)
+    resampled = _difference(
+        _weighted_counts(weights, counts_a),
+        _weighted_counts(weights, counts_b),
+        strategy,
+        metric,
+    )
+    # resampled differences are centered around the observed one, under the
+    # null hypothesis they would be centered around zero
+    num_extreme = np.sum(np.abs(resampled - difference) >= abs(difference))
+    return Comparison(
+        difference=float(difference),
+        p_value=float((num_extreme + 1) / (num_resamples + 1)),
+    )
+
+
+def permutation_test(
+    a: table.StatsTable,
+    b: table.StatsTable,
+    *,
+    strategy: Strategy = "micro",
+    metric: Metric = "f1",
+    num_resamples: int = 10_000,
+    seed: typing.Optional[int] = None,
+) -> Comparison:
+    """
+    Two sided approximate randomization test, whether the scores of two runs
+    on the same documents differ, swapping the counts of both runs for a
+    random subset of documents in each resample.
+    """
+    counts_a, counts_b = _align(a, b)
+    total_a = counts_a.sum(axis=0)
+    total_b = counts_b.sum(axis=0)
+    difference = _difference(total_a, total_b, strategy, metric)
+
+    rng = np.random.default_rng(seed)
+    swapped = rng.integers(0, 2, size=(num_resamples, counts_a.shape[0]))
+    moved = _weighted_counts(swapped, counts_b - counts_a)
+    permuted = _difference(total_a + moved, total_b - moved, strategy, metric)
+    num_extreme = np.sum(np.abs(permuted) >= abs(difference))
+    return Comparison(
+        difference=float(difference),
+        p_value=float((num_extreme + 1) / (num_resamples + 1)),
+    )
+
+
+def _resample_weights(
+    rng: np.random.Generator, num_documents: int, num_resamples: int
+) -> np.ndarray:
+    # how often each document is drawn, shape (resamples, documents)
+    return rng.multinomial(
+        num_documents, np.full(num_documents, 1 / num_documents), size=num_resamples
+    )
+
+
+def _weighted_counts(weights: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Sums of counts (documents, tags, 3) over documents, weighted per resample
+    (resamples, documents), in a single matrix product.
+    """
+    num_documents, num_tags, _ = counts.shape
+    summed = weights @ counts.reshape(num_documents, num_tags * 3)
+    return summed.reshape(weights.shape[0], num_tags, 3)
+
+
+def _score(counts: np.ndarray, strategy: Strategy, metric: Metric) -> np.ndarray:
+    return table.average_scores_from_counts(counts, strategy)[_metric_indices[metric]]
+
+
+def _difference(
+    counts_a: np.ndarray, counts_b: np.ndarray, strategy: Strategy, metric: Metric
+) -> np.ndarray:
+    return _score(counts_a, strategy, metric) - _score(counts_b, strategy, metric)
+
+
+def _align(
+    a: table.StatsTable, b: table.StatsTable
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts of both tables for the same documents in the same order, and the
+    tags of both tables.
+    """
+    if sorted(a.documents) != sorted(b.documents):
+        raise ValueError("Paired tests need results for the same documents.")
+    b = b.select(a.documents)
+    combined = table.StatsTable.concatenate([a, b])
+    num_documents = len(a.documents)
+    return combined.counts[:num_documents], combined.counts[num_documents:]
@@ -0,0 +1,173 @@
+import dataclasses
+import typing
+
+import numpy as np
+
+# metrics builds tables, so its names are only resolved when called
+from eval import metrics
+
+PRED = 0
+GOLD = 1
+OK = 2
+
+
+@dataclasses.dataclass
+class StatsTable:
+    """
+    Counts of predicted, true, and correctly predicted elements, by document
+    and tag, as array of shape (documents, tags, 3). Sums and scores over any
+    of these axes are array reductions, instead of additions of Stats.
+    Documents may be folds as well, when summing stats over folds.
+    """
+
+    documents: typing.List[str]
+    tags: typing.List[str]
+    counts: np.ndarray
+
+    def __post_init__(self):
+        assert self.counts.shape == (len(self.documents), len(self.tags), 3)
+
+    @staticmethod
+    def from_stats(
+        stats_by_document: typing.Dict[str, typing.Dict[str, "metrics.Stats"]],
+        tags: typing.Optional[typing.List[str]] = None,
+    ) -> "StatsTable":
+        """
+        :param stats_by_document: stats by tag, for every document
+        :param tags: order of tags in the table, all tags in order of their
+        first occurrence if None
+        """
+        return StatsTable.from_counts(
+            list(stats_by_document.keys()),
+            [
+                {tag: (s.num_pred, s.num_gold, s.num_ok) for tag, s in stats.items()}
+                for stats in stats_by_document.values()
+            ],
+            tags,
+        )
+
+    @staticmethod
+    def from_counts(
+        documents: typing.List[str],
+        counts_by_document: typing.List[typing.Dict[str, typing.Sequence[int]]],
+        tags: typing.Optional[typing.List[str]] = None,
+    ) -> "StatsTable":
+        """
+        :param counts_by_document: counts of predicted, true, and correctly
+        predicted elements by tag, for every document
+        :param tags: order of tags in the table, all tags in order of their
+        first occurrence if None
+        """
+        assert len(documents) == len(counts_by_document)
+        if tags is None:
+            tags = list(dict.fromkeys(t for c in counts_by_document for t in c))
+        tag_indices = {t: i for i, t in enumerate(tags)}
+        counts = np.zeros((len(documents), len(tags), 3), dtype=np.int64)
+        for i, counts_by_tag in enumerate(counts_by_document):
+            for tag, c in counts_by_tag.items():
+                counts[i, tag_indices[tag]] = c
+        return StatsTable(documents=list(documents), tags=tags, counts=counts)
+
+    @staticmethod
+    def from_documents(
+        stats_function: typing.Callable[..., typing.Dict[str, "metrics.Stats"]],
+        *,
+        predicted_documents: typing.List,
+        ground_truth_documents: typing.List,
+        **kwargs,
+    ) -> "StatsTable":
+        """
+        Builds the table by calling one of the *_f1_stats functions of
+        eval.metrics for every document.
+        """
+        assert len(predicted_documents) == len(ground_truth_documents)
+        stats_by_document = {}
+        for p, t in zip(predicted_documents, ground_truth_documents):
+            stats_by_document[t.id] = stats_function(
+                predicted_documents=[p], ground_truth_documents=[t], **kwargs
+            )
+        return StatsTable.from_stats(stats_by_document)
+
+    @staticmethod
+    def concatenate(tables: typing.List["StatsTable"]) -> "StatsTable":
+        """
+        Stacks the documents of all tables, e.g. of all folds, tags missing
+        in some table have counts of zero there.
+        """
+        tags = list(dict.fromkeys(t for table in tables for t in table.tags))
+        tag_indices = {t: i for i, t in enumerate(tags)}
+        documents = [d for table in tables for d in table.documents]
+        counts = np.zeros((len(documents), len(tags), 3), dtype=np.int64)
+        offset = 0
+        for table in tables:
+            columns = [tag_indices[t] for t in table.tags]
+            counts[offset : offset + len(table.documents), columns] = table.counts
+            offset += len(table.documents)
+        return StatsTable(documents=documents, tags=tags, counts=counts)
+
+    def select(self, documents: typing.List[str]) -> "StatsTable":
+        """
+        Table of only the given documents, e.g. of the test documents of a
+        single fold.
+        """
+        document_indices = {d: i for i, d in enumerate(self.documents)}
+        rows = [document_indices[d] for d in documents]
+        return StatsTable(
+            documents=list(documents), tags=self.tags, counts=self.counts[rows]
+        )
+
+    def counts_by_tag(self) -> np.ndarray:
+        return self.counts.sum(axis=0)
+
+    def stats_by_tag(self) -> typing.Dict[str, "metrics.Stats"]:
+        return {
+            tag: metrics.Stats(num_pred=p, num_gold=g, num_ok=o)
+            for tag, (p, g, o) in zip(self.tags, self.counts_by_tag().tolist())
+        }
+
+    def scores_by_tag(self) -> typing.Dict[str, "metrics.Scores"]:
+        p, r, f1 = scores_from_counts(self.counts_by_tag())
+        return {
+            tag: metrics.Scores(p=tag_p, r=tag_r, f1=tag_f1)
+            for tag, tag_p, tag_r, tag_f1 in zip(
+                self.tags, p.tolist(), r.tolist(), f1.tolist()
+            )
+        }
+
+    def average_scores(
+        self, strategy: typing.Literal["micro", "macro"]
+    ) -> "metrics.Scores":
+        p, r, f1 = average_scores_from_counts(self.counts_by_tag(), strategy)
+        return metrics.Scores(p=float(p), r=float(r), f1=float(f1))
+
+
+def average_scores_from_counts(
+    counts: np.ndarray, strategy: typing.Literal["micro", "macro"]
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Averaged precision, recall, and f1 of counts by tag with shape
+    (..., tags, 3), e.g. of many resamples of a table at once.
+    """
+    if strategy == "micro":
+        return scores_from_counts(counts.sum(axis=-2))
+    if strategy == "macro":
+        p, r, f1 = scores_from_counts(counts)
+        return p.mean(axis=-1), r.mean(axis=-1), f1.mean(axis=-1)
+    raise ValueError(f"Unknown averaging mode {strategy}.")
+
+
+def scores_from_counts(
+    counts: np.ndarray,
+) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Precision, recall, and f1 of counts with shape (..., 3), with the same
+    edge cases as metrics.Stats.
+    """
+    num_pred = counts[..., PRED]
+    num_gold = counts[..., GOLD]
+    num_ok = counts[..., OK]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(num_pred == 0, (num_gold == 0) * 1.0, num_ok / num_pred)
+        r = np.where(num_gold == 0, (num_pred == 0) * 1.0, num_ok / num_gold)
+        f1 = np.where(p + r == 0, 0.0, 2 * p * r / (p + r))
+    return p, r, f1
@@ -0,0 +1,180 @@
+import random
+import time
+import typing
+
+import data
+from eval import metrics
+
+rng = random.Random(42)
+
+
+def perturb(elements: typing.List, make_wrong: typing.Callable) -> typing.List:
+    # drop some elements, add some wrong ones, and shuffle, similar to
+    # the predictions of a model
+    perturbed = [e for e in elements if rng.random() > 0.2]
+    perturbed += [make_wrong(e) for e in elements if rng.random() < 0.2]
+    rng.shuffle(perturbed)
+    return perturbed
+
+
+def scale(document: data.PetDocument, factor: int) -> data.PetDocument:
+    num_tokens = len(document.tokens)
+    num_mentions = len(document.mentions)
+    scaled = document.copy([])
+    for i in range(1, factor):
+        scaled.mentions += [
+            data.PetMention(
+                type=m.type,
+                token_document_indices=tuple(
+                    t + i * num_tokens for t in m.token_document_indices
+                ),
+            )
+            for m in document.mentions
+        ]
+        scaled.entities += [
+            data.PetEntity(
+                mention_indices=tuple(m + i * num_mentions for m in e.mention_indices)
+            )
+            for e in document.entities
+        ]
+        scaled.relations += [
+            data.PetRelation(
+                type=r.type,
+                head_mention_index=r.head_mention_index + i * num_mentions,
+                tail_mention_index=r.tail_mention_index + i * num_mentions,
+            )
+            for r in document.relations
+        ]
+    return scaled
+
+
+def predictions(document: data.PetDocument) -> typing.Dict[str, typing.List]:
+    return {
+        "mentions": perturb(
+            document.mentions,
+            lambda m: data.PetMention(
+                type=m.type.upper(),
+                token_document_indices=tuple(i + 1 for i in m.token_document_indices),
+            ),
+        ),
+        "entities": perturb(
+            document.entities,
+            lambda e: data.PetEntity(
+                mention_indices=tuple(i + 1 for i in e.mention_indices)
+            ),
+        ),
+        "relations": perturb(
+            document.relations,
+            lambda r: data.PetRelation(
+                type=r.type,
+                head_mention_index=r.tail_mention_index,
+                tail_mention_index=r.head_mention_index,
+            ),
+        ),
+    }
+
+
+def constraint_predictions(
+    document: data.VanDerAaDocument,
+) -> typing.Dict[str, typing.List]:
+    return {
+        "constraints": perturb(
+            document.constraints,
+            lambda c: data.VanDerAaConstraint(
+                type=c.type,
+                negative=not c.negative,
+                head=c.tail if c.tail is not None else c.head,
+                tail=c.head if c.tail is not None else None,
+                sentence_id=c.sentence_id,
+            ),
+        )
+    }
+
+
+def benchmark(
+    name: str,
+    documents: typing.List[data.DocumentBase],
+    repetitions: int,
+    legacy: typing.Callable,
+    indexed: typing.Callable,
+    attributes: typing.List[str],
+    predict: typing.Callable[[data.DocumentBase], typing.Dict] = predictions,
+):
+    cases = [
+        (getattr(d, attribute), pred)
+        for d in documents
+        for attribute, pred in predict(d).items()
+        if attribute in attributes
+    ]
+    num_elements = sum(len(true) + len(pred) for true, pred in cases)
+
+    timings = {}
+    results = {}
+    for label, match in [("legacy", legacy), ("indexed", indexed)]:
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            results[label] = [match(pred, true) for true, pred in cases]
+        timings[label] = (time.perf_counter() - start) / repetitions
+
+    assert results["legacy"] == results["indexed"]
+    speedup = timings["legacy"] / timings["indexed"]
+    print(
+        f"{name:<20}: {len(documents)} documents, {num_elements} elements, "
+        f"legacy {timings['legacy'] * 1000:.1f}ms, "
+        f"indexed {timings['indexed'] * 1000:.1f}ms, "
+        f"{speedup:.1f}x faster"
+    )
+
+
+def partial(match: typing.Callable) -> typing.Callable:
+    return lambda pred, true: match(pred, true, partial_match=True)
+
+
+pet_documents = data.PetImporter("res/data/pet/all.new.jsonl").do_import()
+datasets = [
+    ("PET", pet_documents, 20),
+    ("PET x 10", [scale(d, 10) for d in pet_documents], 2),
+    ("PET x 100", [scale(d, 100) for d in pet_documents[:5]], 1),
+]
+
+print("exact matching")
+for name, documents, repetitions in datasets:
+    benchmark(
+        name,
+        documents,
+        repetitions,
+        metrics._match_by_search,
+        metrics._match_by_index,
+        ["mentions", "entities", "relations"],
+    )
+
+print("partial (overlap) matching of mentions")
+for name, documents, repetitions in datasets:
+    benchmark(
+        name,
+        documents,
+        repetitions,
+        partial(metrics._match_by_search),
+        partial(metrics._match_by_key_index),
+        ["mentions"],
+    )
+
+print("slot filling of constraints")
+constraint_datasets = [
+    (
+        "Van der Aa",
+        data.VanDerAaImporter("res/data/van-der-aa/datacollection.csv").do_import(),
+        5,
+    ),
+    ("Quishpi", data.VanDerAaImporter("res/data/quishpi/csv").do_import(), 5),
+]
+for name, documents, repetitions in constraint_datasets:
+    benchmark(
+        name,
+        documents,
+        repetitions,
+        metrics._assign_constraints_by_search,
+        metrics._assign_constraints_by_sentence,
+        ["constraints"],
+        constraint_predictions,
+    )
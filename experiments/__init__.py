@@ -2,3 +2,4 @@ from experiments.common import experiment, chat_model_for_name
 from experiments.model import ExperimentResult, RunMeta, PromptResult
 from experiments.parse import print_experiment_results
 from experiments.iterative import run_iterative_document_prompt
+from experiments.planning import plan_experiment, print_plan
@@ -0,0 +1,265 @@
+import dataclasses
+import glob
+import json
+import os
+import typing
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+
+import format
+from data import base
+from experiments import model, common, iterative, checkpoint, usage
+
+TDocument = typing.TypeVar("TDocument", bound=base.DocumentBase)
+
+# factor of the interactive price charged by the batch api of each provider
+# with a batch api in the format of requests written here
+BATCH_PRICE_FACTORS = {"openai": 0.5}
+
+_roles = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+@dataclasses.dataclass
+class BatchAnswer:
+    answer: str
+    input_tokens: int
+    output_tokens: int
+
+
+def custom_id(fold_id: int, document_id: str, step: int) -> str:
+    return f"{fold_id}:{document_id}:{step}"
+
+
+def request_path(batch_directory: str, batch_round: int) -> str:
+    return os.path.join(batch_directory, f"requests-{batch_round}.jsonl")
+
+
+def result_path(batch_directory: str, batch_round: int) -> str:
+    return os.path.join(batch_directory, f"results-{batch_round}.jsonl")
+
+
+def to_request(
+    request_id: str,
+    model_name: str,
+    temperature: typing.Optional[float],
+    prompt_as_messages: PromptValue,
+) -> typing.Dict:
+    """
+    :param temperature: None to use the default temperature of the api
+    """
+    body = {
+        "model": model_name,
+        "messages": [
+            {"role": _roles[m.type], "content": m.content}
+            for m in prompt_as_messages.to_messages()
+        ],
+    }
+    if temperature is not None:
+        body["temperature"] = temperature
+    return {
+        "custom_id": request_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+    }
+
+
+def to_result(
+    request_id: str, answer: str, input_tokens: int, output_tokens: int
+) -> typing.Dict:
+    return {
+        "id": f"batch_req_{request_id}",
+        "custom_id": request_id,
+        "response": {
+            "status_code": 200,
+            "body": {
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": input_tokens,
+                    "completion_tokens": output_tokens,
+                    "total_tokens": input_tokens + output_tokens,
+                },
+            },
+        },
+        "error": None,
+    }
+
+
+def load_answers(batch_directory: str) -> typing.Dict[str, BatchAnswer]:
+    answers: typing.Dict[str, BatchAnswer] = {}
+    for path in sorted(glob.glob(os.path.join(batch_directory, "results-*.jsonl"))):
+        with open(path, "r", encoding="utf8") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                record = json.loads(line)
+                response = record.get("response")
+                if record.get("error") is not None or response is None:
+                    print(
+                        f"Request {record['custom_id']} failed in batch, "
+                        f"will be requested again: {record.get('error')}"
+                    )
+                    continue
+                if response["status_code"] != 200:
+                    print(
+                        f"Request {record['custom_id']} failed in batch with "
+                        f"status {response['status_code']}, will be requested again."
+                    )
+                    continue
+                body = response["body"]
+                answers[record["custom_id"]] = BatchAnswer(
+                    answer=body["choices"][0]["message"]["content"],
+                    input_tokens=body["usage"]["prompt_tokens"],
+                    output_tokens=body["usage"]["completion_tokens"],
+                )
+    return answers
+
+
+def run_batch_round(
+    pending: typing.List[
+        typing.Tuple[int, typing.List[TDocument], typing.List[TDocument]]
+    ],
+    folds: typing.List[typing.Dict[str, typing.List[str]]],
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    *,
+    model_name: str,
+    temperature: typing.Optional[float],
+    log: checkpoint.CheckpointLog,
+    batch_directory: str,
+) -> typing.Optional[str]:
+    """
+    Advances every pending document as far as the answers in the result
+    files of previous rounds allow. Documents with answers for all their
+    steps are stored in the log, for all others the request of the next
+    step is written to the request file of the next round.
+
+    :return: path of the written request file, None if all documents are done
+    """
+    provider = common.provider_for_name(model_name)
+    if provider not in BATCH_PRICE_FACTORS:
+        raise ValueError(
+            f"Batch mode is not supported for {model_name}, only for models of "
+            f"{', '.join(BATCH_PRICE_FACTORS)}."
+        )
+
+    answers = load_answers(batch_directory)
+    requests = []
+    for fold_id, example_docs, input_docs in pending:
+        for document in input_docs:
+            result, request = _advance_document(
+                fold_id,
+                document,
+                formatters,
+                example_docs,
+                model_name,
+                temperature,
+                BATCH_PRICE_FACTORS[provider],
+                answers,
+            )
+            if request is not None:
+                requests.append(request)
+                continue
+            position = folds[fold_id]["test"].index(result.original_id)
+            log.append_result(fold_id, result, position)
+
+    if len(requests) == 0:
+        print("All batch requests answered, experiment is complete.")
+        return None
+
+    batch_round = len(glob.glob(os.path.join(batch_directory, "results-*.jsonl")))
+    path = request_path(batch_directory, batch_round)
+    os.makedirs(batch_directory, exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+    print(
+        f"Wrote {len(requests)} batch requests to {path}, submit them and store "
+        f"the results in {result_path(batch_directory, batch_round)}, "
+        f"then run the experiment again."
+    )
+    return path
+
+
+def _advance_document(
+    fold_id: int,
+    input_document: TDocument,
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    example_docs: typing.List[TDocument],
+    model_name: str,
+    temperature: typing.Optional[float],
+    price_factor: float,
+    answers: typing.Dict[str, BatchAnswer],
+) -> typing.Tuple[typing.Optional[model.PromptResult], typing.Optional[typing.Dict]]:
+    merged_result: typing.Optional[model.PromptResult] = None
+    cur_doc: TDocument = input_document.copy(formatters[0].steps)
+    for step, formatter in enumerate(formatters):
+        prompt_as_text, prompt_as_messages = common._render_prompt(
+            cur_doc, formatter, example_docs
+        )
+        request_id = custom_id(fold_id, input_document.id, step)
+        if request_id not in answers:
+            return None, to_request(
+                request_id, model_name, temperature, prompt_as_messages
+            )
+
+        answer = answers[request_id]
+        total_costs = usage.get_cost_for_tokens(
+            model_name=model_name,
+            num_input_tokens=answer.input_tokens,
+            num_output_tokens=answer.output_tokens,
+        )
+        if total_costs > 0:
+            total_costs *= price_factor
+        result = model.PromptResult(
+            prompts=[prompt_as_text],
+            answers=[answer.answer],
+            formatters=[formatter.__class__.__name__],
+            steps=[formatter.steps],
+            original_id=input_document.id,
+            input_tokens=answer.input_tokens,
+            output_tokens=answer.output_tokens,
+            total_costs=total_costs,
+            formatter_args=[formatter.args],
+        )
+        cur_doc = iterative._merge_answers(input_document, cur_doc, formatter, result)
+        if merged_result is None:
+            merged_result = result
+        else:
+            merged_result = merged_result + result
+    return merged_result, None
+
+
+def run_locally(request_file: str, result_file: str, chat_model: BaseChatModel):
+    """
+    Stands in for a provider's batch api, by sending every request in the
+    given file to the chat model, and writing the answers as a result file.
+    """
+    results = []
+    with open(request_file, "r", encoding="utf8") as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            request = json.loads(line)
+            messages: typing.List[typing.Tuple[str, str]] = [
+                (m["role"], m["content"]) for m in request["body"]["messages"]
+            ]
+            res: BaseMessage = chat_model.invoke(messages)
+            answer = str(res.content)
+            input_tokens = chat_model.get_num_tokens(
+                "\n".join(content for _, content in messages)
+            )
+            output_tokens = chat_model.get_num_tokens(answer)
+            results.append(
+                to_result(request["custom_id"], answer, input_tokens, output_tokens)
+            )
+    with open(result_file, "w", encoding="utf8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
@@ -0,0 +1,158 @@
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing
+
+from langchain_core.prompt_values import PromptValue
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    answer: str
+    input_tokens: int
+    output_tokens: int
+    total_costs: float
+
+    def to_dict(self):
+        return self.__dict__
+
+    @staticmethod
+    def from_dict(dic: typing.Dict):
+        return CachedResponse(
+            answer=dic["answer"],
+            input_tokens=dic["input_tokens"],
+            output_tokens=dic["output_tokens"],
+            total_costs=dic["total_costs"],
+        )
+
+
+class ResponseCache:
+    """
+    Persistent cache for model answers, addressed by the hash of everything
+    that influences the answer, i.e. model, temperature, prompt messages,
+    and formatter. Every entry is a single file, written atomically, so
+    several processes can share the same cache directory. Once the cache
+    grows beyond max_size_bytes, the least recently used entries are removed.
+    Instances can be shared between threads.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = 512 * 1024 * 1024):
+        self._directory = directory
+        self._max_size_bytes = max_size_bytes
+        self._size_bytes: typing.Optional[int] = None
+        # guards the size and the counters, files are replaced atomically
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        *,
+        model_name: str,
+        temperature: float,
+        prompt_as_messages: PromptValue,
+        formatter_name: str,
+        formatter_args: typing.Dict[str, typing.Any],
+    ) -> str:
+        messages = [(m.type, m.content) for m in prompt_as_messages.to_messages()]
+        raw = json.dumps(
+            {
+                "model": model_name,
+                "temperature": temperature,
+                "messages": messages,
+                "formatter": formatter_name,
+                "formatter_args": formatter_args,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(raw.encode("utf8")).hexdigest()
+
+    def get(self, key: str) -> typing.Optional[CachedResponse]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf8") as f:
+                raw = json.load(f)
+            # mark as recently used for eviction
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # missing, or evicted by another process in the meantime
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return CachedResponse.from_dict(raw)
+
+    def put(self, key: str, response: CachedResponse):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(response.to_dict(), f)
+        try:
+            # size of the entry this one replaces, if any
+            old_size_bytes = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size_bytes = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size_bytes is None:
+                self._size_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self._size_bytes += os.path.getsize(path) - old_size_bytes
+            if self._size_bytes > self._max_size_bytes:
+                self._evict()
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        size_bytes = sum(size for _, _, size in entries)
+        # leave some headroom, so we do not evict on every single put
+        target_size_bytes = int(self._max_size_bytes * 0.9)
+        for path, _, size in entries:
+            if size_bytes <= target_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size_bytes -= size
+        self._size_bytes = size_bytes
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0.0
+        print(
+            f"Response cache in {self._directory}: {self.hits} hits, "
+            f"{self.misses} misses ({hit_rate:.0%} hit rate)."
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key[:2], f"{key}.json")
+
+    def _entries(self) -> typing.List[typing.Tuple[str, float, int]]:
+        entries = []
+        if not os.path.isdir(self._directory):
+            return entries
+        for sub_directory in os.listdir(self._directory):
+            sub_directory = os.path.join(self._directory, sub_directory)
+            if not os.path.isdir(sub_directory):
+                continue
+            for file_name in os.listdir(sub_directory):
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(sub_directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
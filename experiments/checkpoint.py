@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import typing
+
+from experiments import model
+
+
+class CheckpointLog:
+    """
+    Append-only log of experiment results, stored next to the result file,
+    e.g. "res/answers/run.log.jsonl" for "res/answers/run.json".
+
+    Every finished document is appended as a single json line, so writing is
+    constant effort per result, and a crash can at most lose the line that
+    was written last. Steps of iterative formatters are logged the same way,
+    so unfinished documents can continue from their last finished step. Use
+    compact to write the log in the ExperimentResult layout that is read by
+    experiments.parse. Appending is safe from several threads.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._log_path = f"{os.path.splitext(path)[0]}.log.jsonl"
+        self._seed: typing.Optional[typing.List[model.ExperimentResult]] = None
+        self._steps: typing.List[typing.Dict[str, typing.List[model.PromptResult]]] = []
+        # reentrant, seeding the log appends from within an append
+        self._append_lock = threading.RLock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def log_path(self) -> str:
+        return self._log_path
+
+    def load(self) -> typing.List[model.ExperimentResult]:
+        self._steps = []
+        if os.path.isfile(self._log_path):
+            experiment_results, self._steps = self._replay(self._read_records())
+            return experiment_results
+        if os.path.isfile(self._path):
+            with open(self._path, "r", encoding="utf8") as f:
+                raw = json.load(f)
+            experiment_results = [model.ExperimentResult.from_dict(e) for e in raw]
+            # results of runs from before this log existed, have to be
+            # copied to the log, before it receives any new results
+            self._seed = experiment_results
+            return experiment_results
+        return []
+
+    def append_meta(self, fold_id: int, meta: model.RunMeta):
+        self._append([{"fold": fold_id, "meta": meta.to_dict()}])
+
+    def append_result(self, fold_id: int, result: model.PromptResult, position: int):
+        self._append(
+            [{"fold": fold_id, "position": position, "result": result.to_dict()}]
+        )
+
+    def append_step(
+        self, fold_id: int, document_id: str, step: int, result: model.PromptResult
+    ):
+        self._append(
+            [
+                {
+                    "fold": fold_id,
+                    "document": document_id,
+                    "step": step,
+                    "result": result.to_dict(),
+                }
+            ]
+        )
+
+    def steps(self, fold_id: int) -> typing.Dict[str, typing.List[model.PromptResult]]:
+        """
+        Results of the consecutive finished steps of all documents in the
+        given fold, that do not have a final result yet, as of the last load.
+        """
+        if fold_id >= len(self._steps):
+            return {}
+        return self._steps[fold_id]
+
+    def compact(self) -> typing.List[model.ExperimentResult]:
+        experiment_results = self.load()
+        self._make_dirs(self._path)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump([r.to_dict() for r in experiment_results], f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+        return experiment_results
+
+    def _append(self, records: typing.List[typing.Dict]):
+        lines = "".join(json.dumps(r) + "\n" for r in records)
+        with self._append_lock:
+            if self._seed is not None:
+                seed = self._seed
+                self._seed = None
+                if not os.path.isfile(self._log_path):
+                    self._append(self._to_records(seed))
+
+            self._make_dirs(self._log_path)
+            with open(self._log_path, "a", encoding="utf8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _make_dirs(path: str):
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _to_records(
+        experiment_results: typing.List[model.ExperimentResult],
+    ) -> typing.List[typing.Dict]:
+        records = []
+        for fold_id, experiment_result in enumerate(experiment_results):
+            records.append({"fold": fold_id, "meta": experiment_result.meta.to_dict()})
+            for position, result in enumerate(experiment_result.results):
+                records.append(
+                    {"fold": fold_id, "position": position, "result": result.to_dict()}
+                )
+        return records
+
+    def _read_records(self) -> typing.List[typing.Dict]:
+        with open(self._log_path, "rb") as f:
+            contents = f.read()
+
+        if contents != b"" and not contents.endswith(b"\n"):
+            # last write was interrupted, drop the partial line, so the
+            # next append starts on a fresh line again
+            valid_length = contents.rfind(b"\n") + 1
+            print(
+                f"Discarding incomplete last record in {self._log_path}: "
+                f"'{contents[valid_length:][:100]}'"
+            )
+            contents = contents[:valid_length]
+            with open(self._log_path, "r+b") as f:
+                f.truncate(valid_length)
+
+        return [
+            json.loads(line)
+            for line in contents.decode("utf8").splitlines()
+            if line != ""
+        ]
+
+    @staticmethod
+    def _replay(
+        records: typing.List[typing.Dict],
+    ) -> typing.Tuple[
+        typing.List[model.ExperimentResult],
+        typing.List[typing.Dict[str, typing.List[model.PromptResult]]],
+    ]:
+        experiment_results: typing.List[model.ExperimentResult] = []
+        raw_metas: typing.List[typing.Dict] = []
+        positions: typing.List[typing.Dict[str, int]] = []
+        steps: typing.List[typing.Dict[str, typing.Dict[int, model.PromptResult]]] = []
+        for record in records:
+            fold_id = record["fold"]
+            if "meta" in record:
+                assert fold_id == len(experiment_results), (
+                    f"Log contains meta for fold {fold_id}, "
+                    f"but only {len(experiment_results)} folds so far."
+                )
+                raw_metas.append(record["meta"])
+                positions.append({})
+                steps.append({})
+                experiment_results.append(
+                    model.ExperimentResult(
+                        meta=model.RunMeta.from_dict(record["meta"]), results=[]
+                    )
+                )
+                continue
+
+            result = model.PromptResult.from_dict(record["result"], raw_metas[fold_id])
+            if "step" in record:
+                document_steps = steps[fold_id].setdefault(record["document"], {})
+                document_steps[record["step"]] = result
+                continue
+
+            fold_positions = positions[fold_id]
+            if result.original_id in fold_positions:
+                print(
+                    f"Skipping duplicate result for {result.original_id} "
+                    f"in fold {fold_id}."
+                )
+                continue
+            fold_positions[result.original_id] = record.get(
+                "position", len(fold_positions)
+            )
+            experiment_results[fold_id].results.append(result)
+
+        unfinished_steps = []
+        for fold_id, experiment_result in enumerate(experiment_results):
+            experiment_result.results.sort(
+                key=lambda r: positions[fold_id][r.original_id]
+            )
+            fold_steps = {}
+            for document_id, document_steps in steps[fold_id].items():
+                if document_id in positions[fold_id]:
+                    continue
+                fold_steps[document_id] = []
+                while len(fold_steps[document_id]) in document_steps:
+                    step = len(fold_steps[document_id])
+                    fold_steps[document_id].append(document_steps[step])
+            unfinished_steps.append(fold_steps)
+        return experiment_results, unfinished_steps
@@ -1,4 +1,6 @@
-import json
+import asyncio
+import dataclasses
+import functools
 import os
 import typing
 
@@ -15,7 +17,19 @@ from langchain_core.prompt_values import PromptValue
 
 import format
 from data import base
-from experiments import usage, iterative, model
+from experiments import (
+    usage,
+    iterative,
+    model,
+    checkpoint,
+    cache,
+    ratelimit,
+    retry,
+    batch,
+    templates,
+    replay,
+    planning,
+)
 from format.common import load_prompt_from_file
 
 TDocument = typing.TypeVar("TDocument", bound=base.DocumentBase)
@@ -72,18 +86,12 @@ def prompt_openai(
         return res, total_costs, num_input_tokens, num_output_tokens
 
 
-def run_single_document_prompt(
-    input_document: TDocument,
+def _render_prompt(
     current_prediction: TDocument,
     formatter: format.BaseFormattingStrategy[TDocument],
     example_docs: typing.List[TDocument],
-    chat_model: BaseChatModel,
-    model_name: str,
-    dry_run: bool,
-) -> model.PromptResult:
-    print(f"Running prompt for {input_document.id} ...")
-
-    prompt = get_prompt(formatter, example_docs)
+) -> typing.Tuple[str, PromptValue]:
+    prompt = templates.prompt_templates.get(formatter, example_docs, get_prompt)
 
     formatted_input_document = formatter.input(current_prediction)
 
@@ -95,20 +103,89 @@ def run_single_document_prompt(
         input=formatted_input_document,
         steps=", ".join(formatter.steps),
     )
-    num_input_tokens = chat_model.get_num_tokens(prompt_as_text)
-    if isinstance(chat_model, langchain_openai.ChatOpenAI):
-        res, total_costs, num_input_tokens, num_output_tokens = prompt_openai(
-            chat_model, prompt_as_messages
-        )
-    else:
-        res = chat_model.invoke(prompt_as_messages)
-        num_output_tokens = chat_model.get_num_tokens(str(res.content))
-        total_costs = usage.get_cost_for_tokens(
+    return prompt_as_text, prompt_as_messages
+
+
+# answer, costs, input and output tokens, and retries of a single request
+_Invocation = typing.Tuple[
+    typing.Optional[BaseMessage], float, int, int, retry.RetryStats
+]
+
+
+@dataclasses.dataclass
+class _PreparedPrompt:
+    prompt_as_text: str
+    prompt_as_messages: PromptValue
+    cache_key: typing.Optional[str]
+
+
+def _prepare_prompt(
+    current_prediction: TDocument,
+    formatter: format.BaseFormattingStrategy[TDocument],
+    example_docs: typing.List[TDocument],
+    chat_model: BaseChatModel,
+    model_name: str,
+    dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache],
+) -> _PreparedPrompt:
+    prompt_as_text, prompt_as_messages = _render_prompt(
+        current_prediction, formatter, example_docs
+    )
+
+    cache_key = None
+    if response_cache is not None and not dry_run:
+        cache_key = response_cache.key(
             model_name=model_name,
-            num_input_tokens=num_input_tokens,
-            num_output_tokens=num_output_tokens,
+            temperature=getattr(chat_model, "temperature", -1.0),
+            prompt_as_messages=prompt_as_messages,
+            formatter_name=formatter.__class__.__name__,
+            formatter_args=formatter.args,
         )
+    return _PreparedPrompt(prompt_as_text, prompt_as_messages, cache_key)
+
+
+def _lookup_cache(
+    input_document: TDocument,
+    formatter: format.BaseFormattingStrategy[TDocument],
+    prepared: _PreparedPrompt,
+    response_cache: typing.Optional[cache.ResponseCache],
+) -> typing.Optional[model.PromptResult]:
+    if prepared.cache_key is None:
+        return None
+    cached = response_cache.get(prepared.cache_key)
+    if cached is None:
+        return None
+
+    print(f"Using cached answer for request with {cached.input_tokens} tokens.")
+    return model.PromptResult(
+        prompts=[prepared.prompt_as_text],
+        answers=[cached.answer],
+        formatters=[formatter.__class__.__name__],
+        steps=[formatter.steps],
+        original_id=input_document.id,
+        input_tokens=cached.input_tokens,
+        output_tokens=cached.output_tokens,
+        total_costs=cached.total_costs,
+        formatter_args=[formatter.args],
+        cached=[True],
+    )
+
+
+def _dry_run_invocation(model_name: str, prompt_as_text: str) -> _Invocation:
+    # counted offline, tokenizers of chat models may need network access
+    num_input_tokens = planning.count_tokens(model_name, prompt_as_text)
+    return None, 0.0, num_input_tokens, 0, retry.RetryStats()
 
+
+def _finish_prompt(
+    input_document: TDocument,
+    formatter: format.BaseFormattingStrategy[TDocument],
+    prepared: _PreparedPrompt,
+    invocation: _Invocation,
+    dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache],
+) -> model.PromptResult:
+    res, total_costs, num_input_tokens, num_output_tokens, retry_stats = invocation
     if dry_run:
         print(f"Dry run for request with an estimated {num_input_tokens} tokens.")
         answer = "### DRY RUN ###"
@@ -120,8 +197,8 @@ def run_single_document_prompt(
 
         answer = str(res.content)
 
-    return model.PromptResult(
-        prompts=[prompt_as_text],
+    result = model.PromptResult(
+        prompts=[prepared.prompt_as_text],
         answers=[answer],
         formatters=[formatter.__class__.__name__],
         steps=[formatter.steps],
@@ -130,6 +207,215 @@ def run_single_document_prompt(
         output_tokens=num_output_tokens,
         total_costs=total_costs,
         formatter_args=[formatter.args],
+        retries=retry_stats.retries,
+        backoff_seconds=retry_stats.backoff_seconds,
+    )
+
+    if prepared.cache_key is not None:
+        response_cache.put(
+            prepared.cache_key,
+            cache.CachedResponse(
+                answer=result.answers[0],
+                input_tokens=result.input_tokens,
+                output_tokens=result.output_tokens,
+                total_costs=result.total_costs,
+            ),
+        )
+    return result
+
+
+def _account_invocation(
+    chat_model: BaseChatModel,
+    model_name: str,
+    num_input_tokens: int,
+    rate_limiter: typing.Optional[ratelimit.RateLimiter],
+    res: BaseMessage,
+    cb: langchain_community.callbacks.OpenAICallbackHandler,
+) -> typing.Tuple[BaseMessage, float, int, int]:
+    """
+    Prices the answer to a request and settles the estimated input tokens
+    of the request with the rate limiter.
+    """
+    if isinstance(chat_model, langchain_openai.ChatOpenAI):
+        # token counts as reported by the api
+        num_used_input_tokens = cb.prompt_tokens
+        num_output_tokens = cb.completion_tokens
+        priced_model_name = chat_model.model_name
+    else:
+        num_used_input_tokens = num_input_tokens
+        num_output_tokens = chat_model.get_num_tokens(str(res.content))
+        priced_model_name = replay.recorded_model_name(model_name)
+    total_costs = usage.get_cost_for_tokens(
+        model_name=priced_model_name,
+        num_input_tokens=num_used_input_tokens,
+        num_output_tokens=num_output_tokens,
+    )
+
+    if rate_limiter is not None:
+        rate_limiter.settle(num_input_tokens, num_used_input_tokens + num_output_tokens)
+    return res, total_costs, num_used_input_tokens, num_output_tokens
+
+
+def _invoke_once(
+    chat_model: BaseChatModel,
+    model_name: str,
+    prompt_as_messages: PromptValue,
+    num_input_tokens: int,
+) -> typing.Tuple[BaseMessage, float, int, int]:
+    rate_limiter = ratelimit.get_rate_limiter(model_name)
+    if rate_limiter is not None:
+        rate_limiter.acquire(num_input_tokens)
+    with langchain_community.callbacks.get_openai_callback() as cb:
+        res = chat_model.invoke(prompt_as_messages)
+    return _account_invocation(
+        chat_model, model_name, num_input_tokens, rate_limiter, res, cb
+    )
+
+
+async def _ainvoke_once(
+    chat_model: BaseChatModel,
+    model_name: str,
+    prompt_as_messages: PromptValue,
+    num_input_tokens: int,
+) -> typing.Tuple[BaseMessage, float, int, int]:
+    rate_limiter = ratelimit.get_rate_limiter(model_name)
+    if rate_limiter is not None:
+        await rate_limiter.aacquire(num_input_tokens)
+    with langchain_community.callbacks.get_openai_callback() as cb:
+        res = await chat_model.ainvoke(prompt_as_messages)
+    return _account_invocation(
+        chat_model, model_name, num_input_tokens, rate_limiter, res, cb
+    )
+
+
+def _retry_options(
+    model_name: str,
+) -> typing.Tuple[retry.RetryPolicy, retry.CircuitBreaker]:
+    return retry.default_policy, retry.get_circuit_breaker(
+        provider_for_name(model_name)
+    )
+
+
+def _invoke(
+    chat_model: BaseChatModel,
+    model_name: str,
+    prompt_as_messages: PromptValue,
+    num_input_tokens: int,
+) -> _Invocation:
+    answer, retry_stats = retry.call_with_retry(
+        lambda: _invoke_once(
+            chat_model, model_name, prompt_as_messages, num_input_tokens
+        ),
+        *_retry_options(model_name),
+    )
+    return (*answer, retry_stats)
+
+
+async def _ainvoke(
+    chat_model: BaseChatModel,
+    model_name: str,
+    prompt_as_messages: PromptValue,
+    num_input_tokens: int,
+) -> _Invocation:
+    answer, retry_stats = await retry.acall_with_retry(
+        lambda: _ainvoke_once(
+            chat_model, model_name, prompt_as_messages, num_input_tokens
+        ),
+        *_retry_options(model_name),
+    )
+    return (*answer, retry_stats)
+
+
+def run_single_document_prompt(
+    input_document: TDocument,
+    current_prediction: TDocument,
+    formatter: format.BaseFormattingStrategy[TDocument],
+    example_docs: typing.List[TDocument],
+    chat_model: BaseChatModel,
+    model_name: str,
+    dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+) -> model.PromptResult:
+    print(f"Running prompt for {input_document.id} ...")
+
+    prepared = _prepare_prompt(
+        current_prediction,
+        formatter,
+        example_docs,
+        chat_model,
+        model_name,
+        dry_run,
+        response_cache,
+    )
+    cached = _lookup_cache(input_document, formatter, prepared, response_cache)
+    if cached is not None:
+        return cached
+
+    if dry_run:
+        invocation = _dry_run_invocation(model_name, prepared.prompt_as_text)
+    else:
+        invocation = _invoke(
+            chat_model,
+            model_name,
+            prepared.prompt_as_messages,
+            chat_model.get_num_tokens(prepared.prompt_as_text),
+        )
+
+    return _finish_prompt(
+        input_document, formatter, prepared, invocation, dry_run, response_cache
+    )
+
+
+async def arun_single_document_prompt(
+    input_document: TDocument,
+    current_prediction: TDocument,
+    formatter: format.BaseFormattingStrategy[TDocument],
+    example_docs: typing.List[TDocument],
+    chat_model: BaseChatModel,
+    model_name: str,
+    dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+) -> model.PromptResult:
+    """
+    Same as run_single_document_prompt, but awaits the model. Reading and
+    writing the response cache runs in a thread, so other prompts can make
+    progress in the meantime.
+    """
+    print(f"Running prompt for {input_document.id} ...")
+
+    prepared = _prepare_prompt(
+        current_prediction,
+        formatter,
+        example_docs,
+        chat_model,
+        model_name,
+        dry_run,
+        response_cache,
+    )
+    cached = await asyncio.to_thread(
+        _lookup_cache, input_document, formatter, prepared, response_cache
+    )
+    if cached is not None:
+        return cached
+
+    if dry_run:
+        invocation = _dry_run_invocation(model_name, prepared.prompt_as_text)
+    else:
+        invocation = await _ainvoke(
+            chat_model,
+            model_name,
+            prepared.prompt_as_messages,
+            chat_model.get_num_tokens(prepared.prompt_as_text),
+        )
+
+    return await asyncio.to_thread(
+        _finish_prompt,
+        input_document,
+        formatter,
+        prepared,
+        invocation,
+        dry_run,
+        response_cache,
     )
 
 
@@ -158,38 +444,62 @@ def experiment(
     num_shots: int,
     dry_run: bool,
     folds: typing.List[typing.Dict[str, typing.List[str]]] = None,
+    max_concurrency: typing.Optional[int] = None,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+    batch_directory: typing.Optional[str] = None,
 ):
-    documents = importer.do_import()
-
-    saved_experiment_results: typing.List[model.ExperimentResult]
-    if not os.path.isfile(storage):
-        saved_experiment_results = []
-    else:
-        with open(storage, "r", encoding="utf8") as f:
-            raw = json.load(f)
-            saved_experiment_results = [
-                model.ExperimentResult.from_dict(e) for e in raw
-            ]
+    """
+    Runs all formatters on the test documents of every fold. Each finished
+    document is appended to a checkpoint log next to the storage file, which
+    is also used to skip documents that were run already. With more than one
+    formatter, every finished step is logged too, and unfinished documents
+    continue after their last logged step. Once done, the log is compacted
+    into the storage file.
+
+    :param max_concurrency: if set, documents of all folds are run concurrently
+    via the asynchronous model api, with at most this many prompts in flight
+    at any time. Steps of iterative formatters are pipelined, i.e. different
+    documents can be at different steps. Results are stored in the order of
+    the fold's test documents nonetheless. If not set, documents are run one
+    after another.
+    :param response_cache: if set, answers to prompts that were sent before
+    are taken from this cache, instead of querying the model again.
+    :param batch_directory: if set, the model is not queried at all, instead
+    the prompts are written as a request file for the OpenAI batch api to
+    this directory, models of other providers are rejected. Running the
+    experiment again, once the file with their results is stored in the same
+    directory, advances all documents by one step, and writes requests for
+    the next step, until all are done.
+    """
+    log = checkpoint.CheckpointLog(storage)
+    saved_experiment_results = log.load()
 
     if folds is None:
         # experiment with no training documents
+        documents = importer.do_import()
         folds = [{"train": [], "test": [d.id for d in documents]}]
         num_shots = 0
+    else:
+        # only build the documents the folds use
+        fold_ids = set(i for f in folds for i in f["train"] + f["test"])
+        documents = list(importer.iter_documents(fold_ids))
 
     documents_by_id = {d.id: d for d in documents}
-    for fold_id, fold in tqdm.tqdm(enumerate(folds), total=len(folds)):
+    pending: typing.List[
+        typing.Tuple[int, typing.List[TDocument], typing.List[TDocument]]
+    ] = []
+    for fold_id, fold in enumerate(folds):
         if fold_id == len(saved_experiment_results):
             temperature = getattr(chat_model, "temperature", -1.0)
+            meta = model.RunMeta(
+                num_shots=num_shots,
+                model=model_name,
+                temperature=temperature,
+            )
             saved_experiment_results.append(
-                model.ExperimentResult(
-                    meta=model.RunMeta(
-                        num_shots=num_shots,
-                        model=model_name,
-                        temperature=temperature,
-                    ),
-                    results=[],
-                )
+                model.ExperimentResult(meta=meta, results=[])
             )
+            log.append_meta(fold_id, meta)
         current_save_fold = saved_experiment_results[fold_id]
 
         documents_already_run = [r.original_id for r in current_save_fold.results]
@@ -201,24 +511,131 @@ def experiment(
         example_docs = [documents_by_id[i] for i in fold["train"]]
         input_docs = [documents_by_id[i] for i in fold["test"]]
         input_docs = [d for d in input_docs if d.id not in documents_already_run]
+        pending.append((fold_id, example_docs, input_docs))
+
+    try:
+        if batch_directory is not None:
+            assert not dry_run, "Batch mode does not support dry runs."
+            batch.run_batch_round(
+                pending,
+                folds,
+                formatters,
+                model_name=model_name,
+                temperature=getattr(chat_model, "temperature", None),
+                log=log,
+                batch_directory=batch_directory,
+            )
+        elif max_concurrency is None:
+            for fold_id, example_docs, input_docs in tqdm.tqdm(pending):
+                on_step = None
+                if len(formatters) > 1:
+                    on_step = functools.partial(log.append_step, fold_id)
+                result_iterator = iterative.run_multiple_iterative_document_prompts(
+                    input_documents=input_docs,
+                    formatters=formatters,
+                    chat_model=chat_model,
+                    example_docs=example_docs,
+                    model_name=model_name,
+                    dry_run=dry_run,
+                    response_cache=response_cache,
+                    completed_steps=log.steps(fold_id),
+                    on_step=on_step,
+                )
+
+                for result in result_iterator:
+                    position = folds[fold_id]["test"].index(result.original_id)
+                    log.append_result(fold_id, result, position)
+        else:
+            asyncio.run(
+                _run_experiment_concurrently(
+                    pending,
+                    folds,
+                    formatters,
+                    model_name=model_name,
+                    chat_model=chat_model,
+                    log=log,
+                    dry_run=dry_run,
+                    max_concurrency=max_concurrency,
+                    response_cache=response_cache,
+                )
+            )
+    finally:
+        log.compact()
+        templates.prompt_templates.print_stats()
+        templates.prompt_templates.clear()
+        if response_cache is not None:
+            response_cache.print_stats()
+
+
+async def _run_experiment_concurrently(
+    pending: typing.List[
+        typing.Tuple[int, typing.List[TDocument], typing.List[TDocument]]
+    ],
+    folds: typing.List[typing.Dict[str, typing.List[str]]],
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    *,
+    model_name: str,
+    chat_model: BaseChatModel,
+    log: checkpoint.CheckpointLog,
+    dry_run: bool,
+    max_concurrency: int,
+    response_cache: typing.Optional[cache.ResponseCache],
+):
+    jobs = [
+        ((fold_id, d.id), d, example_docs)
+        for fold_id, example_docs, input_docs in pending
+        for d in input_docs
+    ]
+    completed_steps = {
+        (fold_id, document_id): document_steps
+        for fold_id, _, _ in pending
+        for document_id, document_steps in log.steps(fold_id).items()
+    }
+
+    def on_step(key: typing.Tuple[int, str], step: int, result: model.PromptResult):
+        log.append_step(key[0], key[1], step, result)
+
+    results = iterative.arun_pipelined_document_prompts(
+        jobs,
+        formatters,
+        chat_model,
+        model_name,
+        dry_run,
+        max_concurrency,
+        response_cache,
+        completed_steps,
+        on_step if len(formatters) > 1 else None,
+    )
+    with tqdm.tqdm(total=len(jobs)) as progress:
+        async for (fold_id, _), result in results:
+            position = folds[fold_id]["test"].index(result.original_id)
+            # fsyncs, other prompts should not wait for it
+            await asyncio.to_thread(log.append_result, fold_id, result, position)
+            progress.update()
 
-        result_iterator = iterative.run_multiple_iterative_document_prompts(
-            input_documents=input_docs,
-            formatters=formatters,
-            chat_model=chat_model,
-            example_docs=example_docs,
-            model_name=model_name,
-            dry_run=dry_run,
-        )
 
-        for result in result_iterator:
-            current_save_fold.results.append(result)
-            os.makedirs(os.path.dirname(storage), exist_ok=True)
-            with open(storage, "w", encoding="utf8") as f:
-                json.dump([r.to_dict() for r in saved_experiment_results], f)
+def provider_for_name(model_name: str) -> str:
+    if model_name.startswith(replay.REPLAY_PREFIX):
+        return "replay"
+    if model_name.startswith("gpt-"):
+        return "openai"
+    if model_name.startswith("claude-"):
+        return "anthropic"
+    if model_name.startswith("meta-llama/Meta-Llama-3"):
+        return "deepinfra"
+    if model_name.startswith("deepinfra/"):
+        return "deepinfra"
+    if model_name.startswith("mistral"):
+        return "mistral"
+    if model_name.startswith("Qwen/"):
+        return "aimlapi"
+    # unknown models, e.g. for testing, get a circuit breaker of their own
+    return model_name
 
 
 def chat_model_for_name(model_name: str) -> BaseChatModel:
+    if model_name.startswith(replay.REPLAY_PREFIX):
+        return replay.ReplayChatModel(model_name=replay.recorded_model_name(model_name))
     if model_name.startswith("gpt-"):
         return langchain_openai.ChatOpenAI(model_name=model_name, temperature=0)
     if model_name.startswith("claude-"):
@@ -1,12 +1,71 @@
+import asyncio
+import dataclasses
+import functools
+import itertools
+import json
 import typing
 
 from langchain_core.language_models import BaseChatModel
 
 import format
 from data import base
-from experiments import model, common
+from experiments import model, common, cache
 
 TDocument = typing.TypeVar("TDocument", bound=base.DocumentBase)
+TKey = typing.TypeVar("TKey")
+
+
+def _merge_answers(
+    input_document: TDocument,
+    cur_doc: typing.Optional[TDocument],
+    formatter: format.BaseFormattingStrategy[TDocument],
+    result: model.PromptResult,
+) -> TDocument:
+    for answer in result.answers:
+        parsed = formatter.parse(input_document, answer)
+        if cur_doc is None:
+            cur_doc = parsed.document
+        else:
+            cur_doc += parsed.document
+    return cur_doc
+
+
+def _restore_steps(
+    input_document: TDocument,
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    completed_steps: typing.Optional[typing.List[model.PromptResult]],
+) -> typing.Tuple[int, TDocument, typing.Optional[model.PromptResult]]:
+    """
+    Rebuilds the state of a document after the given, previously completed
+    steps, as long as they were run with the same formatters.
+
+    :return: number of restored steps, current document, and merged result
+    """
+    merged_result: typing.Optional[model.PromptResult] = None
+    cur_doc: TDocument = input_document.copy(formatters[0].steps)
+    if completed_steps is None:
+        return 0, cur_doc, merged_result
+    for i, (formatter, result) in enumerate(zip(formatters, completed_steps)):
+        if result.formatters != [formatter.__class__.__name__] or json.dumps(
+            result.formatter_args[0], sort_keys=True
+        ) != json.dumps(formatter.args, sort_keys=True):
+            print(
+                f"Stored step {i + 1} of document {input_document.id} was run "
+                f"with a different formatter, running it again."
+            )
+            return i, cur_doc, merged_result
+        cur_doc = _merge_answers(input_document, cur_doc, formatter, result)
+        if merged_result is None:
+            merged_result = result
+        else:
+            merged_result = merged_result + result
+    num_restored = min(len(completed_steps), len(formatters))
+    if num_restored > 0:
+        print(
+            f"Restored {num_restored}/{len(formatters)} steps "
+            f"of document {input_document.id}."
+        )
+    return num_restored, cur_doc, merged_result
 
 
 def run_iterative_document_prompt(
@@ -16,10 +75,16 @@ def run_iterative_document_prompt(
     chat_model: BaseChatModel,
     model_name: str,
     dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+    completed_steps: typing.Optional[typing.List[model.PromptResult]] = None,
+    on_step: typing.Optional[typing.Callable[[int, model.PromptResult], None]] = None,
 ) -> model.PromptResult:
-    merged_result: typing.Optional[model.PromptResult] = None
-    cur_doc: TDocument = input_document.copy(formatters[0].steps)
+    num_restored, cur_doc, merged_result = _restore_steps(
+        input_document, formatters, completed_steps
+    )
     for i, formatter in enumerate(formatters):
+        if i < num_restored:
+            continue
         if len(formatters) > 1:
             print(
                 f"Running partial prompt {i + 1}/{len(formatters)} ({formatter.__class__.__name__}) for document {input_document.id}"
@@ -32,13 +97,11 @@ def run_iterative_document_prompt(
             chat_model,
             model_name,
             dry_run,
+            response_cache,
         )
-        for answer in result.answers:
-            parsed = formatter.parse(input_document, answer)
-            if cur_doc is None:
-                cur_doc = parsed.document
-            else:
-                cur_doc += parsed.document
+        if on_step is not None:
+            on_step(i, result)
+        cur_doc = _merge_answers(input_document, cur_doc, formatter, result)
         if merged_result is None:
             merged_result = result
         else:
@@ -47,6 +110,152 @@ def run_iterative_document_prompt(
     return merged_result
 
 
+@dataclasses.dataclass
+class _PipelinedDocument(typing.Generic[TKey, TDocument]):
+    key: TKey
+    input_document: TDocument
+    example_docs: typing.List[TDocument]
+    cur_doc: TDocument
+    step: int = 0
+    merged_result: typing.Optional[model.PromptResult] = None
+
+
+async def arun_pipelined_document_prompts(
+    jobs: typing.List[typing.Tuple[TKey, TDocument, typing.List[TDocument]]],
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    chat_model: BaseChatModel,
+    model_name: str,
+    dry_run: bool,
+    max_concurrency: int,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+    completed_steps: typing.Optional[
+        typing.Dict[TKey, typing.List[model.PromptResult]]
+    ] = None,
+    on_step: typing.Optional[
+        typing.Callable[[TKey, int, model.PromptResult], None]
+    ] = None,
+) -> typing.AsyncGenerator[typing.Tuple[TKey, model.PromptResult], None]:
+    """
+    Runs all formatters on all documents, keeping up to max_concurrency
+    prompts in flight at any time. Steps of a single document still run in
+    order, but different documents can be at different steps. Documents
+    that are further along are scheduled first, so they finish early.
+
+    :param jobs: tuples of a key, that is passed through to the results,
+    the input document, and its example documents
+    :param completed_steps: results of steps that were run before, by key,
+    documents continue after the last of them
+    :param on_step: called with key, step index, and result, whenever a
+    step finishes, in a worker thread
+    :return: tuples of key and merged result, as soon as a document finished
+    all its steps
+    """
+    assert max_concurrency > 0
+    ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+    done: asyncio.Queue = asyncio.Queue()
+    sequence = itertools.count()
+
+    num_finished = 0
+    for key, input_document, example_docs in jobs:
+        num_restored, cur_doc, merged_result = _restore_steps(
+            input_document,
+            formatters,
+            None if completed_steps is None else completed_steps.get(key),
+        )
+        pipelined = _PipelinedDocument(
+            key=key,
+            input_document=input_document,
+            example_docs=example_docs,
+            cur_doc=cur_doc,
+            step=num_restored,
+            merged_result=merged_result,
+        )
+        if pipelined.step == len(formatters):
+            done.put_nowait(pipelined)
+            num_finished += 1
+        else:
+            ready.put_nowait((-pipelined.step, next(sequence), pipelined))
+
+    async def worker():
+        while True:
+            _, _, pipelined = await ready.get()
+            if pipelined is None:
+                return
+            try:
+                await _arun_next_step(
+                    pipelined,
+                    formatters,
+                    chat_model,
+                    model_name,
+                    dry_run,
+                    response_cache,
+                    on_step,
+                )
+            except Exception as e:
+                done.put_nowait(e)
+                return
+            if pipelined.step == len(formatters):
+                done.put_nowait(pipelined)
+            else:
+                ready.put_nowait((-pipelined.step, next(sequence), pipelined))
+
+    workers = [
+        asyncio.ensure_future(worker())
+        for _ in range(min(max_concurrency, len(jobs) - num_finished))
+    ]
+    try:
+        for _ in range(len(jobs)):
+            finished = await done.get()
+            if isinstance(finished, Exception):
+                # stop scheduling steps, but let those in flight finish, so
+                # their (paid for) results are passed to on_step
+                for _ in workers:
+                    ready.put_nowait((-len(formatters) - 1, next(sequence), None))
+                await asyncio.gather(*workers, return_exceptions=True)
+                raise finished
+            yield finished.key, finished.merged_result
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+async def _arun_next_step(
+    pipelined: _PipelinedDocument,
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    chat_model: BaseChatModel,
+    model_name: str,
+    dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache],
+    on_step: typing.Optional[typing.Callable[[TKey, int, model.PromptResult], None]],
+):
+    formatter = formatters[pipelined.step]
+    if len(formatters) > 1:
+        print(
+            f"Running partial prompt {pipelined.step + 1}/{len(formatters)} ({formatter.__class__.__name__}) for document {pipelined.input_document.id}"
+        )
+    result = await common.arun_single_document_prompt(
+        pipelined.input_document,
+        pipelined.cur_doc,
+        formatter,
+        pipelined.example_docs,
+        chat_model,
+        model_name,
+        dry_run,
+        response_cache,
+    )
+    if on_step is not None:
+        # usually writes a checkpoint, keep the event loop free meanwhile
+        await asyncio.to_thread(on_step, pipelined.key, pipelined.step, result)
+    pipelined.cur_doc = _merge_answers(
+        pipelined.input_document, pipelined.cur_doc, formatter, result
+    )
+    if pipelined.merged_result is None:
+        pipelined.merged_result = result
+    else:
+        pipelined.merged_result = pipelined.merged_result + result
+    pipelined.step += 1
+
+
 def run_multiple_iterative_document_prompts(
     input_documents: typing.List[TDocument],
     formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
@@ -54,8 +263,26 @@ def run_multiple_iterative_document_prompts(
     chat_model: BaseChatModel,
     model_name: str,
     dry_run: bool,
+    response_cache: typing.Optional[cache.ResponseCache] = None,
+    completed_steps: typing.Optional[
+        typing.Dict[str, typing.List[model.PromptResult]]
+    ] = None,
+    on_step: typing.Optional[
+        typing.Callable[[str, int, model.PromptResult], None]
+    ] = None,
 ) -> typing.Generator[model.PromptResult, None, None]:
     for d in input_documents:
+        document_on_step = None
+        if on_step is not None:
+            document_on_step = functools.partial(on_step, d.id)
         yield run_iterative_document_prompt(
-            d, formatters, example_docs, chat_model, model_name, dry_run
+            d,
+            formatters,
+            example_docs,
+            chat_model,
+            model_name,
+            dry_run,
+            response_cache,
+            None if completed_steps is None else completed_steps.get(d.id),
+            document_on_step,
         )
@@ -13,6 +13,16 @@ class PromptResult:
     total_costs: float
     answers: typing.List[str]
     original_id: str
+    # one flag per answer, true if the answer was taken from a response cache
+    cached: typing.List[bool] = dataclasses.field(default_factory=list)
+    # number of failed model invocations that were retried, and the total
+    # time spent waiting before retrying them
+    retries: int = 0
+    backoff_seconds: float = 0.0
+
+    def __post_init__(self):
+        if len(self.cached) == 0:
+            self.cached = [False] * len(self.answers)
 
     def to_dict(self):
         return self.__dict__
@@ -39,6 +49,10 @@ class PromptResult:
         if formatter_args is None:
             formatter_args = [{}] * len(answers)
 
+        cached = dic.get("cached", None)
+        if cached is None:
+            cached = [False] * len(answers)
+
         return PromptResult(
             prompts=prompts,
             input_tokens=dic["input_tokens"],
@@ -49,6 +63,9 @@ class PromptResult:
             formatters=formatters,
             formatter_args=formatter_args,
             steps=steps,
+            cached=cached,
+            retries=dic.get("retries", 0),
+            backoff_seconds=dic.get("backoff_seconds", 0.0),
         )
 
     def __add__(self, other):
@@ -66,6 +83,9 @@ class PromptResult:
             steps=self.steps + other.steps,
             formatters=self.formatters + other.formatters,
             formatter_args=self.formatter_args + other.formatter_args,
+            cached=self.cached + other.cached,
+            retries=self.retries + other.retries,
+            backoff_seconds=self.backoff_seconds + other.backoff_seconds,
         )
 
 
@@ -1,11 +1,16 @@
+import concurrent.futures
+import contextlib
 import dataclasses
+import io
 import json
+import math
 import typing
 
 import data
 import eval
 import experiments
 import format
+from eval import significance
 from format import listing
 
 TDocument = typing.TypeVar("TDocument", bound=data.DocumentBase)
@@ -63,16 +68,18 @@ def parse_costs_from_experiments(
     return costs
 
 
-def parse_experiment(
+def _predict_documents(
     experiment_result: experiments.ExperimentResult,
     importer: data.BaseImporter[TDocument],
-    print_only_tags: typing.Optional[typing.List[str]],
-    verbose: bool,
-) -> typing.Tuple[int, ExperimentStats]:
+) -> typing.Tuple[
+    int, typing.List[str], typing.List[TDocument], typing.List[TDocument]
+]:
     preds: typing.List[TDocument] = []
     truths: typing.List[TDocument] = []
 
-    documents = importer.do_import()
+    documents = importer.iter_documents(
+        set(r.original_id for r in experiment_result.results)
+    )
     documents_by_id = {d.id: d for d in documents}
 
     num_parse_errors = 0
@@ -121,42 +128,99 @@ def parse_experiment(
         truths.append(input_doc)
 
     assert overall_steps is not None
+    return num_parse_errors, overall_steps, preds, truths
 
-    stats = {}
-    if "mentions" in overall_steps:
-        stats_by_tag = eval.mentions_f1_stats(
+
+def _step_table(
+    step: str,
+    preds: typing.List[TDocument],
+    truths: typing.List[TDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool,
+) -> eval.StatsTable:
+    if step == "mentions":
+        return eval.mentions_f1_table(
             predicted_documents=preds,
             ground_truth_documents=truths,
             verbose=verbose,
             print_only_tags=print_only_tags,
         )
-        stats["mentions"] = stats_by_tag
-    if "entities" in overall_steps:
-        stats_by_tag = eval.entity_f1_stats(
+    if step == "entities":
+        return eval.entity_f1_table(
             predicted_documents=preds,
             ground_truth_documents=truths,
             verbose=verbose,
             calculate_only_tags=["Actor", "Activity Data"],
             print_only_tags=print_only_tags,
         )
-        stats["entities"] = stats_by_tag
-    if "relations" in overall_steps:
-        stats_by_tag = eval.relation_f1_stats(
+    if step == "relations":
+        return eval.relation_f1_table(
             predicted_documents=preds,
             ground_truth_documents=truths,
             verbose=verbose,
             print_only_tags=print_only_tags,
         )
-        stats["relations"] = stats_by_tag
-    if "constraints" in overall_steps:
-        stats_by_tag = eval.constraint_f1_stats(
+    if step == "constraints":
+        return eval.constraint_f1_table(
             predicted_documents=preds,
             ground_truth_documents=truths,
             verbose=verbose,
             print_only_tags=print_only_tags,
         )
-        stats["constraints"] = stats_by_tag
-    return num_parse_errors, stats
+    raise ValueError(f"Unknown step {step}.")
+
+
+_evaluated_steps = ["mentions", "entities", "relations", "constraints"]
+
+
+def parse_experiment(
+    experiment_result: experiments.ExperimentResult,
+    importer: data.BaseImporter[TDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool,
+) -> typing.Tuple[int, ExperimentStats]:
+    num_parse_errors, overall_steps, preds, truths = _predict_documents(
+        experiment_result, importer
+    )
+    tables = _evaluate_steps(overall_steps, preds, truths, print_only_tags, verbose)
+    return num_parse_errors, {step: t.stats_by_tag() for step, t in tables.items()}
+
+
+def _evaluate_steps(
+    overall_steps: typing.List[str],
+    preds: typing.List[TDocument],
+    truths: typing.List[TDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool,
+) -> typing.Dict[str, eval.StatsTable]:
+    tables = {}
+    for step in _evaluated_steps:
+        if step in overall_steps:
+            tables[step] = _step_table(step, preds, truths, print_only_tags, verbose)
+    return tables
+
+
+def parse_experiment_tables(
+    experiment_result: experiments.ExperimentResult,
+    importer: data.BaseImporter[TDocument],
+) -> typing.Tuple[int, typing.Dict[str, eval.StatsTable]]:
+    """
+    Same as parse_experiment, but keeps the stats of every document.
+    """
+    num_parse_errors, overall_steps, preds, truths = _predict_documents(
+        experiment_result, importer
+    )
+    tables = _evaluate_steps(overall_steps, preds, truths, None, False)
+    return num_parse_errors, tables
+
+
+def _snapshot(importer: data.BaseImporter[TDocument]) -> data.BaseImporter[TDocument]:
+    # experiments with one fold per document would otherwise import the
+    # whole dataset once per document, documents are shared as parsing
+    # never modifies them
+    if isinstance(importer, data.SnapshotImporter):
+        return importer
+    return data.SnapshotImporter(importer, shared=True)
 
 
 def parse_experiments(
@@ -164,11 +228,25 @@ def parse_experiments(
     importer: data.BaseImporter[TDocument],
     print_only_tags: typing.Optional[typing.List[str]],
     verbose: bool,
+    workers: int = 1,
 ) -> typing.Tuple[int, typing.List[ExperimentStats]]:
+    """
+    :param workers: number of processes experiments are parsed and evaluated
+    in, if there are fewer experiments than workers and verbose is not set,
+    the documents of each experiment are split into chunks. Results and
+    output are the same as when parsing serially, output of each experiment
+    is printed once all its chunks are done.
+    """
     model_name = experiment_results[0].meta.model
     print(
         f"Parsing {len(experiment_results)} experiments, predicted by {model_name}..."
     )
+    importer = _snapshot(importer)
+    if workers > 1:
+        return _parse_experiments_in_pool(
+            experiment_results, importer, print_only_tags, verbose, workers
+        )
+
     fold_stats: typing.List[ExperimentStats] = []
 
     total_parse_errors = 0
@@ -182,21 +260,98 @@ def parse_experiments(
     return total_parse_errors, fold_stats
 
 
+def _parse_experiments_in_pool(
+    experiment_results: typing.List[experiments.ExperimentResult],
+    importer: data.BaseImporter[TDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool,
+    workers: int,
+) -> typing.Tuple[int, typing.List[ExperimentStats]]:
+    # verbose output of evaluation is printed by step, for all documents of
+    # an experiment, which chunks can not reproduce
+    num_chunks = 1 if verbose else math.ceil(workers / len(experiment_results))
+    chunks: typing.List[typing.Tuple[int, experiments.ExperimentResult]] = []
+    for fold_id, experiment in enumerate(experiment_results):
+        chunk_size = max(1, math.ceil(len(experiment.results) / num_chunks))
+        # an empty experiment still gets a chunk, which fails as in serial
+        for start in range(0, max(1, len(experiment.results)), chunk_size):
+            chunk = experiments.ExperimentResult(
+                meta=experiment.meta,
+                results=experiment.results[start : start + chunk_size],
+            )
+            chunks.append((fold_id, chunk))
+
+    fold_tables: typing.List[typing.Dict[str, typing.List[eval.StatsTable]]] = [
+        {} for _ in experiment_results
+    ]
+    total_parse_errors = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _parse_experiment_quietly, chunk, importer, print_only_tags, verbose
+            )
+            for _, chunk in chunks
+        ]
+        # merge in order of submission, so that stats are added up and
+        # output is printed exactly as if parsed serially, i.e. output of
+        # parsing all documents of an experiment before that of evaluating
+        eval_outputs: typing.List[str] = []
+        for i, ((fold_id, _), future) in enumerate(zip(chunks, futures)):
+            num_parse_errors, tables, parse_output, eval_output = future.result()
+            print(parse_output, end="")
+            eval_outputs.append(eval_output)
+            if i + 1 == len(chunks) or chunks[i + 1][0] != fold_id:
+                print("".join(eval_outputs), end="")
+                eval_outputs = []
+            total_parse_errors += num_parse_errors
+            for step, table in tables.items():
+                fold_tables[fold_id].setdefault(step, []).append(table)
+
+    fold_stats: typing.List[ExperimentStats] = [
+        {
+            step: eval.StatsTable.concatenate(step_tables).stats_by_tag()
+            for step, step_tables in tables_by_step.items()
+        }
+        for tables_by_step in fold_tables
+    ]
+    return total_parse_errors, fold_stats
+
+
+def _parse_experiment_quietly(
+    experiment_result: experiments.ExperimentResult,
+    importer: data.BaseImporter[TDocument],
+    print_only_tags: typing.Optional[typing.List[str]],
+    verbose: bool,
+) -> typing.Tuple[int, typing.Dict[str, eval.StatsTable], str, str]:
+    """
+    Same as parse_experiment, but returns stats of every document, and the
+    output of parsing and of evaluating separately, instead of printing them.
+    """
+    parse_output = io.StringIO()
+    with contextlib.redirect_stdout(parse_output):
+        num_parse_errors, overall_steps, preds, truths = _predict_documents(
+            experiment_result, importer
+        )
+    eval_output = io.StringIO()
+    with contextlib.redirect_stdout(eval_output):
+        tables = _evaluate_steps(overall_steps, preds, truths, print_only_tags, verbose)
+    return num_parse_errors, tables, parse_output.getvalue(), eval_output.getvalue()
+
+
 def sum_stats(
     experiment_stats: typing.List[ExperimentStats],
 ) -> typing.Dict[str, typing.Dict[str, eval.Stats]]:
-    total_stats_by_step: typing.Dict[str, typing.Dict[str, eval.Stats]] = {}
-    for stats_by_step in experiment_stats:
+    # stats of every fold are a row of a table per step, summed over its rows
+    stats_by_step_and_fold: typing.Dict[
+        str, typing.Dict[str, typing.Dict[str, eval.Stats]]
+    ] = {}
+    for fold_id, stats_by_step in enumerate(experiment_stats):
         for step, stats in stats_by_step.items():
-            if step not in total_stats_by_step:
-                total_stats_by_step[step] = {}
-            total_stats = total_stats_by_step[step]
-
-            for tag, s in stats.items():
-                if tag not in total_stats:
-                    total_stats[tag] = eval.Stats(0, 0, 0)
-                total_stats[tag] += s
-    return total_stats_by_step
+            stats_by_step_and_fold.setdefault(step, {})[str(fold_id)] = stats
+    return {
+        step: eval.StatsTable.from_stats(stats_by_fold).stats_by_tag()
+        for step, stats_by_fold in stats_by_step_and_fold.items()
+    }
 
 
 def get_num_tokens(results: typing.List[experiments.ExperimentResult]):
@@ -303,6 +458,69 @@ def parse_file(
     return experiment_results
 
 
+def parse_file_tables(
+    result_file: str,
+    importer: data.BaseImporter[TDocument],
+    only_document_ids: typing.List[str] = None,
+) -> typing.Dict[str, eval.StatsTable]:
+    """
+    Stats of every document in the given result file, across all folds.
+    """
+    importer = _snapshot(importer)
+    tables_by_step: typing.Dict[str, typing.List[eval.StatsTable]] = {}
+    for experiment_result in parse_file(result_file, only_document_ids):
+        _, tables = parse_experiment_tables(experiment_result, importer)
+        for step, table in tables.items():
+            tables_by_step.setdefault(step, []).append(table)
+    return {
+        step: eval.StatsTable.concatenate(tables)
+        for step, tables in tables_by_step.items()
+    }
+
+
+def print_significance(
+    result_file_a: str,
+    result_file_b: str,
+    importer: data.BaseImporter[TDocument],
+    strategy: typing.Literal["micro", "macro"] = "micro",
+    num_resamples: int = 10_000,
+    seed: typing.Optional[int] = 42,
+):
+    """
+    Prints bootstrap confidence intervals of the f1 scores of two result
+    files on the same documents, and whether they differ significantly.
+    """
+    tables_a = parse_file_tables(result_file_a, importer)
+    tables_b = parse_file_tables(result_file_b, importer)
+    for step in tables_a:
+        if step not in tables_b:
+            continue
+        print(f"{step} ({strategy} f1, {num_resamples} resamples):")
+        for name, tables in [(result_file_a, tables_a), (result_file_b, tables_b)]:
+            interval = significance.bootstrap_confidence_interval(
+                tables[step], strategy=strategy, num_resamples=num_resamples, seed=seed
+            )
+            print(
+                f"  {name}: {interval.score:.3f} "
+                f"[{interval.low:.3f}, {interval.high:.3f}]"
+            )
+        for test_name, test in [
+            ("paired bootstrap", significance.paired_bootstrap_test),
+            ("permutation", significance.permutation_test),
+        ]:
+            comparison = test(
+                tables_a[step],
+                tables_b[step],
+                strategy=strategy,
+                num_resamples=num_resamples,
+                seed=seed,
+            )
+            print(
+                f"  {test_name}: difference {comparison.difference:+.3f}, "
+                f"p = {comparison.p_value:.4f}"
+            )
+
+
 def print_experiment_results(
     result_file: str,
     importer: data.BaseImporter[TDocument],
@@ -312,6 +530,7 @@ def print_experiment_results(
 ):
     if print_only_tags is not None:
         print_only_tags = [t.lower() for t in print_only_tags]
+    importer = _snapshot(importer)
     experiment_results = parse_file(result_file, only_document_ids)
     num_parse_errors, experiment_stats = parse_experiments(
         experiment_results, importer, print_only_tags, verbose
@@ -0,0 +1,169 @@
+import dataclasses
+import functools
+import typing
+
+import tiktoken
+
+import format
+from data import base
+from experiments import common, templates, usage
+
+TDocument = typing.TypeVar("TDocument", bound=base.DocumentBase)
+
+
+@dataclasses.dataclass
+class PlanEstimate:
+    model: str
+    fold: int
+    num_prompts: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_costs: float = 0.0
+
+    def __add__(self, other):
+        if not isinstance(other, PlanEstimate):
+            raise ValueError()
+        return PlanEstimate(
+            model=self.model,
+            fold=self.fold,
+            num_prompts=self.num_prompts + other.num_prompts,
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            total_costs=self.total_costs + other.total_costs,
+        )
+
+
+# average number of characters per token in english text, used when no
+# tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding_for_model(model_name: str) -> typing.Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # not an openai model, tokenizers of other providers are similar
+            # enough for estimating costs
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its encodings on first use
+        print(
+            f"Could not load tokenizer for {model_name} ({e!r}), "
+            f"estimating {CHARS_PER_TOKEN} characters per token instead."
+        )
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def count_tokens(model_name: str, text: str) -> int:
+    encoding = _encoding_for_model(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def plan_experiment(
+    documents: typing.List[TDocument],
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    *,
+    model_names: typing.List[str],
+    folds: typing.List[typing.Dict[str, typing.List[str]]] = None,
+    token_counter: typing.Callable[[str, str], int] = count_tokens,
+) -> typing.List[PlanEstimate]:
+    """
+    Estimates tokens and costs of running an experiment, without querying
+    any model. Every prompt is rendered exactly as experiment would, the
+    answer of each step is assumed to be the formatted gold document, which
+    is also what later steps of iterative formatters get as input.
+
+    :param token_counter: counts tokens of a text for the given model name,
+    defaults to a local tiktoken tokenizer
+    :return: one estimate per model and fold, costs are nan for models
+    without known prices
+    """
+    if folds is None:
+        folds = [{"train": [], "test": [d.id for d in documents]}]
+
+    documents_by_id = {d.id: d for d in documents}
+    estimates = []
+    try:
+        for model_name in model_names:
+            for fold_id, fold in enumerate(folds):
+                estimate = PlanEstimate(model=model_name, fold=fold_id)
+                example_docs = [documents_by_id[i] for i in fold["train"]]
+                for document_id in fold["test"]:
+                    estimate += _plan_document(
+                        documents_by_id[document_id],
+                        formatters,
+                        example_docs,
+                        model_name,
+                        fold_id,
+                        token_counter,
+                    )
+                estimates.append(estimate)
+    finally:
+        templates.prompt_templates.clear()
+    return estimates
+
+
+def _plan_document(
+    document: TDocument,
+    formatters: typing.List[format.BaseFormattingStrategy[TDocument]],
+    example_docs: typing.List[TDocument],
+    model_name: str,
+    fold_id: int,
+    token_counter: typing.Callable[[str, str], int],
+) -> PlanEstimate:
+    estimate = PlanEstimate(model=model_name, fold=fold_id)
+    cur_doc: TDocument = document.copy(formatters[0].steps)
+    for formatter in formatters:
+        prompt_as_text, _ = common._render_prompt(cur_doc, formatter, example_docs)
+        expected_answer = formatter.output(document)
+        num_input_tokens = token_counter(model_name, prompt_as_text)
+        num_output_tokens = token_counter(model_name, expected_answer)
+        total_costs = float("nan")
+        if model_name in usage.prices:
+            total_costs = usage.get_cost_for_tokens(
+                model_name=model_name,
+                num_input_tokens=num_input_tokens,
+                num_output_tokens=num_output_tokens,
+            )
+        estimate += PlanEstimate(
+            model=model_name,
+            fold=fold_id,
+            num_prompts=1,
+            input_tokens=num_input_tokens,
+            output_tokens=num_output_tokens,
+            total_costs=total_costs,
+        )
+        cur_doc += formatter.parse(document, expected_answer).document
+    return estimate
+
+
+def print_plan(estimates: typing.List[PlanEstimate]):
+    print(
+        f"{'model':<40} {'fold':>5} {'prompts':>8} "
+        f"{'input tokens':>13} {'output tokens':>14} {'costs':>10}"
+    )
+    totals: typing.Dict[str, PlanEstimate] = {}
+    for estimate in estimates:
+        _print_estimate(estimate, str(estimate.fold))
+        if estimate.model not in totals:
+            totals[estimate.model] = PlanEstimate(model=estimate.model, fold=-1)
+        totals[estimate.model] += estimate
+    print("-" * 95)
+    for total in totals.values():
+        _print_estimate(total, "all")
+
+
+def _print_estimate(estimate: PlanEstimate, fold: str):
+    print(
+        f"{estimate.model:<40} {fold:>5} {estimate.num_prompts:>8} "
+        f"{estimate.input_tokens:>13} {estimate.output_tokens:>14} "
+        f"{estimate.total_costs:>10.2f}"
+    )
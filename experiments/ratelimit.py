@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+import typing
+
+from experiments import usage
+
+
+class TokenBucket:
+    """
+    Bucket that refills continuously up to its capacity. Reservations are
+    always granted, but may leave the bucket in debt, the returned number of
+    seconds is the time the caller has to wait until its reservation is covered.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self._capacity = capacity
+        self._refill_per_second = refill_per_second
+        self._clock = clock
+        self._level = capacity
+        self._last_refill = clock()
+
+    def reserve(self, amount: float) -> float:
+        now = self._clock()
+        self._level = min(
+            self._capacity,
+            self._level + (now - self._last_refill) * self._refill_per_second,
+        )
+        self._last_refill = now
+        self._level -= amount
+        if self._level >= 0:
+            return 0.0
+        return -self._level / self._refill_per_second
+
+    def adjust(self, amount: float):
+        self._level -= amount
+
+
+class RateLimiter:
+    """
+    Limits requests and tokens per minute for a single model. Shared by all
+    threads and event loops that send requests to this model.
+    """
+
+    def __init__(
+        self,
+        limit: usage.RateLimit,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self._lock = threading.Lock()
+        self._requests: typing.Optional[TokenBucket] = None
+        if limit.requests_per_minute is not None:
+            self._requests = TokenBucket(
+                limit.requests_per_minute, limit.requests_per_minute / 60.0, clock
+            )
+        self._tokens: typing.Optional[TokenBucket] = None
+        if limit.tokens_per_minute is not None:
+            self._tokens = TokenBucket(
+                limit.tokens_per_minute, limit.tokens_per_minute / 60.0, clock
+            )
+
+    def reserve(self, num_tokens: int) -> float:
+        """
+        Reserves capacity for a single request with the given number of
+        (estimated) tokens.
+
+        :return: seconds to wait before sending the request
+        """
+        wait = 0.0
+        with self._lock:
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(num_tokens))
+        return wait
+
+    def acquire(self, num_tokens: int) -> float:
+        wait = self.reserve(num_tokens)
+        if wait > 0:
+            print(f"Rate limit reached, waiting {wait:.1f}s before sending request.")
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, num_tokens: int) -> float:
+        wait = self.reserve(num_tokens)
+        if wait > 0:
+            print(f"Rate limit reached, waiting {wait:.1f}s before sending request.")
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, num_reserved_tokens: int, num_used_tokens: int):
+        """
+        Corrects the reservation of a finished request, once the number of
+        tokens it actually used, including the output, is known.
+        """
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.adjust(num_used_tokens - num_reserved_tokens)
+
+
+_rate_limiters: typing.Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str) -> typing.Optional[RateLimiter]:
+    if model_name not in usage.rate_limits:
+        return None
+    with _rate_limiters_lock:
+        if model_name not in _rate_limiters:
+            _rate_limiters[model_name] = RateLimiter(usage.rate_limits[model_name])
+        return _rate_limiters[model_name]
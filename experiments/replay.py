@@ -0,0 +1,147 @@
+import asyncio
+import dataclasses
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import typing
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from experiments import model, planning
+
+REPLAY_PREFIX = "replay:"
+
+
+def prompt_hash(prompt_as_text: str) -> str:
+    return hashlib.sha256(prompt_as_text.encode("utf8")).hexdigest()
+
+
+def recorded_model_name(model_name: str) -> str:
+    """
+    Name of the model whose answers are replayed, e.g. for looking up prices.
+    """
+    if model_name.startswith(REPLAY_PREFIX):
+        return model_name[len(REPLAY_PREFIX) :]
+    return model_name
+
+
+@dataclasses.dataclass
+class ReplayIndex:
+    # answer given to each prompt, by hash of the prompt
+    answers: typing.Dict[str, str] = dataclasses.field(default_factory=dict)
+    # recorded number of tokens, by hash of the prompt or answer
+    num_tokens: typing.Dict[str, int] = dataclasses.field(default_factory=dict)
+
+
+def build_index(directory: str, model_name: typing.Optional[str] = None) -> ReplayIndex:
+    """
+    Reads all experiment results stored below the given directory, and maps
+    the hash of every prompt to the answer that was given to it. If the
+    same prompt was answered several times, the answer stored last wins.
+    Token counts are only stored per result, so they are indexed for
+    results of a single prompt only.
+
+    :param model_name: only read results of this model, all models if None
+    """
+    index = ReplayIndex()
+    paths = sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True))
+    for path in paths:
+        with open(path, "r", encoding="utf8") as f:
+            raw = json.load(f)
+        for raw_experiment_result in raw:
+            if model_name is not None:
+                if raw_experiment_result["meta"]["model"] != model_name:
+                    continue
+            experiment_result = model.ExperimentResult.from_dict(raw_experiment_result)
+            for result in experiment_result.results:
+                for prompt, answer in zip(result.prompts, result.answers):
+                    index.answers[prompt_hash(prompt)] = answer
+                if len(result.prompts) == 1 and len(result.answers) == 1:
+                    index.num_tokens[prompt_hash(result.prompts[0])] = (
+                        result.input_tokens
+                    )
+                    index.num_tokens[prompt_hash(result.answers[0])] = (
+                        result.output_tokens
+                    )
+    return index
+
+
+def lognormal_latency(
+    median_seconds: float, sigma: float = 0.5, seed: typing.Optional[int] = None
+) -> typing.Callable[[], float]:
+    """
+    Latency distribution with a long tail, as is typical for model apis.
+    """
+    rng = random.Random(seed)
+    mu = math.log(median_seconds)
+    return lambda: rng.lognormvariate(mu, sigma)
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Chat model that answers prompts with the answers stored in experiment
+    results, e.g. in res/answers, without any network access. Prompts are
+    looked up by the hash of their text, which is what experiments store
+    as prompt. Unknown prompts raise a KeyError. Token counts are taken from
+    the stored results where possible, and estimated offline otherwise.
+    """
+
+    model_name: str
+    directory: str = "res/answers"
+    temperature: float = 0.0
+    # samples the simulated duration of a single request in seconds
+    latency: typing.Optional[typing.Callable[[], float]] = None
+
+    _index: typing.Optional[ReplayIndex] = PrivateAttr(default=None)
+    _index_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @property
+    def index(self) -> ReplayIndex:
+        with self._index_lock:
+            if self._index is None:
+                start = time.perf_counter()
+                self._index = build_index(self.directory, self.model_name)
+                print(
+                    f"Indexed {len(self._index.answers)} stored answers of {self.model_name} "
+                    f"in {time.perf_counter() - start:.1f}s."
+                )
+            return self._index
+
+    def get_num_tokens(self, text: str) -> int:
+        num_tokens = self.index.num_tokens.get(prompt_hash(text))
+        if num_tokens is None:
+            return planning.estimate_tokens(text)
+        return num_tokens
+
+    def _answer(self, messages: typing.List[BaseMessage]) -> ChatResult:
+        prompt_as_text = get_buffer_string(messages)
+        key = prompt_hash(prompt_as_text)
+        if key not in self.index.answers:
+            raise KeyError(
+                f"No stored answer of {self.model_name} for prompt "
+                f"'{prompt_as_text[-200:]}'"
+            )
+        message = AIMessage(content=self.index.answers[key])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency is not None:
+            time.sleep(self.latency())
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency is not None:
+            await asyncio.sleep(self.latency())
+        return self._answer(messages)
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import dataclasses
+import itertools
+import random
+import threading
+import time
+import typing
+
+import anthropic
+import httpx
+import openai
+
+T = typing.TypeVar("T")
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    anthropic.RateLimitError,
+    anthropic.APITimeoutError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decides if an error raised while invoking a model is transient, i.e.
+    caused by rate limits, timeouts, connection problems, or server errors,
+    so that sending the same request again may succeed.
+    """
+    if isinstance(error, _RETRYABLE_ERRORS):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code in _RETRYABLE_STATUS_CODES
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    max_attempts: int = 6
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    # fraction of each delay that is randomized, so that concurrent requests
+    # failing at the same time do not all retry at the same time again
+    jitter: float = 0.5
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of the failed attempt, starting at 1
+        :return: seconds to wait before the next attempt
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the most recent requests to a single provider.
+    If too many of them failed, dispatching further requests is paused for
+    cooldown seconds. After that a single request is dispatched as probe,
+    while all others keep waiting. If the probe succeeds, the breaker closes,
+    if it fails, the breaker opens for another cooldown. Failures of requests
+    that were dispatched before the breaker opened are ignored, as long as
+    it is open.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_requests: int = 5,
+        failure_threshold: float = 0.5,
+        cooldown: float = 30.0,
+        clock: typing.Callable[[], float] = time.monotonic,
+        probe_interval: float = 1.0,
+    ):
+        """
+        :param probe_interval: seconds between checks of requests waiting for
+        the outcome of the probe
+        """
+        self._outcomes: typing.Deque[bool] = collections.deque(maxlen=window)
+        self._min_requests = min_requests
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._clock = clock
+        self._probe_interval = probe_interval
+        self._open_until: typing.Optional[float] = None
+        # until when the probe dispatched after a cooldown may report back,
+        # another request is dispatched as probe, if it does not
+        self._probe_until: typing.Optional[float] = None
+        # ticket of the request that was dispatched as probe
+        self._probe: typing.Optional[int] = None
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            if self._open_until is None:
+                return False
+            now = self._clock()
+            if now < self._open_until:
+                return True
+            return self._probe_until is not None and now < self._probe_until
+
+    def wait_time(self) -> float:
+        return self.dispatch()[0]
+
+    def dispatch(self) -> typing.Tuple[float, typing.Optional[int]]:
+        """
+        Seconds to wait before dispatching a request, callers have to ask
+        again after waiting. Once the cooldown is over, the first caller is
+        dispatched as probe.
+
+        :return: seconds to wait, and if that is 0, a ticket to pass to
+        record_failure, if the request fails
+        """
+        with self._lock:
+            if self._open_until is None:
+                return 0.0, next(self._tickets)
+            now = self._clock()
+            if now < self._open_until:
+                return self._open_until - now, None
+            if self._probe_until is None or now >= self._probe_until:
+                self._probe_until = now + self._cooldown
+                self._probe = next(self._tickets)
+                return 0.0, self._probe
+            return min(self._probe_interval, self._probe_until - now), None
+
+    def record_success(self):
+        with self._lock:
+            self._open_until = None
+            self._probe_until = None
+            self._probe = None
+            self._outcomes.append(True)
+
+    def record_failure(self, ticket: typing.Optional[int] = None):
+        """
+        :param ticket: as returned by dispatch for the failed request
+        """
+        with self._lock:
+            if self._open_until is not None:
+                if ticket is None or ticket != self._probe:
+                    # dispatched before the breaker opened, only the outcome
+                    # of the probe tells if the provider recovered
+                    return
+                self._open(reason="request after cooldown failed")
+                return
+            self._outcomes.append(False)
+            num_failures = self._outcomes.count(False)
+            if len(self._outcomes) < self._min_requests:
+                return
+            if num_failures / len(self._outcomes) >= self._failure_threshold:
+                self._open(
+                    reason=f"{num_failures} of the last "
+                    f"{len(self._outcomes)} requests failed"
+                )
+
+    def _open(self, reason: str):
+        print(f"Circuit breaker opened for {self._cooldown:.0f}s, {reason}.")
+        self._open_until = self._clock() + self._cooldown
+        self._probe_until = None
+        self._probe = None
+        self._outcomes.clear()
+
+
+@dataclasses.dataclass
+class RetryStats:
+    retries: int = 0
+    backoff_seconds: float = 0.0
+
+
+def call_with_retry(
+    fn: typing.Callable[[], T],
+    policy: RetryPolicy,
+    breaker: typing.Optional[CircuitBreaker] = None,
+    sleep: typing.Callable[[float], None] = time.sleep,
+) -> typing.Tuple[T, RetryStats]:
+    stats = RetryStats()
+    for attempt in range(1, policy.max_attempts + 1):
+        ticket = None
+        if breaker is not None:
+            wait, ticket = breaker.dispatch()
+            while wait > 0:
+                sleep(wait)
+                stats.backoff_seconds += wait
+                wait, ticket = breaker.dispatch()
+        try:
+            result = fn()
+        except Exception as e:
+            if not _on_failure(e, attempt, policy, breaker, ticket):
+                raise
+            delay = policy.delay(attempt)
+            sleep(delay)
+            stats.retries += 1
+            stats.backoff_seconds += delay
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result, stats
+    raise AssertionError("unreachable")
+
+
+async def acall_with_retry(
+    fn: typing.Callable[[], typing.Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: typing.Optional[CircuitBreaker] = None,
+) -> typing.Tuple[T, RetryStats]:
+    stats = RetryStats()
+    for attempt in range(1, policy.max_attempts + 1):
+        ticket = None
+        if breaker is not None:
+            wait, ticket = breaker.dispatch()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                stats.backoff_seconds += wait
+                wait, ticket = breaker.dispatch()
+        try:
+            result = await fn()
+        except Exception as e:
+            if not _on_failure(e, attempt, policy, breaker, ticket):
+                raise
+            delay = policy.delay(attempt)
+            await asyncio.sleep(delay)
+            stats.retries += 1
+            stats.backoff_seconds += delay
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result, stats
+    raise AssertionError("unreachable")
+
+
+def _on_failure(
+    error: Exception,
+    attempt: int,
+    policy: RetryPolicy,
+    breaker: typing.Optional[CircuitBreaker],
+    ticket: typing.Optional[int],
+) -> bool:
+    """
+    Records a failed attempt and decides if it should be retried.
+    """
+    if not is_retryable(error):
+        return False
+    if breaker is not None:
+        breaker.record_failure(ticket)
+    if attempt >= policy.max_attempts:
+        print(f"Giving up after {attempt} attempts, last error: {error!r}")
+        return False
+    print(f"Attempt {attempt} failed with {error!r}, retrying ...")
+    return True
+
+
+default_policy = RetryPolicy()
+
+_circuit_breakers: typing.Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if provider not in _circuit_breakers:
+            _circuit_breakers[provider] = CircuitBreaker()
+        return _circuit_breakers[provider]
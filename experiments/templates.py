@@ -0,0 +1,85 @@
+import hashlib
+import json
+import time
+import typing
+
+from langchain_core import prompts
+
+import format
+from data import base
+
+TDocument = typing.TypeVar("TDocument", bound=base.DocumentBase)
+
+
+class PromptTemplateCache:
+    """
+    Keeps the few shot prompt template of every formatter and set of example
+    documents, so it is built once per fold and formatter, instead of once
+    per document and step. Templates are identified by formatter class,
+    formatter args, steps, and the content of the example documents, as ids
+    may be reused by other importers. Templates are kept until cleared,
+    which experiment does once it is done.
+    """
+
+    def __init__(self):
+        self._templates: typing.Dict[
+            typing.Tuple, typing.Tuple[prompts.ChatPromptTemplate, float]
+        ] = {}
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(
+        formatter: format.BaseFormattingStrategy[TDocument],
+        example_docs: typing.List[TDocument],
+    ) -> typing.Tuple:
+        return (
+            formatter.__class__.__name__,
+            json.dumps(formatter.args, sort_keys=True, default=str),
+            tuple(formatter.steps),
+            tuple(_content_key(d) for d in example_docs),
+        )
+
+    def get(
+        self,
+        formatter: format.BaseFormattingStrategy[TDocument],
+        example_docs: typing.List[TDocument],
+        build: typing.Callable[
+            [format.BaseFormattingStrategy[TDocument], typing.List[TDocument]],
+            prompts.ChatPromptTemplate,
+        ],
+    ) -> prompts.ChatPromptTemplate:
+        key = self.key(formatter, example_docs)
+        if key in self._templates:
+            template, build_seconds = self._templates[key]
+            self.hits += 1
+            self.saved_seconds += build_seconds
+            return template
+
+        start = time.perf_counter()
+        template = build(formatter, example_docs)
+        build_seconds = time.perf_counter() - start
+        self._templates[key] = (template, build_seconds)
+        self.misses += 1
+        self.build_seconds += build_seconds
+        return template
+
+    def clear(self):
+        self._templates.clear()
+
+    def print_stats(self):
+        print(
+            f"Prompt templates: built {self.misses} in {self.build_seconds:.2f}s, "
+            f"reused {self.hits} times, saving an estimated "
+            f"{self.saved_seconds:.2f}s of prompt construction."
+        )
+
+
+def _content_key(document: TDocument) -> str:
+    # repr covers all fields of a document, except derived ones like indices
+    return hashlib.sha256(repr(document).encode("utf8")).hexdigest()
+
+
+prompt_templates = PromptTemplateCache()
@@ -34,3 +34,38 @@ def get_cost_for_tokens(
         num_input_tokens / 1000.0 * price.prompt
         + num_output_tokens / 1000.0 * price.completion
     )
+
+
+@dataclasses.dataclass
+class RateLimit:
+    requests_per_minute: typing.Optional[int]
+    tokens_per_minute: typing.Optional[int]
+
+
+# limits of the api tier we use, adjust these to your account
+rate_limits: typing.Dict[str, RateLimit] = {
+    "gpt-4-0125-preview": RateLimit(requests_per_minute=500, tokens_per_minute=30_000),
+    "gpt-4o-2024-05-13": RateLimit(requests_per_minute=500, tokens_per_minute=30_000),
+    "gpt-3.5-turbo-0125": RateLimit(
+        requests_per_minute=3_500, tokens_per_minute=60_000
+    ),
+    "gpt-4-turbo-2024-04-09": RateLimit(
+        requests_per_minute=500, tokens_per_minute=30_000
+    ),
+    "claude-3-opus-20240229": RateLimit(
+        requests_per_minute=50, tokens_per_minute=20_000
+    ),
+    "claude-3-sonnet-20240229": RateLimit(
+        requests_per_minute=50, tokens_per_minute=40_000
+    ),
+    "meta-llama/Meta-Llama-3-70B-Instruct": RateLimit(
+        requests_per_minute=200, tokens_per_minute=None
+    ),
+    "deepinfra/airoboros-70b": RateLimit(
+        requests_per_minute=200, tokens_per_minute=None
+    ),
+    "mistral-large-latest": RateLimit(
+        requests_per_minute=300, tokens_per_minute=2_000_000
+    ),
+    "Qwen/Qwen1.5-72B-Chat": RateLimit(requests_per_minute=60, tokens_per_minute=None),
+}
@@ -1005,19 +1005,20 @@ class PetMentionListingFormattingStrategy(
         except ValueError:
             raise ValueError(f"Invalid sentence index '{sentence_id}', skipping line.")
 
-        sentence = document.sentences[sentence_id]
+        sentence = document.sentence(sentence_id)
 
         mention_text = mention_text.lower()
         mention_tokens = mention_text.split(" ")
 
+        token_texts = [t.lower() for t in data.token_texts(sentence)]
         res = []
-        for i, token in enumerate(sentence):
-            candidates = sentence[i : i + len(mention_tokens)]
-            candidate_text = " ".join(c.text.lower() for c in candidates)
+        for i in range(len(token_texts)):
+            candidate_text = " ".join(token_texts[i : i + len(mention_tokens)])
 
-            if candidate_text.lower() != mention_text.lower():
+            if candidate_text != mention_text:
                 continue
 
+            candidates = sentence[i : i + len(mention_tokens)]
             res.append(
                 data.PetMention(
                     token_document_indices=tuple(
@@ -1065,7 +1066,7 @@ class PetMentionListingFormattingStrategy(
             text=document.text,
             name=document.name,
             category=document.category,
-            tokens=[t.copy() for t in document.tokens],
+            tokens=document.tokens,
             mentions=parsed_mentions,
             relations=[],
             entities=[],
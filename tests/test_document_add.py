@@ -63,7 +63,9 @@ def test_pet():
         ],
     )
 
+    num_mentions = len(doc1.mentions)
     added = doc1 + doc2
+    assert len(doc1.mentions) == num_mentions
     assert len(added.mentions) == 4
     assert len(added.entities) == 2, added.entities
     assert added.entities[1].mention_indices == (2, 3)
@@ -95,6 +97,7 @@ def test_quishpi():
     added = doc1 + doc2
 
     assert len(added.mentions) == 4
+    assert len(doc1.mentions) == 3
 
 
 def test_van_der_aa():
@@ -131,3 +134,46 @@ def test_van_der_aa():
 
     assert len(added.constraints) == 6
     assert len(added.sentences) == 2
+
+
+def test_pet_add_does_not_mutate():
+    def document(mentions, entities, relations):
+        return data.PetDocument(
+            id="1",
+            name="1",
+            text="",
+            category="",
+            tokens=[],
+            mentions=mentions,
+            entities=entities,
+            relations=relations,
+        )
+
+    doc1 = document(
+        [data.PetMention("A", (0,)), data.PetMention("a", (0,))],
+        [data.PetEntity((0,))],
+        [data.PetRelation("R", 0, 1)],
+    )
+    doc2 = document(
+        [data.PetMention("B", (1,)), data.PetMention("A", (0,))],
+        [data.PetEntity((1,)), data.PetEntity((1, 0))],
+        [data.PetRelation("R", 1, 0), data.PetRelation("R", 1, 1)],
+    )
+
+    added = doc1 + doc2
+
+    assert len(doc1.mentions) == 2
+    assert len(doc1.entities) == 1
+    assert len(doc1.relations) == 1
+    # equal mentions map to their first occurrence
+    assert added.mentions == [
+        data.PetMention("A", (0,)),
+        data.PetMention("a", (0,)),
+        data.PetMention("B", (1,)),
+    ]
+    assert added.entities == [data.PetEntity((0,)), data.PetEntity((2, 0))]
+    assert added.relations == [
+        data.PetRelation("R", 0, 1),
+        data.PetRelation("R", 0, 2),
+        data.PetRelation("R", 0, 0),
+    ]
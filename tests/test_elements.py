@@ -0,0 +1,42 @@
+import copy
+import pickle
+
+import data
+
+
+def test_equality_and_hash():
+    a = data.PetMention(type="Actor", token_document_indices=(3, 1, 2))
+    b = data.PetMention(type="actor", token_document_indices=(1, 2, 3))
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a != data.PetMention(type="actor", token_document_indices=(1, 2))
+    assert a != data.PetMention(type="activity", token_document_indices=(1, 2, 3))
+    assert a.type == "Actor"
+    assert a.token_document_indices == (3, 1, 2)
+
+    assert data.PetEntity(mention_indices=(2, 1)) == data.PetEntity(
+        mention_indices=(1, 2)
+    )
+    assert len({data.PetEntity(mention_indices=(2, 1)), data.PetEntity((1, 2))}) == 1
+
+    flow = data.PetRelation(type="flow", head_mention_index=0, tail_mention_index=1)
+    assert flow == data.PetRelation("flow", 0, 1)
+    assert flow != data.PetRelation("Flow", 0, 1)
+
+
+def test_elements_are_compact():
+    mention = data.PetMention(type="actor", token_document_indices=(1,))
+    token = data.PetToken("a", index_in_document=0, pos_tag="DT", sentence_index=0)
+    head = data.VanDerAaMention(text="approve")
+    constraint = data.VanDerAaConstraint(
+        type="precedence", head=head, tail=None, negative=False, sentence_id=0
+    )
+    quishpi_mention = data.QuishpiMention(type="action", text="approve")
+    for element in [mention, token, head, constraint, quishpi_mention]:
+        assert not hasattr(element, "__dict__")
+
+        restored = pickle.loads(pickle.dumps(element))
+        assert restored == element
+        assert copy.deepcopy(element) == element
+        if element is not token:
+            assert hash(restored) == hash(element)
@@ -0,0 +1,719 @@
+import asyncio
+import json
+import math
+import os
+import random
+import typing
+
+import httpx
+import openai
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompt_values import ChatPromptValue
+
+import data
+import experiments
+import format
+from experiments import (
+    checkpoint,
+    cache,
+    ratelimit,
+    usage,
+    retry,
+    batch,
+    templates,
+    replay,
+    iterative,
+    planning,
+)
+
+
+class EchoChatModel(BaseChatModel):
+    """Answers with the last word of the prompt as a single mention."""
+
+    temperature: float = 0.0
+    max_delay: float = 0.0
+    num_calls: int = 0
+    # number of calls that time out, before the model starts answering
+    num_failures: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text.split(" "))
+
+    def _answer(self, messages: typing.List[BaseMessage]) -> ChatResult:
+        self.num_calls += 1
+        if self.num_calls <= self.num_failures:
+            raise openai.APITimeoutError(request=httpx.Request("POST", "echo"))
+        last_word = str(messages[-1].content).split()[-1]
+        message = AIMessage(content=f"action\t{last_word}")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(random.random() * self.max_delay)
+        return self._answer(messages)
+
+
+class InMemoryImporter(data.BaseImporter[data.QuishpiDocument]):
+    def __init__(self, documents: typing.List[data.QuishpiDocument]):
+        self._documents = documents
+
+    def do_import(self) -> typing.List[data.QuishpiDocument]:
+        return self._documents
+
+
+def _documents(num_documents: int) -> typing.List[data.QuishpiDocument]:
+    return [
+        data.QuishpiDocument(id=f"doc-{i}", text=f"text of word{i}", mentions=[])
+        for i in range(num_documents)
+    ]
+
+
+def _run(storage: str, max_concurrency: typing.Optional[int], max_delay: float):
+    documents = _documents(12)
+    folds = [
+        {"train": [], "test": [d.id for d in documents[:7]]},
+        {"train": [], "test": [d.id for d in documents[7:]]},
+    ]
+    experiments.experiment(
+        InMemoryImporter(documents),
+        [format.QuishpiMentionListingFormattingStrategy(["mentions"])],
+        model_name="echo",
+        chat_model=EchoChatModel(max_delay=max_delay),
+        storage=storage,
+        num_shots=0,
+        dry_run=False,
+        folds=folds,
+        max_concurrency=max_concurrency,
+    )
+    with open(storage, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def test_concurrent_experiment_matches_sequential(tmp_path):
+    sequential = _run(str(tmp_path / "sequential.json"), None, 0.0)
+    concurrent = _run(str(tmp_path / "concurrent.json"), 4, 0.01)
+
+    assert concurrent == sequential
+    assert [r["original_id"] for r in concurrent[1]["results"]] == [
+        f"doc-{i}" for i in range(7, 12)
+    ]
+    assert concurrent[0]["results"][3]["answers"] == ["action\tword3"]
+
+
+def _result(doc_id: str) -> experiments.PromptResult:
+    return experiments.PromptResult(
+        prompts=["prompt"],
+        steps=[["mentions"]],
+        formatter_args=[{}],
+        formatters=["QuishpiMentionListingFormattingStrategy"],
+        input_tokens=1,
+        output_tokens=1,
+        total_costs=0.0,
+        answers=[f"answer for {doc_id}"],
+        original_id=doc_id,
+    )
+
+
+def test_checkpoint_log(tmp_path):
+    storage = str(tmp_path / "run.json")
+    meta = experiments.RunMeta(num_shots=0, model="echo", temperature=0.0)
+
+    log = checkpoint.CheckpointLog(storage)
+    assert log.load() == []
+    log.append_meta(0, meta)
+    log.append_result(0, _result("b"), position=1)
+    log.append_result(0, _result("a"), position=0)
+
+    # simulate a crash in the middle of writing a record
+    with open(log.log_path, "a", encoding="utf8") as f:
+        f.write('{"fold": 0, "position": 2, "res')
+
+    log = checkpoint.CheckpointLog(storage)
+    loaded = log.load()
+    assert [r.original_id for r in loaded[0].results] == ["a", "b"]
+    log.append_result(0, _result("c"), position=2)
+
+    compacted = log.compact()
+    assert [r.original_id for r in compacted[0].results] == ["a", "b", "c"]
+    with open(storage, "r", encoding="utf8") as f:
+        raw = json.load(f)
+    assert raw == [e.to_dict() for e in compacted]
+
+
+def test_checkpoint_log_appends_from_threads(tmp_path):
+    storage = str(tmp_path / "run.json")
+    log = checkpoint.CheckpointLog(storage)
+    log.load()
+    log.append_meta(0, experiments.RunMeta(num_shots=0, model="echo", temperature=0.0))
+
+    async def append_all():
+        await asyncio.gather(
+            *[
+                asyncio.to_thread(log.append_result, 0, _result(f"doc-{i}"), i)
+                for i in range(50)
+            ]
+        )
+
+    asyncio.run(append_all())
+    loaded = checkpoint.CheckpointLog(storage).load()
+    assert [r.original_id for r in loaded[0].results] == [f"doc-{i}" for i in range(50)]
+
+
+def test_checkpoint_log_continues_legacy_storage(tmp_path):
+    storage = str(tmp_path / "run.json")
+    meta = experiments.RunMeta(num_shots=0, model="echo", temperature=0.0)
+    legacy = [experiments.ExperimentResult(meta=meta, results=[_result("a")])]
+    with open(storage, "w", encoding="utf8") as f:
+        json.dump([e.to_dict() for e in legacy], f)
+
+    log = checkpoint.CheckpointLog(storage)
+    assert [r.original_id for r in log.load()[0].results] == ["a"]
+    log.append_result(0, _result("b"), position=1)
+
+    log = checkpoint.CheckpointLog(storage)
+    assert [r.original_id for r in log.load()[0].results] == ["a", "b"]
+
+
+@pytest.mark.parametrize("max_concurrency", [None, 4])
+def test_response_cache(tmp_path, max_concurrency):
+    response_cache = cache.ResponseCache(str(tmp_path / "cache"))
+    documents = _documents(3)
+    formatters = [format.QuishpiMentionListingFormattingStrategy(["mentions"])]
+
+    stored = []
+    for run in range(2):
+        chat_model = EchoChatModel()
+        storage = str(tmp_path / f"run-{run}.json")
+        experiments.experiment(
+            InMemoryImporter(documents),
+            formatters,
+            model_name="echo",
+            chat_model=chat_model,
+            storage=storage,
+            num_shots=0,
+            dry_run=False,
+            response_cache=response_cache,
+            max_concurrency=max_concurrency,
+        )
+        with open(storage, "r", encoding="utf8") as f:
+            stored.append(json.load(f)[0]["results"])
+        assert chat_model.num_calls == (3 if run == 0 else 0)
+
+    assert response_cache.hits == 3
+    assert response_cache.misses == 3
+    for first, second in zip(*stored):
+        assert first["cached"] == [False]
+        assert second["cached"] == [True]
+        assert first["answers"] == second["answers"]
+        assert first["input_tokens"] == second["input_tokens"]
+
+
+def test_response_cache_eviction(tmp_path):
+    response_cache = cache.ResponseCache(str(tmp_path / "cache"), max_size_bytes=500)
+    for i in range(20):
+        response_cache.put(
+            f"{i:064d}",
+            cache.CachedResponse(
+                answer=f"answer {i}", input_tokens=1, output_tokens=1, total_costs=0
+            ),
+        )
+    assert response_cache.get(f"{19:064d}") is not None
+    assert response_cache.get(f"{0:064d}") is None
+
+
+def test_response_cache_rewrites_do_not_grow(tmp_path):
+    response_cache = cache.ResponseCache(str(tmp_path / "cache"), max_size_bytes=500)
+    response = cache.CachedResponse(
+        answer="answer", input_tokens=1, output_tokens=1, total_costs=0
+    )
+    for _ in range(20):
+        response_cache.put(f"{0:064d}", response)
+    # rewriting an entry replaces its size
+    size_bytes = os.path.getsize(response_cache._path(f"{0:064d}"))
+    assert response_cache._size_bytes == size_bytes
+
+
+def test_rate_limiter():
+    now = [0.0]
+    limiter = ratelimit.RateLimiter(
+        usage.RateLimit(requests_per_minute=2, tokens_per_minute=600),
+        clock=lambda: now[0],
+    )
+
+    assert limiter.reserve(100) == 0.0
+    assert limiter.reserve(100) == 0.0
+    # third request exceeds the request bucket, which refills one per 30s
+    assert limiter.reserve(100) == 30.0
+
+    # request used far more tokens than reserved, so after a minute the
+    # token bucket is only refilled to zero, instead of its full capacity
+    limiter.settle(num_reserved_tokens=100, num_used_tokens=1000)
+    now[0] = 60.0
+    assert limiter.reserve(100) == 10.0
+
+
+def test_retry_with_circuit_breaker():
+    now = [0.0]
+
+    def sleep(seconds: float):
+        now[0] += seconds
+
+    breaker = retry.CircuitBreaker(
+        window=4,
+        min_requests=2,
+        failure_threshold=0.5,
+        cooldown=30.0,
+        clock=lambda: now[0],
+    )
+    policy = retry.RetryPolicy(max_attempts=4, base_delay=1.0, jitter=0.0)
+    chat_model = EchoChatModel(num_failures=3)
+
+    answer, stats = retry.call_with_retry(
+        lambda: chat_model.invoke("some words"), policy, breaker, sleep
+    )
+    assert answer.content == "action\twords"
+    assert stats.retries == 3
+    # the second failure opens the breaker, the third one reopens it,
+    # backoff delays are 1, 2, and 4 seconds
+    assert stats.backoff_seconds == 1.0 + 2.0 + 28.0 + 4.0 + 26.0
+    assert not breaker.is_open
+
+    with pytest.raises(ValueError):
+        retry.call_with_retry(lambda: int("nan"), policy, breaker, sleep)
+
+
+def test_circuit_breaker_dispatches_single_probe():
+    now = [0.0]
+    breaker = retry.CircuitBreaker(
+        window=2, min_requests=2, cooldown=30.0, clock=lambda: now[0]
+    )
+    _, in_flight = breaker.dispatch()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.wait_time() == 30.0
+    # failed, but was dispatched before the breaker opened
+    breaker.record_failure(in_flight)
+    assert breaker.wait_time() == 30.0
+
+    now[0] = 30.0
+    wait, probe = breaker.dispatch()
+    assert wait == 0.0
+    # all other requests wait for the outcome of the probe
+    assert breaker.dispatch() == (1.0, None)
+    assert breaker.is_open
+    breaker.record_failure(in_flight)
+    assert breaker.wait_time() == 1.0
+    breaker.record_failure(probe)
+    assert breaker.wait_time() == 30.0
+
+    now[0] = 60.0
+    assert breaker.wait_time() == 0.0
+    assert breaker.wait_time() > 0
+    breaker.record_success()
+    assert breaker.wait_time() == 0.0
+    assert breaker.wait_time() == 0.0
+
+    # a probe that never reports back is replaced after another cooldown
+    breaker.record_failure()
+    breaker.record_failure()
+    now[0] = 90.0
+    assert breaker.wait_time() == 0.0
+    now[0] = 119.0
+    assert breaker.wait_time() == 1.0
+    now[0] = 120.0
+    assert breaker.wait_time() == 0.0
+
+
+def test_experiment_records_retries(tmp_path):
+    storage = str(tmp_path / "run.json")
+    retry.default_policy = retry.RetryPolicy(base_delay=0.0)
+    try:
+        experiments.experiment(
+            InMemoryImporter(_documents(2)),
+            [format.QuishpiMentionListingFormattingStrategy(["mentions"])],
+            model_name="echo-retry",
+            chat_model=EchoChatModel(num_failures=1),
+            storage=storage,
+            num_shots=0,
+            dry_run=False,
+        )
+    finally:
+        retry.default_policy = retry.RetryPolicy()
+    with open(storage, "r", encoding="utf8") as f:
+        results = json.load(f)[0]["results"]
+    assert [r["retries"] for r in results] == [1, 0]
+    assert results[0]["answers"] == ["action\tword0"]
+
+
+def test_batch_mode_matches_interactive(tmp_path):
+    documents = _documents(3)
+    folds = [
+        {"train": [], "test": ["doc-2", "doc-0"]},
+        {"train": [], "test": ["doc-1"]},
+    ]
+    formatters = [
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+    ]
+
+    def run(storage: str, batch_directory: typing.Optional[str]):
+        experiments.experiment(
+            InMemoryImporter(documents),
+            formatters,
+            model_name="gpt-4o-2024-05-13",
+            chat_model=EchoChatModel(),
+            storage=storage,
+            num_shots=0,
+            dry_run=False,
+            folds=folds,
+            batch_directory=batch_directory,
+        )
+        with open(storage, "r", encoding="utf8") as f:
+            return json.load(f)
+
+    interactive = run(str(tmp_path / "interactive.json"), None)
+
+    batch_directory = str(tmp_path / "batch")
+    storage = str(tmp_path / "batch.json")
+    for batch_round in range(len(formatters)):
+        assert sum(len(e["results"]) for e in run(storage, batch_directory)) == 0
+        request_file = batch.request_path(batch_directory, batch_round)
+        with open(request_file, "r", encoding="utf8") as f:
+            requests = [json.loads(line) for line in f]
+        assert sorted(r["custom_id"] for r in requests) == [
+            f"0:doc-0:{batch_round}",
+            f"0:doc-2:{batch_round}",
+            f"1:doc-1:{batch_round}",
+        ]
+        batch.run_locally(
+            request_file,
+            batch.result_path(batch_directory, batch_round),
+            EchoChatModel(),
+        )
+    batched = run(storage, batch_directory)
+
+    for interactive_fold, batched_fold in zip(interactive, batched):
+        assert [r["original_id"] for r in batched_fold["results"]] == [
+            r["original_id"] for r in interactive_fold["results"]
+        ]
+        for interactive_result, batched_result in zip(
+            interactive_fold["results"], batched_fold["results"]
+        ):
+            assert batched_result["prompts"] == interactive_result["prompts"]
+            assert batched_result["answers"] == interactive_result["answers"]
+            assert batched_result["total_costs"] == 0.5 * usage.get_cost_for_tokens(
+                "gpt-4o-2024-05-13",
+                batched_result["input_tokens"],
+                batched_result["output_tokens"],
+            )
+
+    with pytest.raises(ValueError):
+        experiments.experiment(
+            InMemoryImporter(documents),
+            formatters,
+            model_name="claude-3-opus-20240229",
+            chat_model=EchoChatModel(),
+            storage=str(tmp_path / "claude.json"),
+            num_shots=0,
+            dry_run=False,
+            folds=folds,
+            batch_directory=str(tmp_path / "claude"),
+        )
+
+
+def test_batch_request_temperature():
+    prompt_as_messages = ChatPromptValue(messages=[AIMessage(content="hi")])
+    request = batch.to_request("0:doc-0:0", "gpt-4o", None, prompt_as_messages)
+    assert "temperature" not in request["body"]
+    request = batch.to_request("0:doc-0:0", "gpt-4o", 0.0, prompt_as_messages)
+    assert request["body"]["temperature"] == 0.0
+
+
+def test_prompt_templates_are_built_once_per_fold_and_formatter(tmp_path):
+    documents = _documents(5)
+    folds = [
+        {"train": ["doc-0"], "test": ["doc-1", "doc-2"]},
+        {"train": ["doc-1"], "test": ["doc-0", "doc-3", "doc-4"]},
+    ]
+    formatters = [
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+    ]
+    prompt_templates = templates.prompt_templates
+    prompt_templates.clear()
+    hits, misses = prompt_templates.hits, prompt_templates.misses
+
+    experiments.experiment(
+        InMemoryImporter(documents),
+        formatters,
+        model_name="echo",
+        chat_model=EchoChatModel(),
+        storage=str(tmp_path / "run.json"),
+        num_shots=1,
+        dry_run=False,
+        folds=folds,
+    )
+
+    # both formatters have the same class and args, so share templates
+    assert prompt_templates.misses - misses == 2
+    assert prompt_templates.hits - hits == 2 * 5 - 2
+    # templates are not kept beyond the experiment
+    assert len(prompt_templates._templates) == 0
+
+    # documents of other importers may reuse ids
+    changed = documents[0].copy([])
+    changed.text = "changed"
+    assert templates.PromptTemplateCache.key(
+        formatters[0], [changed]
+    ) != templates.PromptTemplateCache.key(formatters[0], documents[:1])
+    assert templates.PromptTemplateCache.key(
+        formatters[0], [documents[0].copy([])]
+    ) == templates.PromptTemplateCache.key(formatters[0], documents[:1])
+
+    other_prompt = format.QuishpiMentionListingFormattingStrategy(
+        ["mentions"], prompt="quishpi/md/long-with-explain.txt"
+    )
+    assert templates.PromptTemplateCache.key(
+        other_prompt, documents[:1]
+    ) != templates.PromptTemplateCache.key(formatters[0], documents[:1])
+
+
+def test_plan_experiment():
+    documents = _documents(3)
+    folds = [
+        {"train": ["doc-0"], "test": ["doc-1", "doc-2"]},
+        {"train": ["doc-1"], "test": ["doc-0"]},
+    ]
+    formatters = [
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+    ]
+
+    estimates = experiments.plan_experiment(
+        documents,
+        formatters,
+        model_names=["gpt-4o-2024-05-13", "echo"],
+        folds=folds,
+        token_counter=lambda model_name, text: len(text.split()),
+    )
+
+    assert [(e.model, e.fold, e.num_prompts) for e in estimates] == [
+        ("gpt-4o-2024-05-13", 0, 4),
+        ("gpt-4o-2024-05-13", 1, 2),
+        ("echo", 0, 4),
+        ("echo", 1, 2),
+    ]
+    gpt_4o, _, echo, _ = estimates
+    assert gpt_4o.input_tokens == echo.input_tokens > 0
+    assert gpt_4o.total_costs == usage.get_cost_for_tokens(
+        "gpt-4o-2024-05-13", gpt_4o.input_tokens, gpt_4o.output_tokens
+    )
+    assert math.isnan(echo.total_costs)
+
+
+def test_plan_experiment_without_tokenizer(monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(planning.tiktoken, "encoding_for_model", unavailable)
+    monkeypatch.setattr(planning.tiktoken, "get_encoding", unavailable)
+    planning._encoding_for_model.cache_clear()
+    try:
+        estimates = experiments.plan_experiment(
+            _documents(2),
+            [format.QuishpiMentionListingFormattingStrategy(["mentions"])],
+            model_names=["gpt-4o-2024-05-13"],
+            folds=[{"train": ["doc-0"], "test": ["doc-1"]}],
+        )
+        assert planning.count_tokens("gpt-4o-2024-05-13", "abcde") == 2
+    finally:
+        planning._encoding_for_model.cache_clear()
+
+    assert len(estimates) == 1
+    assert estimates[0].num_prompts == 1
+    assert estimates[0].input_tokens > 0
+    assert estimates[0].total_costs > 0
+
+
+class OnlineTokenizerChatModel(EchoChatModel):
+    def get_num_tokens(self, text: str) -> int:
+        raise AssertionError("tokenizer needs network access")
+
+
+def test_dry_run_does_not_query_model(tmp_path, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(planning.tiktoken, "encoding_for_model", unavailable)
+    monkeypatch.setattr(planning.tiktoken, "get_encoding", unavailable)
+    planning._encoding_for_model.cache_clear()
+    chat_model = OnlineTokenizerChatModel()
+    try:
+        experiments.experiment(
+            InMemoryImporter(_documents(2)),
+            [format.QuishpiMentionListingFormattingStrategy(["mentions"])],
+            model_name="gpt-4o-2024-05-13",
+            chat_model=chat_model,
+            storage=str(tmp_path / "run.json"),
+            num_shots=0,
+            dry_run=True,
+        )
+    finally:
+        planning._encoding_for_model.cache_clear()
+    assert chat_model.num_calls == 0
+
+
+def test_replay_stored_answers(tmp_path):
+    documents = _documents(4)
+    # token counts are recorded per result, so only results of a single
+    # prompt can be replayed with their exact counts
+    formatters = [format.QuishpiMentionListingFormattingStrategy(["mentions"])]
+    answers_directory = tmp_path / "answers"
+
+    def run(
+        storage: str, model_name: str, chat_model: BaseChatModel, max_concurrency=None
+    ):
+        experiments.experiment(
+            InMemoryImporter(documents),
+            formatters,
+            model_name=model_name,
+            chat_model=chat_model,
+            storage=storage,
+            num_shots=0,
+            dry_run=False,
+            max_concurrency=max_concurrency,
+        )
+        with open(storage, "r", encoding="utf8") as f:
+            return json.load(f)[0]["results"]
+
+    recorded = run(
+        str(answers_directory / "gpt-4o" / "run.json"),
+        "gpt-4o-2024-05-13",
+        EchoChatModel(),
+    )
+    replay_model = replay.ReplayChatModel(
+        model_name="gpt-4o-2024-05-13",
+        directory=str(answers_directory),
+        latency=replay.lognormal_latency(median_seconds=0.001, seed=42),
+    )
+    replayed = run(
+        str(tmp_path / "replayed.json"),
+        "replay:gpt-4o-2024-05-13",
+        replay_model,
+        max_concurrency=2,
+    )
+
+    for key in ["prompts", "answers", "input_tokens", "output_tokens", "total_costs"]:
+        assert [r[key] for r in replayed] == [r[key] for r in recorded]
+    assert all(r["total_costs"] > 0 for r in replayed)
+
+    assert replay_model.get_num_tokens("an unknown text") == 4
+    with pytest.raises(KeyError):
+        replay_model.invoke("a prompt that was never sent")
+    assert isinstance(
+        experiments.chat_model_for_name("replay:gpt-4o-2024-05-13"),
+        replay.ReplayChatModel,
+    )
+
+
+class CountingEchoChatModel(EchoChatModel):
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def test_pipelined_iterative_steps(tmp_path):
+    documents = _documents(6)
+    formatters = [
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+    ]
+    chat_model = CountingEchoChatModel(max_delay=0.01)
+
+    async def run():
+        jobs = [(i, d, []) for i, d in enumerate(documents)]
+        return [
+            (key, result)
+            async for key, result in iterative.arun_pipelined_document_prompts(
+                jobs, formatters, chat_model, "echo", False, max_concurrency=2
+            )
+        ]
+
+    pipelined = asyncio.run(run())
+
+    assert chat_model.num_calls == len(documents) * len(formatters)
+    assert chat_model.max_in_flight == 2
+    assert sorted(key for key, _ in pipelined) == list(range(len(documents)))
+    for key, result in pipelined:
+        sequential = iterative.run_iterative_document_prompt(
+            documents[key], formatters, [], EchoChatModel(), "echo", False
+        )
+        assert result.prompts == sequential.prompts
+        assert result.answers == sequential.answers
+
+
+class FailingEchoChatModel(EchoChatModel):
+    fail_on_call: int = 0
+
+    def _answer(self, messages: typing.List[BaseMessage]) -> ChatResult:
+        if self.num_calls + 1 == self.fail_on_call:
+            self.num_calls += 1
+            raise RuntimeError("model failed")
+        return super()._answer(messages)
+
+
+@pytest.mark.parametrize("max_concurrency", [None, 2])
+def test_resume_iterative_steps(tmp_path, max_concurrency):
+    documents = _documents(2)
+    formatters = [
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+        format.QuishpiMentionListingFormattingStrategy(["mentions"]),
+    ]
+
+    def run(storage: str, chat_model: BaseChatModel):
+        experiments.experiment(
+            InMemoryImporter(documents),
+            formatters,
+            model_name="echo",
+            chat_model=chat_model,
+            storage=storage,
+            num_shots=0,
+            dry_run=False,
+            max_concurrency=max_concurrency,
+        )
+        with open(storage, "r", encoding="utf8") as f:
+            return json.load(f)[0]["results"]
+
+    expected = run(str(tmp_path / "expected.json"), EchoChatModel())
+
+    storage = str(tmp_path / "resumed.json")
+    failing = FailingEchoChatModel(fail_on_call=6)
+    with pytest.raises(RuntimeError):
+        run(storage, failing)
+    log = checkpoint.CheckpointLog(storage)
+    num_stored_results = sum(len(e.results) for e in log.load())
+    num_stored_steps = sum(len(s) for s in log.steps(0).values())
+    assert num_stored_results * len(formatters) + num_stored_steps == 5
+
+    resuming = EchoChatModel()
+    resumed = run(storage, resuming)
+    assert resuming.num_calls == 1
+    assert resumed == expected
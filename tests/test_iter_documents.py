@@ -0,0 +1,57 @@
+import os
+
+import data
+
+
+def test_pet_iter_documents():
+    importer = data.PetImporter("res/data/pet/all.new.jsonl")
+    documents = importer.do_import()
+    assert list(importer.iter_documents()) == documents
+
+    ids = [documents[7].id, documents[2].id, "unknown"]
+    assert list(importer.iter_documents(ids)) == [documents[2], documents[7]]
+
+
+def test_van_der_aa_iter_documents(tmp_path):
+    def row(name: str, row_id: str, text: str, constraint: str, head: str):
+        columns = [""] * 17
+        columns[1] = name
+        columns[4] = row_id
+        columns[5] = text
+        columns[6] = "1"
+        columns[7] = "False"
+        columns[8] = constraint
+        columns[9] = head
+        return ";".join(columns) + "\n"
+
+    os.makedirs(tmp_path / "csv")
+    for file_name in ["a", "b"]:
+        with open(tmp_path / "csv" / f"{file_name}.csv", "w") as f:
+            f.write(";" * 16 + "\n")
+            f.write(row("1", "1", "Check order.", "init", "check order"))
+            f.write(row("2", "1", "Send invoice.", "end", "send invoice"))
+            f.write(row("1", "2", "Ship order.", "end", "ship order"))
+
+    importer = data.VanDerAaImporter(str(tmp_path / "csv"))
+    documents = importer.do_import()
+    assert sorted(d.id for d in documents) == ["a-1", "a-2", "b-1", "b-2"]
+    assert list(importer.iter_documents()) == documents
+    assert [d.sentences for d in importer.iter_documents(["b-1"])] == [
+        ["Check order.", "Ship order."]
+    ]
+
+
+def test_quishpi_iter_documents(tmp_path):
+    os.makedirs(tmp_path / "judgeannotations")
+    os.makedirs(tmp_path / "texts")
+    with open(tmp_path / "judgeannotations" / "1-1_first.ann", "w") as f:
+        f.write("T1\tActivity 0 5\tcheck\n")
+    with open(tmp_path / "texts" / "1-1_first.txt", "w") as f:
+        f.write("check")
+
+    importer = data.QuishpiImporter(str(tmp_path), exclude_tags=[])
+    documents = importer.do_import()
+    assert [d.id for d in documents] == ["1-1_first"]
+    assert list(importer.iter_documents()) == documents
+    assert list(importer.iter_documents({"1-1_first"})) == documents
+    assert list(importer.iter_documents({"1-2_second"})) == []
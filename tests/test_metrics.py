@@ -1,6 +1,7 @@
-from eval import metrics
+from eval import metrics, significance
 
 import data
+import eval
 
 
 def test_constraint_slot_filling_stats():
@@ -94,3 +95,202 @@ def test_constraint_slot_filling_stats():
         document, true=true, pred=pred, verbose=False, print_only_tags=[]
     )
     assert stats["test"] == metrics.Stats(num_pred=3, num_gold=3, num_ok=0)
+
+
+def test_assign_constraints_by_sentence():
+    def constraint(t: str, negative: bool, sentence_id: int = 0):
+        # heads share their verb, so they always match without tagging
+        return data.VanDerAaConstraint(
+            type=t,
+            negative=negative,
+            head=data.VanDerAaMention(text="check order"),
+            tail=None,
+            sentence_id=sentence_id,
+        )
+
+    true = [constraint("init", True), constraint("init", False)]
+    pred = [
+        constraint("init", True),
+        constraint("end", True),
+        constraint("end", True),
+        constraint("init", True, sentence_id=1),
+    ]
+
+    greedy = metrics._assign_constraints_by_sentence(pred, true)
+    assert greedy == metrics._assign_constraints_by_search(pred, true)
+    assert greedy == {pred[0]: (true[0], 3), pred[1]: (true[1], 1)}
+
+    optimal = metrics._assign_constraints_by_sentence(pred, true, optimal=True)
+    assert optimal == {pred[0]: (true[1], 2), pred[1]: (true[0], 3)}
+
+
+def test_match_by_index_equals_search():
+    def mention(t: str, *indices: int):
+        return data.PetMention(type=t, token_document_indices=indices)
+
+    true = [
+        mention("Activity", 1, 2),
+        mention("activity", 2, 1),
+        mention("actor", 3),
+        mention("actor", 4),
+    ]
+    pred = [
+        mention("activity", 1, 2),
+        mention("ACTIVITY", 1, 2),
+        mention("activity", 1, 2),
+        mention("actor", 5),
+        mention("actor", 4),
+    ]
+    ok, non_ok, missing = metrics._match_by_index(pred, true)
+    assert (ok, non_ok, missing) == metrics._match_by_search(pred, true)
+    assert len(ok) == 3
+    assert missing == [mention("actor", 3)]
+
+    true = [data.PetEntity(mention_indices=(0, 1)), data.PetEntity((2,))]
+    pred = [data.PetEntity(mention_indices=(1, 0)), data.PetEntity((1,))]
+    assert metrics._match_by_index(pred, true) == metrics._match_by_search(pred, true)
+
+
+def test_match_by_key_index_equals_search():
+    def mention(t: str, *indices: int):
+        return data.PetMention(type=t, token_document_indices=indices)
+
+    true = [
+        mention("activity", 1, 2, 3),
+        mention("activity", 3, 4),
+        mention("actor", 3),
+        mention("actor", 7, 8),
+    ]
+    pred = [
+        mention("Activity", 3),
+        mention("activity", 2),
+        mention("activity", 4),
+        mention("actor", 5, 8),
+        mention("actor", 8),
+    ]
+    expected = metrics._match_by_search(pred, true, partial_match=True)
+    assert metrics._match_by_key_index(pred, true, partial_match=True) == expected
+    ok, non_ok, missing = expected
+    assert non_ok == [mention("activity", 2), mention("actor", 8)]
+    assert missing == [mention("actor", 3)]
+
+    # elements without match keys are checked against every true element
+    true = [data.QuishpiMention(type="action", text=t) for t in ["a b", "c"]]
+    pred = [data.QuishpiMention(type="action", text=t) for t in ["c d", "e"]]
+    expected = metrics._match_by_search(pred, true, partial_match=True)
+    assert metrics._match_by_key_index(pred, true, partial_match=True) == expected
+    assert expected[0] == [pred[0]]
+
+    head = data.VanDerAaMention(text="check order")
+    true = [
+        data.VanDerAaConstraint(
+            type=t, negative=False, head=head, tail=None, sentence_id=0
+        )
+        for t in ["init", "succession", "init"]
+    ]
+    pred = [
+        data.VanDerAaConstraint(
+            type=t, negative=False, head=head, tail=None, sentence_id=0
+        )
+        for t in ["Init", "end", "init", "init"]
+    ]
+    assert metrics._match_by_key_index(pred, true) == metrics._match_by_search(
+        pred, true
+    )
+
+
+def test_stats_table_equals_stats():
+    stats_by_document = {
+        "a": {
+            "actor": metrics.Stats(num_pred=2, num_gold=3, num_ok=1),
+            "activity": metrics.Stats(num_pred=0, num_gold=2, num_ok=0),
+        },
+        "b": {
+            "actor": metrics.Stats(num_pred=1, num_gold=1, num_ok=1),
+            "xor gateway": metrics.Stats(num_pred=0, num_gold=0, num_ok=0),
+        },
+        "c": {"further specification": metrics.Stats(2, 0, 0)},
+    }
+    table = eval.StatsTable.from_stats(stats_by_document)
+    assert table.counts.shape == (3, 4, 3)
+
+    stats = {}
+    for stats_by_tag in stats_by_document.values():
+        for tag, s in stats_by_tag.items():
+            stats[tag] = stats.get(tag, metrics.Stats(0, 0, 0)) + s
+    assert table.stats_by_tag() == stats
+    assert table.scores_by_tag() == eval.stats_to_scores(stats)
+    for strategy in ["micro", "macro"]:
+        expected = eval.average_scores(stats, strategy)
+        actual = eval.average_scores(table, strategy)
+        assert abs(actual.p - expected.p) < 1e-9
+        assert abs(actual.r - expected.r) < 1e-9
+        assert abs(actual.f1 - expected.f1) < 1e-9
+
+    folds = [table.select(["a"]), table.select(["b", "c"])]
+    combined = eval.StatsTable.concatenate(folds)
+    assert combined.stats_by_tag() == stats
+    assert folds[0].stats_by_tag()["actor"] == metrics.Stats(2, 3, 1)
+
+
+def test_f1_table_counts_every_document():
+    documents = data.PetImporter("res/data/pet/all.new.jsonl").do_import()[:3]
+    preds = [d.copy([]) for d in documents]
+    for d in preds:
+        d.mentions = d.mentions[::2] + [
+            data.PetMention(type="Actor", token_document_indices=(0,))
+        ]
+
+    table = eval.mentions_f1_table(
+        predicted_documents=preds,
+        ground_truth_documents=documents,
+        print_only_tags=None,
+    )
+    assert table.documents == [d.id for d in documents]
+    assert table.counts.shape[0] == 3
+    for pred, d in zip(preds, documents):
+        # tags of other documents have counts of zero in this one
+        document_stats = table.select([d.id]).stats_by_tag()
+        assert {
+            tag: s for tag, s in document_stats.items() if s.num_pred + s.num_gold > 0
+        } == eval.mentions_f1_stats(
+            predicted_documents=[pred],
+            ground_truth_documents=[d],
+            print_only_tags=None,
+        )
+    stats = eval.mentions_f1_stats(
+        predicted_documents=preds,
+        ground_truth_documents=documents,
+        print_only_tags=None,
+    )
+    assert table.stats_by_tag() == stats
+    assert all(type(s.num_ok) == int for s in stats.values())
+
+
+def test_significance():
+    def table(num_ok: int) -> eval.StatsTable:
+        return eval.StatsTable.from_stats(
+            {
+                f"doc-{i}": {
+                    "actor": metrics.Stats(num_pred=10, num_gold=10, num_ok=num_ok),
+                    "activity": metrics.Stats(num_pred=5, num_gold=10, num_ok=5),
+                }
+                for i in range(20)
+            }
+        )
+
+    good = table(num_ok=9)
+    bad = table(num_ok=3)
+
+    interval = significance.bootstrap_confidence_interval(good, seed=0)
+    assert interval.low <= interval.score <= interval.high
+    assert interval.score == eval.average_scores(good, "micro").f1
+
+    for test in [significance.paired_bootstrap_test, significance.permutation_test]:
+        same = test(good, good, num_resamples=1000, seed=0)
+        assert same.difference == 0.0
+        assert same.p_value == 1.0
+
+        different = test(good, bad, strategy="macro", num_resamples=1000, seed=0)
+        assert different.difference > 0
+        assert different.p_value < 0.01
@@ -0,0 +1,82 @@
+import pytest
+
+import data
+import experiments
+from experiments import parse
+
+
+def test_parallel_parse_equals_serial(capsys):
+    importer = data.PetImporter("res/data/pet/all.new.jsonl")
+    experiment_results = parse.parse_file(
+        "res/answers/gpt-4-0125-preview/pet-md/2024-05-28_14-28-37.json"
+    )[:6]
+    # one fold with several documents, so that it is split into chunks
+    merged = experiments.ExperimentResult(
+        meta=experiment_results[0].meta,
+        results=[r for e in experiment_results[:4] for r in e.results],
+    )
+
+    for experiment_results in [experiment_results, [merged]]:
+        serial = parse.parse_experiments(
+            experiment_results, importer, print_only_tags=None, verbose=True
+        )
+        serial_output = capsys.readouterr().out
+        parallel = parse.parse_experiments(
+            experiment_results, importer, print_only_tags=None, verbose=True, workers=3
+        )
+        parallel_output = capsys.readouterr().out
+
+        assert parallel == serial
+        assert parallel_output == serial_output
+        assert len(serial_output) > 0
+
+
+def test_folds_share_imported_documents():
+    importer = parse._snapshot(data.PetImporter("res/data/pet/all.new.jsonl"))
+    experiment_results = parse.parse_file(
+        "res/answers/gpt-4-0125-preview/pet-md/2024-05-28_14-28-37.json"
+    )[:2]
+    truths = [parse._predict_documents(e, importer)[3] for e in experiment_results]
+    documents_by_id = {d.id: d for d in importer.do_import()}
+    for documents in truths:
+        for document in documents:
+            assert document is documents_by_id[document.id]
+
+
+def test_chunked_parse_prints_as_serial(capsys):
+    importer = data.PetImporter("res/data/pet/all.new.jsonl")
+    experiment_results = parse.parse_file(
+        "res/answers/gpt-4-0125-preview/analysis/re/baseline.json"
+    )[:8]
+    # a single fold, with answers that can not all be parsed
+    merged = [
+        experiments.ExperimentResult(
+            meta=experiment_results[0].meta,
+            results=[r for e in experiment_results for r in e.results],
+        )
+    ]
+
+    for verbose in [True, False]:
+        serial = parse.parse_experiments(
+            merged, importer, print_only_tags=None, verbose=verbose
+        )
+        serial_output = capsys.readouterr().out
+        chunked = parse.parse_experiments(
+            merged, importer, print_only_tags=None, verbose=verbose, workers=4
+        )
+        chunked_output = capsys.readouterr().out
+
+        assert chunked == serial
+        assert chunked_output == serial_output
+        assert "Skipping non-tab-separated line" in serial_output
+
+
+def test_parse_empty_experiment_fails():
+    importer = data.PetImporter("res/data/pet/all.new.jsonl")
+    meta = parse.parse_file(
+        "res/answers/gpt-4-0125-preview/pet-md/2024-05-28_14-28-37.json"
+    )[0].meta
+    empty = [experiments.ExperimentResult(meta=meta, results=[])]
+    for workers in [1, 2]:
+        with pytest.raises(AssertionError):
+            parse.parse_experiments(empty, importer, None, False, workers=workers)
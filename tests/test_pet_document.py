@@ -0,0 +1,78 @@
+import data
+
+
+def _sentences(document: data.PetDocument):
+    ret = []
+    last_id = None
+    for token in document.tokens:
+        if token.sentence_index != last_id:
+            last_id = token.sentence_index
+            ret.append([])
+        ret[-1].append(token)
+    return ret
+
+
+def test_token_index():
+    documents = data.PetImporter("res/data/pet/all.new.jsonl").do_import()
+    for document in documents:
+        assert document.sentences == _sentences(document)
+        for i, sentence in enumerate(document.sentences):
+            assert document.sentence(i) == sentence
+
+        text = " ".join(t.text for t in document.tokens)
+        for token in document.tokens:
+            start, end = token.char_indices(document)
+            assert text[start:end] == token.text
+
+    document = documents[0].copy([])
+    num_sentences = len(document.sentences)
+    document.tokens = document.tokens + [
+        data.PetToken(
+            text="appended",
+            index_in_document=len(document.tokens),
+            pos_tag="VBN",
+            sentence_index=document.tokens[-1].sentence_index + 1,
+        )
+    ]
+    assert len(document.sentences) == num_sentences + 1
+    assert len(documents[0].sentences) == num_sentences
+    document.tokens = document.sentence(0)
+    assert document.sentences == [document.tokens]
+
+    # the index is not part of a document's identity
+    assert documents[1]._token_index is not None
+    assert documents[1] == documents[1].copy([])
+
+
+def test_copies_share_tokens():
+    document = data.PetImporter("res/data/pet/all.new.jsonl").do_import()[0]
+    copied = document.copy(clear=["relations"])
+    assert copied.tokens is document.tokens
+    assert copied.token_index is document.token_index
+    assert copied.mentions == document.mentions
+    assert copied.mentions is not document.mentions
+    assert copied.relations == [] and len(document.relations) > 0
+
+    copied.mentions.append(data.PetMention("actor", (0,)))
+    assert len(copied.mentions) == len(document.mentions) + 1
+
+
+def test_columnar_tokens():
+    path = "res/data/pet/all.new.jsonl"
+    documents = data.PetImporter(path).do_import()
+    columnar = data.PetImporter(path, columnar=True).do_import()
+    assert columnar == documents
+    for document, columnar_document in zip(documents, columnar):
+        tokens = columnar_document.tokens
+        assert isinstance(tokens, data.PetTokenColumns)
+        assert list(tokens) == document.tokens
+        assert tokens[-1] == document.tokens[-1]
+        assert tokens[3:7] == document.tokens[3:7]
+        assert columnar_document.sentences == document.sentences
+        assert data.token_texts(tokens) == data.token_texts(document.tokens)
+        for mention in document.mentions:
+            assert mention.text(columnar_document) == mention.text(document)
+        exporter = data.PetDictExporter()
+        assert exporter.export_document(columnar_document) == exporter.export_document(
+            document
+        )
@@ -0,0 +1,73 @@
+import os
+
+import data
+from data import snapshot
+
+
+class CountingPetImporter(data.PetImporter):
+    num_imports = 0
+
+    def do_import(self):
+        CountingPetImporter.num_imports += 1
+        return super().do_import()
+
+
+def test_snapshot_importer(tmp_path):
+    with open("res/data/pet/all.new.jsonl", "r", encoding="utf8") as f:
+        lines = f.readlines()
+    source = tmp_path / "pet.jsonl"
+    source.write_text("".join(lines[:3]), encoding="utf8")
+    cache_directory = str(tmp_path / "snapshots")
+    snapshot.clear()
+    CountingPetImporter.num_imports = 0
+
+    importer = data.SnapshotImporter(
+        CountingPetImporter(str(source)), directory=cache_directory
+    )
+    first = importer.do_import()
+    second = importer.do_import()
+    assert first == data.PetImporter(str(source)).do_import()
+    assert second == first
+    assert second[0] is not first[0]
+    assert CountingPetImporter.num_imports == 1
+
+    # snapshot on disk survives the process
+    snapshot.clear()
+    assert importer.do_import() == first
+    assert CountingPetImporter.num_imports == 1
+
+    shared = data.SnapshotImporter(CountingPetImporter(str(source)), shared=True)
+    assert shared.do_import() is shared.do_import()
+
+    # changed sources invalidate the snapshot
+    source.write_text("".join(lines[:2]), encoding="utf8")
+    os.utime(source, ns=(0, 0))
+    assert len(importer.do_import()) == 2
+    assert CountingPetImporter.num_imports == 2
+    snapshot.clear()
+
+
+def test_snapshot_importer_copies_selected_documents(tmp_path, monkeypatch):
+    with open("res/data/pet/all.new.jsonl", "r", encoding="utf8") as f:
+        lines = f.readlines()
+    snapshot.clear()
+    monkeypatch.setattr(snapshot, "MAX_SNAPSHOTS", 2)
+
+    importers = []
+    for i in range(3):
+        source = tmp_path / f"pet-{i}.jsonl"
+        source.write_text("".join(lines[: i + 2]), encoding="utf8")
+        importers.append(data.SnapshotImporter(data.PetImporter(str(source))))
+
+    documents = importers[0].do_import()
+    selected = list(importers[0].iter_documents([documents[1].id]))
+    assert selected == [documents[1]]
+    assert selected[0] is not documents[1]
+
+    # only the most recently used snapshots are kept
+    for importer in importers[1:]:
+        importer.do_import()
+    assert len(snapshot._snapshots) == 2
+    assert importers[0].do_import() == documents
+    assert len(snapshot._snapshots) == 2
+    snapshot.clear()
@@ -0,0 +1,36 @@
+import typing
+
+import data
+from data import vanderaa
+
+
+class CountingTagger:
+    def __init__(self):
+        self.num_calls = 0
+
+    def tag(self, tokens: typing.List[str]) -> typing.List[typing.Tuple[str, str]]:
+        self.num_calls += 1
+        return [(t, "VB" if t.endswith("s") else "NN") for t in tokens]
+
+
+def test_match_tags_every_text_once(monkeypatch):
+    tagger = CountingTagger()
+    monkeypatch.setattr(vanderaa.nltk, "word_tokenize", str.split)
+    monkeypatch.setattr(vanderaa, "_pos_tagger", lambda: tagger)
+    vanderaa._texts_match.cache_clear()
+    vanderaa._first_verb.cache_clear()
+
+    true = data.VanDerAaMention(text="Check the order")
+    assert true.match(data.VanDerAaMention(text="the clerk checks the order"))
+    assert not true.match(data.VanDerAaMention(text="clerk sends invoice"))
+    assert not true.match(data.VanDerAaMention(text="Clerk sends invoice"))
+    assert not true.match(data.VanDerAaMention(text="clerk verifies order"))
+    assert data.VanDerAaMention(text="sends").match(
+        data.VanDerAaMention(text="clerk sends invoice")
+    )
+    # the true verb is contained in the first prediction, the second and
+    # third prediction have the same text, so are only tagged once
+    assert tagger.num_calls == 2
+
+    vanderaa._texts_match.cache_clear()
+    vanderaa._first_verb.cache_clear()